@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+准入控制与背压
+
+限制同时进行的生成请求数和排队长度，并根据近期吞吐量估算排队时间，
+超过阈值时立即拒绝并给出建议的重试等待时间，避免过载时所有请求一起超时。
+"""
+
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+
+class AdmissionRejected(Exception):
+    """请求因过载被拒绝"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为返回给客户端的结构化响应"""
+        return {
+            "error": f"服务器繁忙，请在 {self.retry_after} 秒后重试",
+            "busy": True,
+            "reason": self.reason,
+            "retry_after": self.retry_after
+        }
+
+
+class AdmissionController:
+    """基于并发数、队列长度和预计排队时间的准入控制器"""
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 32,
+                 max_queue_wait: float = 30.0, initial_service_time: float = 45.0,
+                 smoothing: float = 0.2):
+        """
+        Args:
+            max_in_flight: 最大同时执行的请求数
+            max_queue: 最大排队请求数，超过后直接拒绝
+            max_queue_wait: 最长排队时间(秒)，预计或实际排队超过该值时拒绝
+            initial_service_time: 尚无统计数据时假定的单次请求耗时(秒)
+            smoothing: 耗时指数滑动平均的平滑系数
+        """
+        if max_in_flight <= 0:
+            raise ValueError("max_in_flight 必须大于0")
+
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_wait = max_queue_wait
+        self.smoothing = smoothing
+
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._avg_service_time = initial_service_time
+        self._admitted = 0
+        self._rejected = 0
+
+    @property
+    def throughput(self) -> float:
+        """按当前平均耗时估算的吞吐量(请求/秒)"""
+        return self.max_in_flight / max(self._avg_service_time, 0.001)
+
+    def estimated_wait(self, position: int) -> float:
+        """估算排在第position位的请求需要等待的时间(秒)"""
+        return position / self.throughput
+
+    def retry_after(self) -> int:
+        """建议的重试等待时间(秒)，按当前队列完全排空所需时间估算"""
+        return max(1, math.ceil(self.estimated_wait(self._waiting + 1)))
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        self._rejected += 1
+        return AdmissionRejected(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """
+        获取执行许可，过载时抛出 AdmissionRejected
+
+        用法:
+            async with controller.admit():
+                ...
+        """
+        if self._waiting == 0 and not self._semaphore.locked():
+            # 有空闲名额时直接获取，不会挂起
+            await self._semaphore.acquire()
+        else:
+            if self._waiting >= self.max_queue:
+                raise self._reject("queue_full")
+            if self.estimated_wait(self._waiting + 1) > self.max_queue_wait:
+                raise self._reject("queue_wait_exceeded")
+
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_queue_wait)
+            except asyncio.TimeoutError:
+                raise self._reject("queue_timeout")
+            finally:
+                self._waiting -= 1
+
+        self._in_flight += 1
+        self._admitted += 1
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started_at
+            self._avg_service_time += self.smoothing * (elapsed - self._avg_service_time)
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """当前负载统计"""
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "avg_service_time": round(self._avg_service_time, 3),
+            "throughput_per_second": round(self.throughput, 3),
+            "admitted": self._admitted,
+            "rejected": self._rejected
+        }
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+全局在途字节预算
+
+下载、处理、上传各阶段持有的图片数据都计入同一个字节预算：一张图片在下载前
+按其大小预留额度，直到上传完成才释放，从而使进程内驻留的图片字节数可预测，
+避免大批量任务同时把所有图片读入内存。
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+
+from percentiles import percentile
+
+
+class ByteLease:
+    """一次持有的字节额度，离开 ByteBudget.hold() 时整体释放"""
+
+    def __init__(self, budget: "ByteBudget"):
+        self._budget = budget
+        self.held = 0
+
+    async def reserve(self, nbytes: int) -> None:
+        """
+        追加预留字节额度
+
+        首次预留在额度不足时排队等待；已持有额度后的追加预留直接计入（可能暂时
+        超出上限），避免多个持有者互相等待对方释放造成死锁
+        """
+        if nbytes <= 0:
+            return
+        if self.held == 0:
+            await self._budget._acquire(nbytes)
+        else:
+            self._budget._overcommit(nbytes)
+        self.held += nbytes
+
+
+class ByteBudget:
+    """先进先出的字节预算信号量"""
+
+    def __init__(self, limit: int, stats_window: int = 200):
+        """
+        Args:
+            limit: 同时在途的最大字节数，单个超过上限的请求在预算空闲时独占放行
+            stats_window: 保留的最近等待时间样本数
+        """
+        if limit <= 0:
+            raise ValueError("limit 必须大于0")
+
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self.granted = 0
+        self.waited = 0
+        self.overcommitted = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self._wait_times: Deque[float] = deque(maxlen=stats_window)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.in_use == 0 or self.in_use + nbytes <= self.limit
+
+    def _take(self, nbytes: int) -> None:
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+        self.granted += 1
+
+    def _overcommit(self, nbytes: int) -> None:
+        self.overcommitted += 1
+        self.in_use += nbytes
+        self.peak = max(self.peak, self.in_use)
+
+    async def _acquire(self, nbytes: int) -> None:
+        if not self._waiters and self._fits(nbytes):
+            self._take(nbytes)
+            self._wait_times.append(0.0)
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        self._waiters.append((nbytes, future))
+        self.waited += 1
+        started_at = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已获得额度但调用方被取消，归还额度
+                self._release(nbytes)
+            else:
+                try:
+                    self._waiters.remove((nbytes, future))
+                except ValueError:
+                    pass
+                self._wake()
+            raise
+        self._wait_times.append(time.monotonic() - started_at)
+
+    def _release(self, nbytes: int) -> None:
+        self.in_use -= nbytes
+        self._wake()
+
+    def _wake(self) -> None:
+        """按到达顺序放行额度足够的等待者，队首不满足时后续等待者也不放行"""
+        while self._waiters:
+            nbytes, future = self._waiters[0]
+            if future.done():
+                self._waiters.popleft()
+                continue
+            if not self._fits(nbytes):
+                break
+            self._waiters.popleft()
+            self._take(nbytes)
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[ByteLease]:
+        """持有一份额度，在其中通过 lease.reserve() 按实际大小预留"""
+        lease = ByteLease(self)
+        try:
+            yield lease
+        finally:
+            if lease.held:
+                self._release(lease.held)
+
+    def stats(self) -> Dict[str, Any]:
+        """预算使用情况和等待时间统计"""
+        wait_times = list(self._wait_times)
+        return {
+            "limit_bytes": self.limit,
+            "in_use_bytes": self.in_use,
+            "peak_bytes": self.peak,
+            "waiting": len(self._waiters),
+            "granted": self.granted,
+            "waited": self.waited,
+            "overcommitted": self.overcommitted,
+            "wait_p50": round(percentile(wait_times, 50), 3),
+            "wait_p95": round(percentile(wait_times, 95), 3),
+            "wait_max": round(max(wait_times), 3) if wait_times else 0.0
+        }
@@ -8,9 +8,12 @@
 import asyncio
 import os
 import sys
-from typing import Optional
+from typing import AsyncIterator, Optional
 from dotenv import load_dotenv
 
+from cos_gc import bulk_delete, iter_objects
+from cos_presign import PresignedURLCache
+
 # 加载环境变量
 load_dotenv()
 
@@ -46,6 +49,9 @@ class TencentCOSManager:
         )
         
         self.client = CosS3Client(self.config)
+        
+        # 预签名URL缓存，同一对象在签名过期前复用
+        self.presigned_urls = PresignedURLCache(self.client, self.bucket)
     
     def test_connection(self) -> bool:
         """测试连接"""
@@ -161,10 +167,26 @@ class TencentCOSManager:
             print(f"❌ 列出对象失败: {str(e)}")
             return []
     
+    async def iter_objects(self, prefix: str = "", page_size: int = 1000) -> AsyncIterator[dict]:
+        """流式列举前缀下的所有对象（自动翻页，处理当前页时预取下一页）"""
+        async for obj in iter_objects(self.client, self.bucket, prefix, page_size):
+            yield obj
+    
+    async def delete_objects(self, keys: list, concurrency: int = 4) -> dict:
+        """批量删除对象，每1000个Key一个请求，多个批次并发执行"""
+        result = await bulk_delete(self.client, self.bucket, keys, concurrency)
+        failed = {error['key'] for error in result['errors']}
+        for key in keys:
+            if key not in failed:
+                self.presigned_urls.invalidate(key)
+        print(f"✅ 批量删除完成: 成功 {result['deleted']} 个，失败 {len(failed)} 个")
+        return result
+    
     def delete_object(self, key: str) -> bool:
         """删除对象"""
         try:
             response = self.client.delete_object(Bucket=self.bucket, Key=key)
+            self.presigned_urls.invalidate(key)
             print(f"✅ 对象删除成功: {key}")
             return True
         except Exception as e:
@@ -172,8 +194,10 @@ class TencentCOSManager:
             return False
     
     def get_object_url(self, key: str, expires: int = 3600) -> str:
-        """获取对象预签名URL"""
+        """获取对象预签名URL，默认有效期的签名会被缓存复用"""
         try:
+            if expires == self.presigned_urls.expires:
+                return self.presigned_urls.get_url(key)
             url = self.client.get_presigned_url(
                 Method='GET',
                 Bucket=self.bucket,
@@ -185,6 +209,14 @@ class TencentCOSManager:
             print(f"❌ 获取预签名URL失败: {str(e)}")
             return ""
     
+    def get_object_urls(self, keys: list) -> dict:
+        """批量获取对象预签名URL，返回 {key: url}"""
+        try:
+            return self.presigned_urls.get_urls(keys)
+        except Exception as e:
+            print(f"❌ 批量获取预签名URL失败: {str(e)}")
+            return {}
+    
     def _get_content_type(self, file_path: str) -> str:
         """根据文件扩展名获取Content-Type"""
         import mimetypes
@@ -218,6 +250,14 @@ async def main():
         for obj in objects:
             print(f"  - {obj['key']} ({obj['size']} bytes)")
         
+        # 统计前缀下的全部对象
+        total_count = 0
+        total_size = 0
+        async for obj in cos_manager.iter_objects(prefix="jimeng/"):
+            total_count += 1
+            total_size += obj['size']
+        print(f"  共 {total_count} 个对象，{total_size} bytes")
+        
         # 演示从URL上传
         print("\n📤 演示从URL上传:")
         test_url = "https://via.placeholder.com/300x200/0066cc/ffffff?text=Demo"
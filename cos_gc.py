@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+COS对象批量列举与清理
+
+提供按页流式列举存储桶对象的异步生成器（预取下一页）、每次最多1000个Key的
+批量删除（多个批次并发执行），以及按TTL或引用关系清理生成图片的垃圾回收。
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set
+
+# COS DeleteObjects 单次请求最多1000个Key
+MAX_DELETE_BATCH = 1000
+
+
+def parse_last_modified(value: str) -> float:
+    """将COS返回的LastModified(ISO 8601)转换为时间戳"""
+    text = value.replace("Z", "+00:00")
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        # 兼容毫秒位数不是3或6位的情况
+        return datetime.strptime(value[:19], "%Y-%m-%dT%H:%M:%S").replace(
+            tzinfo=timezone.utc
+        ).timestamp()
+
+
+async def iter_objects(client, bucket: str, prefix: str = "", page_size: int = 1000,
+                       executor: Optional[Executor] = None) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式列举前缀下的所有对象
+
+    同步的 list_objects 在线程池中执行，处理当前页时已开始请求下一页。
+    每个对象返回 key、size、last_modified(时间戳)、etag。
+    """
+    loop = asyncio.get_event_loop()
+
+    def fetch(marker: str) -> Dict[str, Any]:
+        return client.list_objects(Bucket=bucket, Prefix=prefix, Marker=marker, MaxKeys=page_size)
+
+    pending = loop.run_in_executor(executor, fetch, "")
+    while pending is not None:
+        response = await pending
+        contents = response.get("Contents", [])
+
+        pending = None
+        if response.get("IsTruncated") == "true" and contents:
+            marker = response.get("NextMarker") or contents[-1]["Key"]
+            pending = loop.run_in_executor(executor, fetch, marker)
+
+        for obj in contents:
+            yield {
+                "key": obj["Key"],
+                "size": int(obj.get("Size", 0)),
+                "last_modified": parse_last_modified(obj["LastModified"]),
+                "etag": obj.get("ETag", "")
+            }
+
+
+def delete_objects_batch(client, bucket: str, keys: List[str]) -> Dict[str, Any]:
+    """同步删除一批对象（最多1000个），返回删除成功数和失败的Key"""
+    if len(keys) > MAX_DELETE_BATCH:
+        raise ValueError(f"单次最多删除 {MAX_DELETE_BATCH} 个对象")
+
+    response = client.delete_objects(
+        Bucket=bucket,
+        Delete={
+            "Object": [{"Key": key} for key in keys],
+            "Quiet": "true"
+        }
+    )
+    errors = response.get("Error", []) if response else []
+    if isinstance(errors, dict):
+        errors = [errors]
+    return {
+        "deleted": len(keys) - len(errors),
+        "errors": [{"key": e.get("Key"), "message": e.get("Message")} for e in errors]
+    }
+
+
+async def bulk_delete(client, bucket: str, keys: Iterable[str], concurrency: int = 4,
+                      executor: Optional[Executor] = None) -> Dict[str, Any]:
+    """按1000个Key一批并发删除对象"""
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    keys = list(keys)
+
+    async def delete(batch: List[str]) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return await loop.run_in_executor(
+                    executor, delete_objects_batch, client, bucket, batch
+                )
+            except Exception as e:
+                return {
+                    "deleted": 0,
+                    "errors": [{"key": key, "message": str(e)} for key in batch]
+                }
+
+    results = await asyncio.gather(*[
+        delete(keys[i:i + MAX_DELETE_BATCH]) for i in range(0, len(keys), MAX_DELETE_BATCH)
+    ])
+    return {
+        "deleted": sum(r["deleted"] for r in results),
+        "errors": [error for r in results for error in r["errors"]]
+    }
+
+
+async def collect_garbage(client, bucket: str, prefix: str = "jimeng/",
+                          ttl_seconds: Optional[float] = None,
+                          referenced_keys: Optional[Set[str]] = None,
+                          grace_seconds: float = 3600.0, dry_run: bool = True,
+                          concurrency: int = 4, executor: Optional[Executor] = None,
+                          on_deleted: Optional[Callable[[List[str]], None]] = None,
+                          max_candidates: int = 1000) -> Dict[str, Any]:
+    """
+    清理前缀下的过期或未被引用的对象
+
+    Args:
+        ttl_seconds: 早于该时间(秒)的对象视为过期，None表示不按时间清理
+        referenced_keys: 仍被引用的Key集合，不为None时清理不在集合中的对象
+        grace_seconds: 未被引用的对象在上传后该时间(秒)内保留，避免误删刚上传尚未登记的对象
+        dry_run: 只统计不删除
+        on_deleted: 删除完成后以成功删除的Key列表回调，用于同步清理索引；回调可能读写文件，在线程池中执行
+        max_candidates: dry_run 时返回的待清理对象列表的长度上限
+
+    Returns:
+        扫描数、待清理数、释放字节数，dry_run 时为待清理对象列表，否则为删除结果
+    """
+    now = time.time()
+    scanned = 0
+    candidates: List[str] = []
+    reclaimed_bytes = 0
+    flush_size = MAX_DELETE_BATCH * concurrency
+    deleted = 0
+    errors: List[Dict[str, Any]] = []
+
+    async def flush() -> None:
+        nonlocal deleted
+        batch = candidates[:]
+        candidates.clear()
+        result = await bulk_delete(client, bucket, batch, concurrency, executor)
+        deleted += result["deleted"]
+        errors.extend(result["errors"])
+        if on_deleted:
+            failed = {error["key"] for error in result["errors"]}
+            await asyncio.get_running_loop().run_in_executor(
+                None, on_deleted, [key for key in batch if key not in failed]
+            )
+
+    pending_count = 0
+    async for obj in iter_objects(client, bucket, prefix, executor=executor):
+        scanned += 1
+        age = now - obj["last_modified"]
+        expired = ttl_seconds is not None and age > ttl_seconds
+        unreferenced = (
+            referenced_keys is not None
+            and obj["key"] not in referenced_keys
+            and age > grace_seconds
+        )
+        if not (expired or unreferenced):
+            continue
+
+        pending_count += 1
+        reclaimed_bytes += obj["size"]
+        if dry_run:
+            if len(candidates) < max_candidates:
+                candidates.append(obj["key"])
+            continue
+
+        candidates.append(obj["key"])
+        if len(candidates) >= flush_size:
+            await flush()
+
+    if not dry_run and candidates:
+        await flush()
+
+    result = {
+        "scanned": scanned,
+        "matched": pending_count,
+        "reclaimed_bytes": reclaimed_bytes,
+        "dry_run": dry_run
+    }
+    if dry_run:
+        result["candidates"] = candidates
+        result["candidates_truncated"] = pending_count > len(candidates)
+    else:
+        result["deleted"] = deleted
+        result["errors"] = errors[:100]
+    return result
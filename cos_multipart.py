@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+腾讯云COS分块上传
+
+超过阈值的对象改用分块上传：各分块在线程池中并发上传，分块内容在工作线程中
+才从原始数据切出，内存占用受并发数 x 分块大小约束；单个分块失败只重试该分块，
+最终失败时中止整个分块上传，避免残留碎片。
+"""
+
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_MULTIPART_THRESHOLD = 4 * 1024 * 1024
+DEFAULT_PART_SIZE = 1024 * 1024
+DEFAULT_PART_WORKERS = 4
+DEFAULT_PART_RETRIES = 3
+
+# COS限制：除最后一块外分块不小于1MB，最多10000块
+MIN_PART_SIZE = 1024 * 1024
+MAX_PARTS = 10000
+
+
+def plan_parts(size: int, part_size: int) -> List[Tuple[int, int, int]]:
+    """返回 (分块编号, 起始偏移, 结束偏移) 列表，自动放大分块以满足COS限制"""
+    part_size = max(part_size, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+    return [
+        (index + 1, offset, min(offset + part_size, size))
+        for index, offset in enumerate(range(0, size, part_size))
+    ]
+
+
+def _upload_part(client, bucket: str, key: str, upload_id: str, data: memoryview,
+                 part_number: int, start: int, end: int, retries: int) -> Dict[str, Any]:
+    """上传单个分块，失败时按指数退避重试"""
+    for attempt in range(retries + 1):
+        try:
+            response = client.upload_part(
+                Bucket=bucket,
+                Key=key,
+                Body=bytes(data[start:end]),
+                PartNumber=part_number,
+                UploadId=upload_id
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        except Exception as e:
+            if attempt >= retries:
+                raise
+            print(f"分块 {part_number} 上传失败，第{attempt + 1}次重试: {str(e)}")
+            time.sleep(0.5 * 2 ** attempt)
+
+
+def multipart_put_object(client, bucket: str, key: str, data: bytes, content_type: str,
+                         part_size: int = DEFAULT_PART_SIZE,
+                         max_workers: int = DEFAULT_PART_WORKERS,
+                         part_retries: int = DEFAULT_PART_RETRIES) -> Dict[str, Any]:
+    """
+    分块并发上传对象（同步，应在线程池中调用）
+
+    Returns:
+        complete_multipart_upload 的响应，包含 ETag
+    """
+    response = client.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=content_type,
+        StorageClass='STANDARD'
+    )
+    upload_id = response["UploadId"]
+    view = memoryview(data)
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = [
+            executor.submit(_upload_part, client, bucket, key, upload_id, view,
+                            part_number, start, end, part_retries)
+            for part_number, start, end in plan_parts(len(data), part_size)
+        ]
+        try:
+            parts = [future.result() for future in futures]
+        finally:
+            # 某个分块最终失败时取消尚未开始的分块
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+        return client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=upload_id,
+            MultipartUpload={"Part": parts}
+        )
+    except Exception:
+        try:
+            client.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+        except Exception as e:
+            print(f"中止分块上传失败 {key}: {str(e)}")
+        raise
+
+
+def put_object_auto(client, bucket: str, key: str, data: bytes, content_type: str,
+                    threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                    part_size: int = DEFAULT_PART_SIZE,
+                    max_workers: int = DEFAULT_PART_WORKERS,
+                    part_retries: int = DEFAULT_PART_RETRIES) -> Dict[str, Any]:
+    """小于阈值时使用简单上传，否则使用分块并发上传（同步）"""
+    if len(data) < threshold:
+        return client.put_object(
+            Bucket=bucket,
+            Body=data,
+            Key=key,
+            ContentType=content_type,
+            StorageClass='STANDARD'
+        )
+    return multipart_put_object(
+        client, bucket, key, data, content_type,
+        part_size=part_size, max_workers=max_workers, part_retries=part_retries
+    )
@@ -2,33 +2,70 @@
 """
 腾讯云COS 性能优化版本
 
-使用连接池、并发上传和缓存等优化技术提升性能
+使用连接池、并发上传和缓存等优化技术提升性能。OptimizedTencentCOS 作为异步上下文
+管理器使用，服务器在生命周期内共享同一个实例完成所有COS下载/上传。
 """
 
 import asyncio
 import os
 import sys
 import time
+import uuid
 from typing import List, Optional, Dict, Any
 from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from dotenv import load_dotenv
 
+import httpx
+
+from byte_budget import ByteBudget
+from cos_multipart import (
+    DEFAULT_MULTIPART_THRESHOLD,
+    DEFAULT_PART_SIZE,
+    DEFAULT_PART_WORKERS,
+    put_object_auto,
+)
+from downloader import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_PARALLEL, download_bytes
+
 # 加载环境变量
 load_dotenv()
 
 try:
     from qcloud_cos import CosConfig, CosS3Client
     from qcloud_cos.cos_exception import CosServiceError, CosClientError
-    import httpx
+    TENCENT_COS_AVAILABLE = True
 except ImportError:
-    print("请先安装依赖: pip install cos-python-sdk-v5 httpx")
-    sys.exit(1)
+    TENCENT_COS_AVAILABLE = False
 
 class OptimizedTencentCOS:
     """性能优化的腾讯云COS客户端"""
     
-    def __init__(self, max_workers: int = 4):
+    def __init__(self, max_workers: int = 4,
+                 multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+                 part_size: int = DEFAULT_PART_SIZE,
+                 max_inflight_bytes: int = 256 * 1024 * 1024,
+                 part_workers: int = DEFAULT_PART_WORKERS,
+                 download_chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 download_max_parallel: int = DEFAULT_MAX_PARALLEL,
+                 download_timeout: float = 30.0,
+                 byte_budget: Optional[ByteBudget] = None,
+                 keepalive_expiry: float = 5.0):
+        """
+        Args:
+            max_workers: 执行同步COS调用的线程数
+            multipart_threshold: 超过该大小(字节)的对象使用分块上传
+            part_size: 分块大小(字节)
+            max_inflight_bytes: 同时驻留内存的图片字节上限（未传入 byte_budget 时使用）
+            part_workers: 单个对象并发上传的分块数
+            download_chunk_size: 分片下载的分片大小(字节)
+            download_max_parallel: 分片下载的最大并发数
+            download_timeout: 单个下载请求超时时间(秒)
+            byte_budget: 与其他组件共享的字节预算
+            keepalive_expiry: 下载连接池中空闲连接的保留时间(秒)
+        """
+        if not TENCENT_COS_AVAILABLE:
+            raise RuntimeError("腾讯云COS SDK未安装")
+        
         self.secret_id = os.getenv("TENCENT_CLOUD_SECRET_ID")
         self.secret_key = os.getenv("TENCENT_CLOUD_SECRET_KEY")
         self.region = os.getenv("TENCENT_COS_REGION", "ap-guangzhou")
@@ -39,14 +76,30 @@ class OptimizedTencentCOS:
             raise ValueError("腾讯云COS配置不完整")
         
         # 使用连接池的HTTP客户端
+        self.download_chunk_size = download_chunk_size
+        self.download_max_parallel = download_max_parallel
+        self.download_timeout = download_timeout
         self.http_client = httpx.AsyncClient(
-            timeout=30.0,
-            limits=httpx.Limits(max_keepalive_connections=20, max_connections=100)
+            timeout=download_timeout,
+            limits=httpx.Limits(
+                max_keepalive_connections=20,
+                max_connections=100,
+                keepalive_expiry=keepalive_expiry
+            )
         )
         
         # 线程池用于同步操作
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
         
+        # 超过阈值的图片使用分块并发上传
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.part_workers = part_workers
+        
+        # 同时驻留内存的图片字节上限
+        self.byte_budget = byte_budget or ByteBudget(max_inflight_bytes)
+        self.closed = False
+        
         # 初始化COS客户端
         self._init_cos_client()
     
@@ -76,42 +129,55 @@ class OptimizedTencentCOS:
         }
         return content_type_map.get(file_extension.lower(), 'image/jpeg')
     
-    async def download_image_batch(self, urls: List[str]) -> List[Optional[bytes]]:
-        """批量异步下载图片"""
-        async def download_single(url: str) -> Optional[bytes]:
-            try:
-                response = await self.http_client.get(url)
-                response.raise_for_status()
-                return response.content
-            except Exception as e:
-                print(f"下载失败 {url}: {str(e)}")
-                return None
-        
-        # 并发下载
-        tasks = [download_single(url) for url in urls]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # 处理异常
-        processed_results = []
-        for result in results:
-            if isinstance(result, Exception):
-                print(f"下载异常: {str(result)}")
-                processed_results.append(None)
-            else:
-                processed_results.append(result)
+    async def download(self, url: str, reserve=None) -> bytes:
+        """
+        下载图片，大图在服务器支持Range时并发分片下载
         
-        return processed_results
+        reserve 用于在读取内容前按大小预留字节额度，下载失败时抛出 httpx.HTTPError
+        """
+        return await download_bytes(
+            self.http_client,
+            url,
+            chunk_size=self.download_chunk_size,
+            max_parallel=self.download_max_parallel,
+            timeout=self.download_timeout,
+            reserve=reserve
+        )
+    
+    def put_object(self, image_data: bytes, key: str, content_type: str) -> Dict[str, Any]:
+        """同步上传对象，大文件自动分块并发上传，失败时抛出COS异常"""
+        return put_object_auto(
+            self.cos_client,
+            self.bucket,
+            key,
+            image_data,
+            content_type,
+            threshold=self.multipart_threshold,
+            part_size=self.part_size,
+            max_workers=self.part_workers
+        )
+    
+    async def put_object_async(self, image_data: bytes, key: str, content_type: str) -> Dict[str, Any]:
+        """在线程池中上传对象，失败时抛出COS异常"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor,
+            self.put_object,
+            image_data, key, content_type
+        )
+    
+    async def head_bucket(self) -> None:
+        """在线程池中访问存储桶，用于校验凭证和预热COS连接，失败时抛出COS异常"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.executor,
+            lambda: self.cos_client.head_bucket(Bucket=self.bucket)
+        )
     
     def upload_to_cos_sync(self, image_data: bytes, key: str, content_type: str) -> Optional[str]:
         """同步上传到COS（在线程池中执行）"""
         try:
-            response = self.cos_client.put_object(
-                Bucket=self.bucket,
-                Body=image_data,
-                Key=key,
-                ContentType=content_type,
-                StorageClass='STANDARD'
-            )
+            response = self.put_object(image_data, key, content_type)
             
             if response and response.get('ETag'):
                 return self._build_url(key)
@@ -135,45 +201,37 @@ class OptimizedTencentCOS:
         if len(image_urls) != len(prompts):
             raise ValueError("图片URL和提示词数量不匹配")
         
-        # 批量下载
-        print(f"开始下载 {len(image_urls)} 张图片...")
-        image_data_list = await self.download_image_batch(image_urls)
-        
-        # 准备上传任务
-        upload_tasks = []
-        for i, (image_data, prompt) in enumerate(zip(image_data_list, prompts)):
-            if image_data is None:
-                upload_tasks.append(None)
-                continue
-            
-            # 生成文件名
-            import uuid
-            safe_prompt = self._sanitize_filename(prompt)
-            unique_id = uuid.uuid4().hex[:8]
-            key = f"jimeng/batch/{safe_prompt}_{unique_id}.png"
-            
-            # 创建上传任务
-            task = self.upload_to_cos_async(image_data, key, 'image/png')
-            upload_tasks.append(task)
+        # 每张图片独立完成下载和上传，图片在下载前按大小预留字节额度，上传完成后释放，
+        # 避免整批图片同时驻留内存
+        async def transfer(url: str, prompt: str) -> Optional[str]:
+            async with self.byte_budget.hold() as lease:
+                try:
+                    image_data = await self.download(url, reserve=lease.reserve)
+                except Exception as e:
+                    print(f"下载失败 {url}: {str(e)}")
+                    return None
+                
+                # 生成文件名
+                safe_prompt = self._sanitize_filename(prompt)
+                unique_id = uuid.uuid4().hex[:8]
+                key = f"jimeng/batch/{safe_prompt}_{unique_id}.png"
+                
+                return await self.upload_to_cos_async(image_data, key, 'image/png')
         
-        # 并发上传
-        print(f"开始上传 {len(upload_tasks)} 张图片...")
-        results = await asyncio.gather(*[task for task in upload_tasks if task is not None], 
-                                     return_exceptions=True)
+        print(f"开始传输 {len(image_urls)} 张图片...")
+        results = await asyncio.gather(
+            *[transfer(url, prompt) for url, prompt in zip(image_urls, prompts)],
+            return_exceptions=True
+        )
         
         # 处理结果
         final_results = []
-        task_index = 0
-        for task in upload_tasks:
-            if task is None:
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"传输异常: {str(result)}")
                 final_results.append(None)
             else:
-                if isinstance(results[task_index], Exception):
-                    print(f"上传异常: {str(results[task_index])}")
-                    final_results.append(None)
-                else:
-                    final_results.append(results[task_index])
-                task_index += 1
+                final_results.append(result)
         
         return final_results
     
@@ -196,21 +254,30 @@ class OptimizedTencentCOS:
             return f"https://{self.bucket}.cos.{self.region}.myqcloud.com/{key}"
     
     async def close(self):
-        """关闭资源"""
+        """关闭资源：等待进行中的上传完成后关闭线程池和连接池，可重复调用"""
+        if self.closed:
+            return
+        self.closed = True
         await self.http_client.aclose()
-        self.executor.shutdown(wait=True)
+        # 在默认线程池中等待，避免阻塞事件循环
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.executor.shutdown, True)
     
-    def __enter__(self):
+    async def __aenter__(self) -> "OptimizedTencentCOS":
         return self
     
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        asyncio.create_task(self.close())
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
 
 async def performance_test():
     """性能测试"""
     print("腾讯云COS 性能优化测试")
     print("=" * 50)
     
+    if not TENCENT_COS_AVAILABLE:
+        print("请先安装依赖: pip install cos-python-sdk-v5 httpx")
+        sys.exit(1)
+    
     # 测试数据
     test_urls = [
         "https://via.placeholder.com/300x200/ff0000/ffffff?text=1",
@@ -231,7 +298,7 @@ async def performance_test():
     async with OptimizedTencentCOS(max_workers=4) as cos_client:
         # 测试连接
         try:
-            response = cos_client.cos_client.head_bucket(Bucket=cos_client.bucket)
+            await cos_client.head_bucket()
             print("✅ 连接测试成功")
         except Exception as e:
             print(f"❌ 连接测试失败: {str(e)}")
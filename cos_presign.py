@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+预签名URL缓存
+
+私有存储桶的对象需要返回预签名URL。签名结果在到期前的一段时间内可以复用，
+缓存后同一对象的重复访问无需再次签名；多图/批量结果一次性批量签名。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Tuple
+from urllib.parse import unquote, urlparse
+
+
+def cos_key_from_url(url: str) -> str:
+    """从COS对象URL（公开或预签名）中解析出对象Key"""
+    return unquote(urlparse(url).path.lstrip("/"))
+
+
+class PresignedURLCache:
+    """按对象Key缓存预签名URL，在到期前 refresh_margin 秒重新签名"""
+
+    def __init__(self, client, bucket: str, expires: int = 3600,
+                 refresh_margin: int = 300, max_entries: int = 10000):
+        """
+        Args:
+            client: CosS3Client 实例
+            bucket: 存储桶名称
+            expires: 签名有效期(秒)
+            refresh_margin: 距离过期不足该时间(秒)时重新签名
+            max_entries: 最多缓存的对象数，超过后淘汰最久未使用的
+        """
+        if refresh_margin >= expires:
+            raise ValueError("refresh_margin 必须小于 expires")
+
+        self.client = client
+        self.bucket = bucket
+        self.expires = expires
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _sign(self, key: str, now: float) -> Tuple[str, float]:
+        url = self.client.get_presigned_url(
+            Method='GET',
+            Bucket=self.bucket,
+            Key=key,
+            Expired=self.expires
+        )
+        return url, now + self.expires
+
+    def get_url(self, key: str) -> str:
+        """获取单个对象的预签名URL"""
+        return self.get_urls([key])[key]
+
+    def get_urls(self, keys: Iterable[str]) -> Dict[str, str]:
+        """批量获取预签名URL，仅对缓存中缺失或即将过期的对象签名"""
+        now = time.time()
+        result: Dict[str, str] = {}
+
+        with self._lock:
+            for key in keys:
+                if key in result:
+                    continue
+                cached = self._cache.get(key)
+                if cached is not None and cached[1] - self.refresh_margin > now:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                else:
+                    cached = self._sign(key, now)
+                    self._cache[key] = cached
+                    self._cache.move_to_end(key)
+                    self.misses += 1
+                result[key] = cached[0]
+
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+        return result
+
+    def invalidate(self, key: str) -> None:
+        """移除对象的缓存签名（对象被删除时调用）"""
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """缓存命中统计"""
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
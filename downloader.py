@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+自适应分片下载
+
+首个请求即带 Range 头获取第一个分片：服务器不支持 Range 时直接得到完整内容；
+支持时根据 Content-Range 得知总大小，将剩余部分拆成多个分片并发下载，
+写入预先分配的缓冲区。任一分片失败时退回单连接完整下载。
+调用方可传入 reserve 回调，在读取响应体之前按对象大小预留内存额度。
+"""
+
+import asyncio
+import re
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_CHUNK_SIZE = 2 * 1024 * 1024
+DEFAULT_MAX_PARALLEL = 4
+
+ReserveFunc = Callable[[int], Awaitable[None]]
+
+_CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+
+
+def parse_content_range(value: str) -> Optional[Tuple[int, int, int]]:
+    """解析 Content-Range 头，返回 (起始, 结束, 总大小)，总大小未知时返回None"""
+    match = _CONTENT_RANGE_RE.match(value or "")
+    if not match or match.group(3) == "*":
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+
+def split_ranges(start: int, total: int, chunk_size: int) -> List[Tuple[int, int]]:
+    """将 [start, total) 拆分为闭区间分片列表"""
+    return [
+        (offset, min(offset + chunk_size, total) - 1)
+        for offset in range(start, total, chunk_size)
+    ]
+
+
+async def _fetch_range(client: httpx.AsyncClient, url: str, start: int, end: int,
+                       buffer: bytearray, timeout: float, retries: int) -> None:
+    """下载单个分片写入缓冲区，失败时重试"""
+    expected = end - start + 1
+    for attempt in range(retries + 1):
+        try:
+            response = await client.get(
+                url, headers={"Range": f"bytes={start}-{end}"}, timeout=timeout
+            )
+            response.raise_for_status()
+            if response.status_code != 206 or len(response.content) != expected:
+                raise ValueError(f"分片 {start}-{end} 响应不完整")
+            buffer[start:end + 1] = response.content
+            return
+        except Exception:
+            if attempt >= retries:
+                raise
+
+
+async def download_bytes(client: httpx.AsyncClient, url: str,
+                         chunk_size: int = DEFAULT_CHUNK_SIZE,
+                         max_parallel: int = DEFAULT_MAX_PARALLEL,
+                         timeout: float = 30.0, retries: int = 1,
+                         reserve: Optional[ReserveFunc] = None) -> bytes:
+    """
+    下载URL内容，服务器支持 Range 且文件大于一个分片时并发分片下载
+
+    Args:
+        client: 复用的连接池
+        url: 下载地址
+        chunk_size: 分片大小(字节)
+        max_parallel: 最大并发分片数
+        timeout: 单个请求超时时间(秒)
+        retries: 单个分片的重试次数
+        reserve: 预留内存额度的回调，参数为字节数，在得知大小后、读取内容前调用一次；
+            大小未知时在读取完成后按实际大小调用
+
+    Raises:
+        httpx.HTTPError: 下载失败
+    """
+    reserved = False
+
+    async def reserve_once(nbytes: int) -> None:
+        nonlocal reserved
+        if reserve is not None and not reserved:
+            reserved = True
+            await reserve(nbytes)
+
+    async with client.stream(
+        "GET", url, headers={"Range": f"bytes=0-{chunk_size - 1}"}, timeout=timeout
+    ) as response:
+        response.raise_for_status()
+
+        if response.status_code != 206:
+            # 服务器忽略了Range，响应即完整内容
+            return await _read_body(response, reserve_once)
+
+        content_range = parse_content_range(response.headers.get("content-range", ""))
+        if content_range is not None and content_range[0] == 0:
+            await reserve_once(content_range[2])
+        first_chunk = await response.aread()
+
+    if content_range is None or content_range[0] != 0:
+        return await _download_single(client, url, timeout, reserve_once)
+
+    _, first_end, total = content_range
+    if len(first_chunk) != first_end + 1:
+        return await _download_single(client, url, timeout, reserve_once)
+    if first_end + 1 >= total:
+        return first_chunk
+
+    buffer = bytearray(total)
+    buffer[:len(first_chunk)] = first_chunk
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def fetch(start: int, end: int) -> None:
+        async with semaphore:
+            await _fetch_range(client, url, start, end, buffer, timeout, retries)
+
+    tasks = [
+        asyncio.ensure_future(fetch(start, end))
+        for start, end in split_ranges(first_end + 1, total, chunk_size)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except Exception as e:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        print(f"分片下载失败，改为单连接下载: {str(e)}")
+        return await _download_single(client, url, timeout, reserve_once)
+
+    return bytes(buffer)
+
+
+async def _read_body(response: httpx.Response, reserve: ReserveFunc) -> bytes:
+    """按 Content-Length 预留额度后读取响应体"""
+    length = response.headers.get("content-length", "")
+    if length.isdigit():
+        await reserve(int(length))
+    content = await response.aread()
+    await reserve(len(content))
+    return content
+
+
+async def _download_single(client: httpx.AsyncClient, url: str, timeout: float,
+                           reserve: ReserveFunc) -> bytes:
+    """单连接完整下载"""
+    async with client.stream("GET", url, timeout=timeout) as response:
+        response.raise_for_status()
+        return await _read_body(response, reserve)
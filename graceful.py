@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+HTTP服务的平滑退出
+
+uvicorn收到SIGTERM后会立即结束仍在推送的SSE响应，进行中的生成结果会丢失。这里在
+应用启动时接管工作进程的退出信号：收到信号后先进入排空状态（新的生成请求返回繁忙
+响应，由客户端重试到其他进程或节点），等进行中的HTTP请求全部完成（或超过排空时间）
+后再交给uvicorn原有的处理函数退出。排空期间再次收到信号时立即退出。
+"""
+
+import asyncio
+import signal
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+_SIGNALS = (signal.SIGTERM, signal.SIGINT)
+
+
+class GracefulDrain:
+    """统计进行中的HTTP请求，收到退出信号后等待其完成"""
+
+    def __init__(self, timeout: float = 150.0, poll_interval: float = 0.2):
+        """
+        Args:
+            timeout: 排空的最长时间(秒)，超过后不再等待
+            poll_interval: 检查进行中请求数的间隔(秒)
+        """
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self.draining = False
+        self.drain_started_at: Optional[float] = None
+        self._handlers: Dict[int, Any] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def wrap_asgi(self, app: Callable) -> Callable:
+        """包装ASGI应用，统计进行中的HTTP请求"""
+        async def tracked(scope, receive, send):
+            if scope["type"] != "http":
+                return await app(scope, receive, send)
+            self.in_flight += 1
+            try:
+                return await app(scope, receive, send)
+            finally:
+                self.in_flight -= 1
+        return tracked
+
+    def install(self) -> None:
+        """
+        接管退出信号，需在服务器安装信号处理函数之后、于主线程的事件循环中调用（例如应用生命周期启动时）
+
+        无法设置信号处理函数时保持服务器原有的行为
+        """
+        self._loop = asyncio.get_running_loop()
+        for sig in _SIGNALS:
+            try:
+                self._handlers[sig] = signal.getsignal(sig)
+                signal.signal(sig, self._handle_signal)
+            except ValueError as e:
+                # 不在主线程中
+                print(f"无法接管退出信号，不启用平滑退出: {str(e)}", file=sys.stderr)
+                return
+
+    def _handle_signal(self, sig: int, frame: Any) -> None:
+        if self.draining:
+            print("再次收到退出信号，立即退出", file=sys.stderr)
+            self._exit(sig, frame)
+            return
+        self.draining = True
+        self.drain_started_at = time.monotonic()
+        print(f"收到退出信号，等待 {self.in_flight} 个进行中的请求完成（最长 {self.timeout:.0f} 秒）", file=sys.stderr)
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._drain_then_exit(sig, frame)))
+
+    async def _drain_then_exit(self, sig: int, frame: Any) -> None:
+        deadline = self.drain_started_at + self.timeout
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+        if self.in_flight > 0:
+            print(f"排空超时，仍有 {self.in_flight} 个请求未完成", file=sys.stderr)
+        self._exit(sig, frame)
+
+    def _exit(self, sig: int, frame: Any) -> None:
+        """恢复并调用原有的信号处理函数"""
+        handler = self._handlers.get(sig)
+        for original_sig, original in self._handlers.items():
+            signal.signal(original_sig, original)
+        if callable(handler):
+            handler(sig, frame)
+        elif handler == signal.SIG_DFL:
+            signal.raise_signal(sig)
+
+    def stats(self) -> Dict[str, Any]:
+        """排空状态"""
+        return {
+            "in_flight_requests": self.in_flight,
+            "draining": self.draining,
+            "draining_for": round(time.monotonic() - self.drain_started_at, 1) if self.draining else None,
+            "drain_timeout": self.timeout
+        }
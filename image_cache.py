@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+本地磁盘图片缓存
+
+服务器下载过的图片按内容SHA-256寻址保存在本地目录，总大小超过上限时按最近最少
+使用(LRU)淘汰。服务器据此把图片以MCP资源 (jimeng://image/{hash}.{扩展名}) 的形式
+直接提供给客户端，无需客户端再访问CDN或COS；资源URI中的扩展名决定资源的MIME类型。
+
+缓存目录结构为 {dir}/{hash前2位}/{hash}.{扩展名}，重启后按文件修改时间恢复LRU顺序。
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+RESOURCE_URI_PREFIX = "jimeng://image/"
+
+_DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+# 缓存文件扩展名 -> Content-Type
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+    "svg": "image/svg+xml",
+    "bin": "application/octet-stream"
+}
+
+
+def image_resource_uri(digest: str, extension: str) -> str:
+    return f"{RESOURCE_URI_PREFIX}{digest}.{extension}"
+
+
+def sniff_extension(data: bytes) -> str:
+    """按文件头识别图片格式，返回扩展名"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "jpg"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    if data.startswith(b"BM"):
+        return "bmp"
+    if data.lstrip()[:5] in (b"<?xml", b"<svg "):
+        return "svg"
+    return "bin"
+
+
+class _Entry:
+    __slots__ = ("size", "extension")
+
+    def __init__(self, size: int, extension: str):
+        self.size = size
+        self.extension = extension
+
+
+class DiskImageCache:
+    """按内容寻址、总大小受限的LRU磁盘缓存（线程安全，文件操作为同步调用）"""
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Args:
+            directory: 缓存目录
+            max_bytes: 缓存文件总大小上限(字节)，超过后淘汰最久未使用的图片
+        """
+        if max_bytes <= 0:
+            raise ValueError("max_bytes 必须大于0")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 图片URL与内容哈希的对应关系，随缓存条目一起淘汰
+        self._url_digests: Dict[str, str] = {}
+        self._digest_urls: Dict[str, Set[str]] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.{extension}")
+
+    def _load(self) -> None:
+        """扫描缓存目录，按修改时间恢复LRU顺序，超出上限的部分立即淘汰"""
+        found: List[Tuple[float, str, _Entry]] = []
+        for subdir in os.listdir(self.directory):
+            subpath = os.path.join(self.directory, subdir)
+            if not os.path.isdir(subpath):
+                continue
+            for name in os.listdir(subpath):
+                if name.endswith(".tmp"):
+                    # 上次退出时未写完的临时文件
+                    try:
+                        os.remove(os.path.join(subpath, name))
+                    except OSError:
+                        pass
+                    continue
+                digest, _, extension = name.partition(".")
+                if not _DIGEST_PATTERN.match(digest) or extension not in CONTENT_TYPES:
+                    continue
+                try:
+                    stat = os.stat(os.path.join(subpath, name))
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, digest, _Entry(stat.st_size, extension)))
+
+        for _, digest, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[digest] = entry
+            self.total_bytes += entry.size
+        with self._lock:
+            self._evict()
+
+    def _drop(self, digest: str) -> Optional[_Entry]:
+        """移除条目及其URL对应关系（需持有锁）"""
+        entry = self._entries.pop(digest, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        for url in self._digest_urls.pop(digest, ()):
+            self._url_digests.pop(url, None)
+        return entry
+
+    def _evict(self) -> None:
+        """淘汰最久未使用的条目直到总大小不超过上限（需持有锁）"""
+        while self.total_bytes > self.max_bytes and self._entries:
+            digest = next(iter(self._entries))
+            entry = self._drop(digest)
+            self.evictions += 1
+            try:
+                os.remove(self._path(digest, entry.extension))
+            except OSError:
+                pass
+
+    def put(self, data: bytes, urls: Optional[List[str]] = None) -> str:
+        """
+        保存图片并返回内容哈希，urls 为该图片的访问地址，用于之后按URL查找哈希
+
+        空内容和超过缓存上限的图片不保存
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+        if entry is None and 0 < len(data) <= self.max_bytes:
+            extension = sniff_extension(data)
+            path = self._path(digest, extension)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写入临时文件再原子替换，读取方不会看到写了一半的文件
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+            with self._lock:
+                if digest not in self._entries:
+                    self._entries[digest] = _Entry(len(data), extension)
+                    self.total_bytes += len(data)
+                    self._evict()
+
+        for url in urls or []:
+            self.remember_url(url, digest)
+        return digest
+
+    def remember_url(self, url: str, digest: str) -> None:
+        """记录URL对应的内容哈希（仅当该图片仍在缓存中）"""
+        if not url:
+            return
+        with self._lock:
+            if digest in self._entries:
+                self._url_digests[url] = digest
+                self._digest_urls.setdefault(digest, set()).add(url)
+
+    def digest_for_url(self, url: str) -> Optional[str]:
+        with self._lock:
+            return self._url_digests.get(url)
+
+    def resource_uri(self, url: str) -> Optional[str]:
+        """URL对应图片的MCP资源URI，不在缓存中时返回None"""
+        with self._lock:
+            digest = self._url_digests.get(url)
+            entry = self._entries.get(digest) if digest else None
+            return image_resource_uri(digest, entry.extension) if entry is not None else None
+
+    def read(self, digest: str) -> Optional[Tuple[bytes, str]]:
+        """读取图片，返回 (内容, Content-Type)，不在缓存中时返回None"""
+        if not _DIGEST_PATTERN.match(digest):
+            return None
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+        path = self._path(digest, entry.extension)
+
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # 更新修改时间，重启后保持LRU顺序
+            now = time.time()
+            os.utime(path, (now, now))
+        except OSError:
+            # 文件被外部删除或损坏，移除条目
+            with self._lock:
+                self._drop(digest)
+            return None
+        return data, CONTENT_TYPES[entry.extension]
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存使用情况"""
+        with self._lock:
+            return {
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "total_bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
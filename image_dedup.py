@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+图片感知哈希去重
+
+在图片下载后于线程池中计算感知哈希(dHash/pHash)，并使用BK树按汉明距离
+查找已上传过的近似图片，从而直接复用已有对象，避免重复上传。
+"""
+
+import asyncio
+import io
+import json
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """计算两个哈希值的汉明距离"""
+    return bin(a ^ b).count("1")
+
+
+def dhash_image(image: "Image.Image", hash_size: int = 8) -> int:
+    """计算已打开图片的差值哈希(dHash)"""
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).tobytes())
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def phash_image(image: "Image.Image", hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """计算已打开图片的感知哈希(pHash)，取缩略灰度图DCT的低频部分与中位数比较"""
+    size = hash_size * highfreq_factor
+    pixels = list(image.convert("L").resize((size, size), Image.LANCZOS).tobytes())
+
+    rows = [pixels[i * size:(i + 1) * size] for i in range(size)]
+    cos_table = [
+        [math.cos(math.pi * (2 * x + 1) * u / (2 * size)) for x in range(size)]
+        for u in range(hash_size)
+    ]
+    # 先对行做DCT，再对列做DCT，只计算左上角hash_size x hash_size低频系数
+    row_dct = [[sum(c * p for c, p in zip(cos_table[u], row)) for u in range(hash_size)]
+               for row in rows]
+    coefficients = [
+        sum(cos_table[v][y] * row_dct[y][u] for y in range(size))
+        for v in range(hash_size) for u in range(hash_size)
+    ]
+
+    median = sorted(coefficients[1:])[len(coefficients[1:]) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+HASH_FUNCTIONS = {
+    "dhash": dhash_image,
+    "phash": phash_image,
+}
+
+
+def compute_dhash(image_data: bytes, hash_size: int = 8) -> int:
+    """计算差值哈希(dHash)"""
+    with Image.open(io.BytesIO(image_data)) as image:
+        return dhash_image(image, hash_size)
+
+
+def compute_phash(image_data: bytes, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """计算感知哈希(pHash)"""
+    with Image.open(io.BytesIO(image_data)) as image:
+        return phash_image(image, hash_size, highfreq_factor)
+
+
+def compute_fingerprint(image_data: bytes, algorithm: str = "dhash") -> Tuple[int, int, int]:
+    """计算图片哈希并读取原始尺寸，返回(哈希, 宽, 高)
+
+    感知哈希基于缩略图计算，不同尺寸的同一画面哈希相同，复用时需要尺寸一致。
+    """
+    with Image.open(io.BytesIO(image_data)) as image:
+        width, height = image.size
+        return HASH_FUNCTIONS[algorithm](image), width, height
+
+
+class BKTree:
+    """按汉明距离组织的BK树，支持阈值范围查询"""
+
+    def __init__(self):
+        self._root: Optional[List[Any]] = None  # [hash, value, {distance: child}]
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_value: int, value: Any) -> None:
+        """插入哈希值及其关联数据"""
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, value, {}]
+            return
+
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, value, {}]
+                return
+            node = child
+
+    def items(self) -> Iterator[Tuple[int, Any]]:
+        """遍历所有(哈希, 数据)"""
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            yield node[0], node[1]
+            stack.extend(node[2].values())
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """返回距离不超过max_distance的所有(距离, 数据)，按距离升序"""
+        if self._root is None:
+            return []
+
+        results = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                results.append((distance, node[1]))
+            low, high = distance - max_distance, distance + max_distance
+            for child_distance, child in node[2].items():
+                if low <= child_distance <= high:
+                    stack.append(child)
+
+        results.sort(key=lambda item: item[0])
+        return results
+
+
+class ImageDedupIndex:
+    """已上传图片的感知哈希索引"""
+
+    def __init__(self, algorithm: str = "dhash", max_distance: int = 4,
+                 storage_path: Optional[str] = None, max_workers: int = 2):
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+        self.algorithm = algorithm
+        self.max_distance = max_distance
+        self.storage_path = storage_path
+        self.max_workers = max_workers
+
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 未设置持久化文件时无需加载；加载失败时保持False
+        self.loaded = not storage_path
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    async def compute_fingerprint(self, image_data: bytes) -> Optional[Tuple[int, int, int]]:
+        """在线程池中计算图片哈希和尺寸，图片无法解析时返回None"""
+        if not PIL_AVAILABLE:
+            return None
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        loop = asyncio.get_event_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor, compute_fingerprint, image_data, self.algorithm
+            )
+        except Exception as e:
+            print(f"计算图片哈希失败: {str(e)}")
+            return None
+
+    def find_duplicate(self, hash_value: int, width: int, height: int,
+                       max_distance: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """查找尺寸相同且哈希最接近的已有图片，返回其记录和距离"""
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        with self._lock:
+            matches = self._tree.search(hash_value, max_distance)
+
+        # BK树不支持删除，已清理的对象只做标记；未记录尺寸的旧记录不参与复用
+        for distance, record in matches:
+            if record.get("removed"):
+                continue
+            if record.get("width") == width and record.get("height") == height:
+                return {"url": record["url"], "key": record["key"], "distance": distance}
+        return None
+
+    def add(self, hash_value: int, url: str, key: str = "",
+            width: Optional[int] = None, height: Optional[int] = None) -> None:
+        """记录已上传图片的哈希和尺寸，持久化时会写文件，应在线程池中调用"""
+        record = {"url": url, "key": key, "width": width, "height": height}
+        with self._lock:
+            self._tree.add(hash_value, record)
+            if self.storage_path:
+                self._append(hash_value, record)
+
+    def keys(self) -> Set[str]:
+        """返回所有仍有效记录的对象Key"""
+        with self._lock:
+            return {
+                record["key"] for _, record in self._tree.items()
+                if record["key"] and not record.get("removed")
+            }
+
+    def remove_keys(self, keys: Iterable[str]) -> int:
+        """将指定对象Key的记录标记为已删除，返回标记数量"""
+        keys = set(keys)
+        removed = 0
+        with self._lock:
+            for _, record in self._tree.items():
+                if record["key"] in keys and not record.get("removed"):
+                    record["removed"] = True
+                    removed += 1
+            if removed and self.storage_path:
+                self._rewrite()
+        return removed
+
+    def _rewrite(self) -> None:
+        """将有效记录写入临时文件后替换持久化文件"""
+        temp_path = self.storage_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for hash_value, record in self._tree.items():
+                    if record.get("removed"):
+                        continue
+                    line = dict(record, hash=format(hash_value, "x"), algorithm=self.algorithm)
+                    f.write(json.dumps(line, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.storage_path)
+        except OSError as e:
+            print(f"图片哈希索引重写失败: {str(e)}")
+
+    def _append(self, hash_value: int, record: Dict[str, Any]) -> None:
+        """追加写入持久化文件"""
+        line = dict(record, hash=format(hash_value, "x"), algorithm=self.algorithm)
+        try:
+            with open(self.storage_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(line, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"图片哈希索引写入失败: {str(e)}")
+
+    def load(self) -> int:
+        """从持久化文件加载哈希记录，忽略其他算法生成的记录，返回加载数量
+
+        读取文件会阻塞，服务中应在启动时放到线程池执行。
+        """
+        if not self.storage_path:
+            return 0
+        if not os.path.exists(self.storage_path):
+            self.loaded = True
+            return 0
+        count = 0
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if record.get("algorithm", self.algorithm) != self.algorithm:
+                        continue
+                    with self._lock:
+                        self._tree.add(int(record["hash"], 16), {
+                            "url": record["url"],
+                            "key": record.get("key", ""),
+                            "width": record.get("width"),
+                            "height": record.get("height"),
+                        })
+                    count += 1
+            self.loaded = True
+        except OSError as e:
+            print(f"图片哈希索引加载失败: {str(e)}")
+        return count
+
+    def shutdown(self) -> None:
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
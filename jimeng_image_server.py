@@ -6,18 +6,51 @@
 """
 
 import asyncio
+import base64
+import hashlib
 import json
 import os
 import sys
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 import httpx
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from dotenv import load_dotenv
 
+from byte_budget import ByteBudget
+from cos_gc import collect_garbage
+from cos_optimized import OptimizedTencentCOS
+from cos_presign import PresignedURLCache, cos_key_from_url
+from downloader import download_bytes
+from image_cache import CONTENT_TYPES, RESOURCE_URI_PREFIX, DiskImageCache
+from image_dedup import PIL_AVAILABLE, ImageDedupIndex
+from job_store import STATUS_DONE, STATUS_FAILED, JobStore
+from loop_monitor import LoopLagMonitor
+from model_selector import AUTO_MODEL, ModelLatencyTracker, parse_quality_order
+from negative_cache import NegativeCache, is_deterministic_error, request_key
+from placeholder_pool import PlaceholderPool, load_pool_specs
+from placeholder_render import placeholder_blurhash, render_lqip_data_uri, render_placeholder_svg
+from progress import (
+    STAGE_DOWNLOADING,
+    STAGE_GENERATING,
+    STAGE_QUEUED,
+    STAGE_UPLOADING,
+    progress_stage,
+    report_stage,
+    reports_progress,
+)
+from prompt_index import PromptIndex
+from scheduler import DEFAULT_WEIGHTS, PRIORITY_BULK, PRIORITY_INTERACTIVE, FairScheduler
+from site_assets import SiteAssetBuilder, load_asset_map
+from tool_profiler import ToolProfiler
+from warmup import ConnectionWarmer, http_ping
+from webhooks import EVENT_COMPLETED, EVENT_FAILED, WebhookDispatcher, validate_callback_url
+
 # 腾讯云COS相关导入
 try:
-    from qcloud_cos import CosConfig, CosS3Client
     from qcloud_cos.cos_exception import CosServiceError, CosClientError
     TENCENT_COS_AVAILABLE = True
 except ImportError:
@@ -26,8 +59,59 @@ except ImportError:
 # 加载环境变量
 load_dotenv()
 
+@asynccontextmanager
+async def server_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """服务器生命周期：创建共享的COS传输引擎和即梦API连接池，启动和停止后台任务"""
+    global _cos_engine, _jimeng_client, connection_warmer
+    try:
+        async with AsyncExitStack() as stack:
+            if not PIL_AVAILABLE:
+                print("未安装Pillow，图片感知哈希去重(dedup_images)不可用: pip install Pillow",
+                      file=sys.stderr)
+            # 计算图片哈希的线程池最后关闭，等待后台任务中的哈希计算完成
+            stack.callback(image_dedup_index.shutdown)
+            if cos_configured():
+                _cos_engine = await stack.enter_async_context(create_cos_engine())
+            _jimeng_client = await stack.enter_async_context(create_jimeng_client())
+            if not prompt_index.loaded:
+                # 历史记录较多时加载耗时较长，放到线程池中执行
+                loaded = await asyncio.get_running_loop().run_in_executor(None, prompt_index.load)
+                print(f"提示词索引已加载 {loaded} 条记录", file=sys.stderr)
+            if not image_dedup_index.loaded:
+                loaded = await asyncio.get_running_loop().run_in_executor(None, image_dedup_index.load)
+                print(f"图片哈希索引已加载 {loaded} 条记录", file=sys.stderr)
+            # 回调队列在后台任务停止后最后关闭，尽量投递完剩余通知
+            stack.push_async_callback(webhooks.close, WEBHOOK_DRAIN_TIMEOUT)
+            if CONNECTION_WARMUP:
+                # 预热完成（或超时）后再接受请求，之后定期保活
+                connection_warmer = build_connection_warmer()
+                await connection_warmer.warm_all()
+                connection_warmer.start()
+                stack.push_async_callback(connection_warmer.stop)
+            # 退出时先停止占位图池，再关闭COS传输引擎
+            if JIMENG_SESSION_ID is not None and PLACEHOLDER_POOL_SIZE > 0:
+                if cos_configured():
+                    placeholder_pool.start()
+                else:
+                    # 上游返回的图片链接会过期，只有存入COS的结果才能预先生成后长期保存
+                    print("未配置腾讯云COS，占位图预生成池不可用", file=sys.stderr)
+            stack.push_async_callback(placeholder_pool.stop)
+            if LOOP_MONITOR:
+                loop_monitor.start()
+                stack.push_async_callback(loop_monitor.stop)
+            if job_store is not None:
+                # 先停止恢复任务，再关闭数据库连接
+                stack.callback(job_store.close)
+                resumer = asyncio.create_task(resume_jobs_loop())
+                stack.push_async_callback(cancel_task, resumer)
+            yield
+    finally:
+        _cos_engine = None
+        _jimeng_client = None
+        connection_warmer = None
+
 # 初始化FastMCP服务器
-mcp = FastMCP("jimeng-image-generator")
+mcp = FastMCP("jimeng-image-generator", lifespan=server_lifespan)
 
 # 常量配置 (可通过环境变量覆盖)
 JIMENG_API_BASE = os.getenv("JIMENG_API_BASE", "http://localhost:8001")
@@ -38,6 +122,15 @@ DEFAULT_HEIGHT = int(os.getenv("DEFAULT_HEIGHT", "1024"))
 DEFAULT_SAMPLE_STRENGTH = float(os.getenv("DEFAULT_SAMPLE_STRENGTH", "0.5"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "120000"))
 
+# 图片下载配置：分片大小(字节)、最大并发分片数、单个请求超时(秒)
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(2 * 1024 * 1024)))
+DOWNLOAD_MAX_PARALLEL = int(os.getenv("DOWNLOAD_MAX_PARALLEL", "4"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "30"))
+
+# 同时驻留内存的图片字节上限：每张图片从下载到上传完成一直占用其大小的额度
+MAX_INFLIGHT_BYTES = int(os.getenv("MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))
+byte_budget = ByteBudget(MAX_INFLIGHT_BYTES)
+
 # 腾讯云COS配置
 TENCENT_CLOUD_SECRET_ID = os.getenv("TENCENT_CLOUD_SECRET_ID")
 TENCENT_CLOUD_SECRET_KEY = os.getenv("TENCENT_CLOUD_SECRET_KEY")
@@ -45,6 +138,143 @@ TENCENT_COS_REGION = os.getenv("TENCENT_COS_REGION", "ap-guangzhou")
 TENCENT_COS_BUCKET = os.getenv("TENCENT_COS_BUCKET", "jimeng-images")
 TENCENT_COS_DOMAIN = os.getenv("TENCENT_COS_DOMAIN", "")
 
+# 私有存储桶：返回预签名URL，签名在到期前 TENCENT_COS_URL_REFRESH_MARGIN 秒内复用
+TENCENT_COS_PRIVATE = os.getenv("TENCENT_COS_PRIVATE", "false").lower() in ("1", "true", "yes")
+TENCENT_COS_URL_EXPIRES = int(os.getenv("TENCENT_COS_URL_EXPIRES", "3600"))
+TENCENT_COS_URL_REFRESH_MARGIN = int(os.getenv("TENCENT_COS_URL_REFRESH_MARGIN", "300"))
+
+# COS分块上传：超过阈值(字节)的图片分块并发上传
+COS_MULTIPART_THRESHOLD = int(os.getenv("COS_MULTIPART_THRESHOLD", str(4 * 1024 * 1024)))
+COS_PART_SIZE = int(os.getenv("COS_PART_SIZE", str(1024 * 1024)))
+COS_PART_WORKERS = int(os.getenv("COS_PART_WORKERS", "4"))
+# 执行COS同步调用的线程数（同时进行的上传/列举/删除请求）
+COS_UPLOAD_WORKERS = int(os.getenv("COS_UPLOAD_WORKERS", "4"))
+
+# COS对象清理：未被引用的对象在上传后该时间(秒)内保留；批量删除的并发批次数
+COS_GC_GRACE_SECONDS = float(os.getenv("COS_GC_GRACE_SECONDS", "3600"))
+COS_DELETE_CONCURRENCY = int(os.getenv("COS_DELETE_CONCURRENCY", "4"))
+# 按引用关系清理时需要保留的网站图片映射文件（build_site_assets 的输出），多个路径用逗号分隔
+# 为true时允许通过 cleanup_cos_objects 工具列举和批量删除COS对象
+COS_GC_ADMIN = os.getenv("COS_GC_ADMIN", "false").lower() in ("1", "true", "yes")
+COS_GC_ASSET_MAPS = [path.strip() for path in os.getenv("COS_GC_ASSET_MAPS", "").split(",") if path.strip()]
+
+# 提示词近似匹配索引 (设置路径后历史记录会持久化到JSONL文件)
+PROMPT_INDEX_PATH = os.getenv("PROMPT_INDEX_PATH", "")
+# 历史记录上限（超过后淘汰最近最少使用的记录）和有效期(秒，0表示不过期)
+PROMPT_INDEX_MAX_ENTRIES = int(os.getenv("PROMPT_INDEX_MAX_ENTRIES", "100000"))
+PROMPT_INDEX_TTL = float(os.getenv("PROMPT_INDEX_TTL", "0"))
+# 历史记录在服务器启动时于线程池中加载，不阻塞模块导入
+prompt_index = PromptIndex(
+    storage_path=PROMPT_INDEX_PATH or None,
+    max_entries=PROMPT_INDEX_MAX_ENTRIES,
+    ttl=PROMPT_INDEX_TTL
+)
+
+# 图片感知哈希去重 (需要安装Pillow)
+IMAGE_HASH_INDEX_PATH = os.getenv("IMAGE_HASH_INDEX_PATH", "")
+IMAGE_DEDUP_ALGORITHM = os.getenv("IMAGE_DEDUP_ALGORITHM", "dhash")
+IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "4"))
+image_dedup_index = ImageDedupIndex(
+    algorithm=IMAGE_DEDUP_ALGORITHM,
+    max_distance=IMAGE_DEDUP_MAX_DISTANCE,
+    storage_path=IMAGE_HASH_INDEX_PATH or None
+)
+
+# 占位图预生成池 (每个类别保持的就绪图片数量，0表示禁用)
+PLACEHOLDER_POOL_SIZE = int(os.getenv("PLACEHOLDER_POOL_SIZE", "0"))
+PLACEHOLDER_POOL_SPEC = os.getenv("PLACEHOLDER_POOL_SPEC", "")
+PLACEHOLDER_POOL_CONCURRENCY = int(os.getenv("PLACEHOLDER_POOL_CONCURRENCY", "1"))
+
+# 上游调度：同时发往即梦API的最大请求数，交互式请求优先于批量任务
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "4"))
+STARVATION_TIMEOUT = float(os.getenv("STARVATION_TIMEOUT", "60"))
+upstream_scheduler = FairScheduler(
+    concurrency=UPSTREAM_CONCURRENCY,
+    starvation_timeout=STARVATION_TIMEOUT
+)
+
+# 连接预热：启动时预先建立到即梦API、图片CDN(WARMUP_URLS)和COS的连接并校验COS凭证，
+# 之后每隔 KEEPALIVE_INTERVAL 秒保活；空闲连接在连接池中保留 HTTP_KEEPALIVE_EXPIRY 秒
+CONNECTION_WARMUP = os.getenv("CONNECTION_WARMUP", "false").lower() in ("1", "true", "yes")
+WARMUP_URLS = [url.strip() for url in os.getenv("WARMUP_URLS", "").split(",") if url.strip()]
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "2"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "5"))
+KEEPALIVE_INTERVAL = float(os.getenv("KEEPALIVE_INTERVAL", "30"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+connection_warmer: Optional[ConnectionWarmer] = None
+
+# 生成完成回调：签名密钥、投递队列上限、单个通知最多投递次数、投递超时(秒)、
+# 允许的回调主机(逗号分隔，为空表示不限制)、退出时等待投递完成的最长时间(秒)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_QUEUE = int(os.getenv("WEBHOOK_MAX_QUEUE", "1000"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_ALLOWED_HOSTS = [host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+# 允许回调到内网、回环等非公网地址（仅用于本地开发）
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+webhooks = WebhookDispatcher(
+    secret=WEBHOOK_SECRET,
+    max_queue=WEBHOOK_MAX_QUEUE,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    timeout=WEBHOOK_TIMEOUT,
+    allowed_hosts=WEBHOOK_ALLOWED_HOSTS,
+    allow_private=WEBHOOK_ALLOW_PRIVATE
+)
+
+# 本地图片缓存：下载过的图片按内容哈希保存在该目录(为空表示不缓存)，总大小超过上限(字节)后按LRU淘汰，
+# 缓存中的图片可通过MCP资源 jimeng://image/{hash} 直接读取
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+image_cache = DiskImageCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES) if IMAGE_CACHE_DIR else None
+
+# 网站图片清单构建：同时生成的条目数，默认与上游并发数一致
+SITE_ASSETS_CONCURRENCY = int(os.getenv("SITE_ASSETS_CONCURRENCY", str(UPSTREAM_CONCURRENCY)))
+# 未存入COS的图片（上游临时链接）在映射文件中的有效期(秒)，超过后重新生成，0表示不检查
+SITE_ASSETS_URL_TTL = float(os.getenv("SITE_ASSETS_URL_TTL", "86400"))
+
+# 负缓存：参数校验失败、内容审核拒绝等确定性上游错误按请求参数缓存的时间(秒)，期间相同请求直接返回原错误；0表示禁用
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "600"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+negative_cache = NegativeCache(NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_MAX_ENTRIES) if NEGATIVE_CACHE_TTL > 0 else None
+
+# 进度通知：生成期间向请求了进度的客户端发送阶段通知，长耗时阶段内的心跳间隔(秒)
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "5"))
+
+# 事件循环延迟监控：心跳间隔(秒)、阻塞阈值(秒)，超过阈值时输出事件循环线程的调用栈
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "false").lower() in ("1", "true", "yes")
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+LOOP_ASYNCIO_DEBUG = os.getenv("LOOP_ASYNCIO_DEBUG", "false").lower() in ("1", "true", "yes")
+loop_monitor = LoopLagMonitor(
+    interval=LOOP_MONITOR_INTERVAL,
+    threshold=LOOP_LAG_THRESHOLD,
+    asyncio_debug=LOOP_ASYNCIO_DEBUG
+)
+
+# 持久化任务队列：设置数据库路径后生成任务的步骤进度写入SQLite，重启后自动恢复未完成的任务
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "")
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+job_store = JobStore(JOB_DB_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS) if JOB_DB_PATH else None
+
+# 即时占位图的后台生成任务 (job_id -> 状态)，只保留最近的记录
+MAX_PLACEHOLDER_JOBS = 1000
+placeholder_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+background_tasks = set()
+
+# 按需性能剖析：PROFILE_TOOL_CALLS 大于0时启动后剖析该数量的工具调用；
+# PROFILING_ADMIN 为true时允许通过 start_profiling 工具随时开启
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_TOOL_CALLS = int(os.getenv("PROFILE_TOOL_CALLS", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "false").lower() in ("1", "true", "yes")
+PROFILING_ADMIN = os.getenv("PROFILING_ADMIN", "false").lower() in ("1", "true", "yes")
+tool_profiler = ToolProfiler(output_dir=PROFILE_OUTPUT_DIR)
+if PROFILE_TOOL_CALLS > 0:
+    tool_profiler.arm(PROFILE_TOOL_CALLS, PROFILE_MODE, PROFILE_MEMORY)
+
 # 可用模型列表
 AVAILABLE_MODELS = [
     "jimeng-3.0",
@@ -56,6 +286,36 @@ AVAILABLE_MODELS = [
     "jimeng-xl-pro"
 ]
 
+# 自适应模型选择：model="auto" 时选择当前p95耗时满足延迟目标(秒)的质量最高的模型
+AUTO_MODEL_ORDER = parse_quality_order(os.getenv("AUTO_MODEL_ORDER", ""), AVAILABLE_MODELS)
+AUTO_MODEL_LATENCY_SLO = float(os.getenv("AUTO_MODEL_LATENCY_SLO", "60"))
+model_latency = ModelLatencyTracker(
+    window=int(os.getenv("MODEL_STATS_WINDOW", "50")),
+    window_seconds=float(os.getenv("MODEL_STATS_WINDOW_SECONDS", "900")),
+    min_samples=int(os.getenv("AUTO_MODEL_MIN_SAMPLES", "3")),
+    max_error_rate=float(os.getenv("AUTO_MODEL_MAX_ERROR_RATE", "0.3"))
+)
+
+# 发往即梦API的共享连接池
+_jimeng_client: Optional[httpx.AsyncClient] = None
+
+def create_jimeng_client() -> httpx.AsyncClient:
+    """创建发往即梦API的连接池，保留的空闲连接数与上游并发数一致"""
+    return httpx.AsyncClient(
+        timeout=REQUEST_TIMEOUT,
+        limits=httpx.Limits(
+            max_keepalive_connections=max(UPSTREAM_CONCURRENCY, WARMUP_CONNECTIONS),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+    )
+
+def get_jimeng_client() -> httpx.AsyncClient:
+    """获取即梦API连接池，未经生命周期调用时按需创建"""
+    global _jimeng_client
+    if _jimeng_client is None or _jimeng_client.is_closed:
+        _jimeng_client = create_jimeng_client()
+    return _jimeng_client
+
 async def make_jimeng_request(url: str, data: Dict[str, Any], session_id: str) -> Optional[Dict[str, Any]]:
     """向即梦API发送请求"""
     headers = {
@@ -63,28 +323,44 @@ async def make_jimeng_request(url: str, data: Dict[str, Any], session_id: str) -
         "Content-Type": "application/json"
     }
     
-    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-        try:
-            response = await client.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except httpx.TimeoutException:
-            return {"error": "请求超时，图片生成可能需要更长时间"}
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API请求失败: {e.response.status_code} - {e.response.text}"}
-        except Exception as e:
-            return {"error": f"请求发生错误: {str(e)}"}
+    try:
+        response = await get_jimeng_client().post(url, json=data, headers=headers)
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        return {"error": "请求超时，图片生成可能需要更长时间", "retryable": True}
+    except httpx.HTTPStatusError as e:
+        # 参数校验失败和内容审核拒绝属于确定性错误，相同请求重试不会成功
+        return {
+            "error": f"API请求失败: {e.response.status_code} - {e.response.text}",
+            "retryable": not is_deterministic_error(e.response.status_code, e.response.text)
+        }
+    except Exception as e:
+        return {"error": f"请求发生错误: {str(e)}", "retryable": True}
+
+async def download_image_async(image_url: str, reserve=None) -> Optional[bytes]:
+    """
+    异步下载图片，大图在服务器支持Range时并发分片下载；reserve 用于在读取前预留字节额度
 
-async def download_image_async(image_url: str) -> Optional[bytes]:
-    """异步下载图片"""
+    启用本地图片缓存时下载的图片同时写入缓存。配置了COS时使用COS传输引擎的连接池，
+    否则使用即梦API的连接池
+    """
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(image_url)
-            response.raise_for_status()
-            return response.content
+        if cos_configured():
+            image_data = await get_cos_engine().download(image_url, reserve=reserve)
+        else:
+            image_data = await download_bytes(
+                get_jimeng_client(), image_url,
+                chunk_size=DOWNLOAD_CHUNK_SIZE,
+                max_parallel=DOWNLOAD_MAX_PARALLEL,
+                timeout=DOWNLOAD_TIMEOUT,
+                reserve=reserve
+            )
     except Exception as e:
         print(f"下载图片失败: {str(e)}")
         return None
+    await cache_image(image_data, image_url)
+    return image_data
 
 def get_file_extension_from_url(url: str) -> str:
     """从URL中提取文件扩展名"""
@@ -119,16 +395,131 @@ def sanitize_filename(prompt: str, max_length: int = 50) -> str:
     
     return safe_prompt
 
-async def upload_to_tencent_cos(image_url: str, prompt: str) -> Optional[str]:
+# 共享的COS客户端和预签名URL缓存
+_cos_engine: Optional[OptimizedTencentCOS] = None
+_presigned_urls: Optional[PresignedURLCache] = None
+
+def cos_configured() -> bool:
+    """是否安装了COS SDK并配置了密钥"""
+    return bool(TENCENT_COS_AVAILABLE and TENCENT_CLOUD_SECRET_ID and TENCENT_CLOUD_SECRET_KEY)
+
+def create_cos_engine() -> OptimizedTencentCOS:
+    """按环境变量配置创建COS传输引擎（连接池、线程池、分块上传、字节预算）"""
+    return OptimizedTencentCOS(
+        max_workers=COS_UPLOAD_WORKERS,
+        multipart_threshold=COS_MULTIPART_THRESHOLD,
+        part_size=COS_PART_SIZE,
+        part_workers=COS_PART_WORKERS,
+        download_chunk_size=DOWNLOAD_CHUNK_SIZE,
+        download_max_parallel=DOWNLOAD_MAX_PARALLEL,
+        download_timeout=DOWNLOAD_TIMEOUT,
+        byte_budget=byte_budget,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+    )
+
+def get_cos_engine() -> OptimizedTencentCOS:
     """
-    将图片上传到腾讯云对象存储
+    获取共享的COS传输引擎
+    
+    服务器运行时由生命周期创建并在退出时关闭；未经生命周期调用（如脚本直接导入）时按需创建
+    """
+    global _cos_engine
+    if _cos_engine is None or _cos_engine.closed:
+        _cos_engine = create_cos_engine()
+    return _cos_engine
+
+def build_connection_warmer() -> ConnectionWarmer:
+    """注册需要预热的端点：即梦API、COS存储桶(同时校验凭证)以及 WARMUP_URLS 中的图片CDN"""
+    warmer = ConnectionWarmer(keepalive_interval=KEEPALIVE_INTERVAL, timeout=WARMUP_TIMEOUT)
+    warmer.add("jimeng_api", http_ping(get_jimeng_client(), JIMENG_API_BASE, WARMUP_CONNECTIONS))
+    if cos_configured():
+        engine = get_cos_engine()
+        warmer.add("cos", engine.head_bucket)
+        # 图片下载使用COS传输引擎的连接池
+        for url in WARMUP_URLS:
+            warmer.add(url, http_ping(engine.http_client, url, WARMUP_CONNECTIONS))
+    return warmer
+
+def get_cos_client():
+    """获取共享的COS客户端"""
+    return get_cos_engine().cos_client
+
+def get_presigned_urls() -> PresignedURLCache:
+    """获取预签名URL缓存"""
+    global _presigned_urls
+    if _presigned_urls is None:
+        _presigned_urls = PresignedURLCache(
+            get_cos_client(),
+            TENCENT_COS_BUCKET,
+            expires=TENCENT_COS_URL_EXPIRES,
+            refresh_margin=TENCENT_COS_URL_REFRESH_MARGIN
+        )
+    return _presigned_urls
+
+def build_cos_url(key: str) -> str:
+    """构建COS对象的访问URL"""
+    if TENCENT_COS_DOMAIN:
+        return f"{TENCENT_COS_DOMAIN}/{key}"
+    return f"https://{TENCENT_COS_BUCKET}.cos.{TENCENT_COS_REGION}.myqcloud.com/{key}"
+
+def resolve_cos_url(key: str) -> str:
+    """返回对象对外的URL，私有存储桶返回（缓存的）预签名URL"""
+    if TENCENT_COS_PRIVATE:
+        return get_presigned_urls().get_url(key)
+    return build_cos_url(key)
+
+def cos_key_from_stored_url(url: str) -> str:
+    """从保存的COS图片URL中解析对象Key，兼容不带协议的自定义域名"""
+    if TENCENT_COS_DOMAIN and url.startswith(TENCENT_COS_DOMAIN + "/"):
+        return cos_key_from_url("/" + url[len(TENCENT_COS_DOMAIN) + 1:].split("?", 1)[0])
+    return cos_key_from_url(url)
+
+def result_cos_keys(result: Dict[str, Any]) -> List[str]:
+    """返回生成结果中引用的COS对象Key"""
+    return [
+        cos_key_from_stored_url(image["cos_url"])
+        for image in result.get("images", []) if image.get("cos_url")
+    ]
+
+def result_stored_in_cos(result: Dict[str, Any]) -> bool:
+    """结果中的图片是否都已存入COS（上游返回的链接会过期，不能长期保存和复用）"""
+    images = result.get("images") or []
+    return bool(images) and all(image.get("cos_url") for image in images)
+
+def refresh_result_urls(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    私有存储桶下为结果中的COS图片批量重新获取预签名URL
+    
+    复用的历史结果、占位图池和后台任务中保存的签名可能已过期，返回前统一刷新；
+    返回新的字典，不修改缓存中保存的原始结果
+    """
+    if not TENCENT_COS_PRIVATE or "images" not in result:
+        return result
+    
+    keys = result_cos_keys(result)
+    if not keys:
+        return result
+    
+    signed = get_presigned_urls().get_urls(keys)
+    images = []
+    for image in result["images"]:
+        if image.get("cos_url"):
+            url = signed[cos_key_from_stored_url(image["cos_url"])]
+            image = dict(image, url=url, cos_url=url)
+        images.append(image)
+    return dict(result, images=images)
+
+async def upload_bytes_to_tencent_cos(data: bytes, key: str, content_type: str) -> Optional[str]:
+    """
+    将内存中的数据上传到腾讯云对象存储的指定Key，已存在的对象会被覆盖
     
     Args:
-        image_url: 原始图片URL
-        prompt: 图片描述，用于生成文件名
+        data: 文件内容
+        key: 对象Key
+        content_type: 文件的Content-Type
     
     Returns:
-        腾讯云COS的图片URL，如果上传失败返回None
+        腾讯云COS的对象URL，如果上传失败返回None
     """
     if not TENCENT_COS_AVAILABLE:
         print("腾讯云COS SDK未安装")
@@ -139,60 +530,15 @@ async def upload_to_tencent_cos(image_url: str, prompt: str) -> Optional[str]:
         return None
     
     try:
-        # 配置腾讯云COS
-        config = CosConfig(
-            Region=TENCENT_COS_REGION,
-            SecretId=TENCENT_CLOUD_SECRET_ID,
-            SecretKey=TENCENT_CLOUD_SECRET_KEY,
-            Scheme='https'  # 明确指定使用HTTPS
-        )
-        client = CosS3Client(config)
-        
-        # 异步下载图片
-        image_data = await download_image_async(image_url)
-        if not image_data:
-            print("图片下载失败")
-            return None
-        
-        # 生成文件名
-        file_extension = get_file_extension_from_url(image_url)
-        safe_prompt = sanitize_filename(prompt)
-        unique_id = uuid.uuid4().hex[:8]
-        file_name = f"jimeng/{safe_prompt}_{unique_id}.{file_extension}"
-        
-        # 确定Content-Type
-        content_type_map = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'bmp': 'image/bmp'
-        }
-        content_type = content_type_map.get(file_extension, 'image/jpeg')
-        
-        # 上传到腾讯云COS
-        result = client.put_object(
-            Bucket=TENCENT_COS_BUCKET,
-            Body=image_data,
-            Key=file_name,
-            ContentType=content_type,
-            StorageClass='STANDARD'  # 明确指定存储类型
-        )
+        # 由共享的传输引擎在其线程池中上传，大文件自动分块并发上传
+        result = await get_cos_engine().put_object_async(data, key, content_type)
         
         # 验证上传结果
         if not result or not result.get('ETag'):
             print("上传结果验证失败")
             return None
         
-        # 构建返回URL
-        if TENCENT_COS_DOMAIN:
-            cos_url = f"{TENCENT_COS_DOMAIN}/{file_name}"
-        else:
-            cos_url = f"https://{TENCENT_COS_BUCKET}.cos.{TENCENT_COS_REGION}.myqcloud.com/{file_name}"
-        
-        print(f"腾讯云COS上传成功: {cos_url}")
-        return cos_url
+        return resolve_cos_url(key)
         
     except CosServiceError as e:
         print(f"腾讯云COS服务错误: {e.get_error_code()} - {e.get_error_msg()}")
@@ -204,55 +550,197 @@ async def upload_to_tencent_cos(image_url: str, prompt: str) -> Optional[str]:
         print(f"腾讯云COS上传异常: {str(e)}")
         return None
 
-@mcp.tool()
-async def generate_images(
+async def cache_image(data: bytes, url: str) -> Optional[str]:
+    """在线程池中把下载的图片写入本地缓存，返回内容哈希；未启用缓存或写入失败时返回None"""
+    if image_cache is None:
+        return None
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(None, image_cache.put, data, [url])
+    except OSError as e:
+        print(f"写入图片缓存失败: {str(e)}")
+        return None
+
+def remember_cached_url(url: str, digest: Optional[str]) -> None:
+    """记录上传后的图片URL对应的缓存哈希，格式化结果时据此附加资源URI"""
+    if image_cache is not None and digest:
+        image_cache.remember_url(url, digest)
+
+def cached_digest(url: str) -> Optional[str]:
+    """已下载图片在本地缓存中的内容哈希"""
+    return image_cache.digest_for_url(url) if image_cache is not None else None
+
+def cached_resource_uri(*urls: Optional[str]) -> Optional[str]:
+    """返回图片在本地缓存中的MCP资源URI，不在缓存中时返回None"""
+    if image_cache is None:
+        return None
+    for url in urls:
+        resource_uri = image_cache.resource_uri(url) if url else None
+        if resource_uri:
+            return resource_uri
+    return None
+
+async def cache_original_image(image_url: str) -> None:
+    """图片未上传COS时下载到本地缓存，使结果可以通过MCP资源读取"""
+    if image_cache is None or not image_url or cached_digest(image_url):
+        return
+    async with byte_budget.hold() as lease:
+        await download_image_async(image_url, reserve=lease.reserve)
+
+async def upload_to_tencent_cos(
+    image_url: str,
     prompt: str,
-    model: str = DEFAULT_MODEL,
-    negative_prompt: str = "",
-    width: int = DEFAULT_WIDTH,
-    height: int = DEFAULT_HEIGHT,
-    sample_strength: float = DEFAULT_SAMPLE_STRENGTH
-) -> str:
+    dedup: bool = False,
+    key: Optional[str] = None
+) -> Optional[str]:
     """
-    生成AI图片，适用于网站开发中的图片设计和占位填充
+    将图片上传到腾讯云对象存储
     
     Args:
-        prompt: 图片描述提示词，必填。例如："少女祈祷中..."、"现代办公室背景"、"产品展示图"等
-        model: 模型选择，可选值：jimeng-3.1(默认)、jimeng-2.1、jimeng-2.0-pro、jimeng-2.0、jimeng-1.4、jimeng-xl-pro
-        negative_prompt: 反向提示词，描述不想要的元素，默认为空
-        width: 图片宽度，默认1024像素
-        height: 图片高度，默认1024像素  
-        sample_strength: 精细度，取值范围0-1，默认0.5
+        image_url: 原始图片URL
+        prompt: 图片描述，用于生成文件名
+        dedup: 是否在上传前按感知哈希查找近似图片，命中时直接返回已有对象URL
+        key: 指定对象Key（覆盖已有对象），不指定时根据提示词生成新的Key
     
     Returns:
-        包含4个图片链接的JSON字符串，每次调用返回4个不同的图片供选择
+        腾讯云COS的图片URL，如果上传失败返回None
     """
+    if not TENCENT_COS_AVAILABLE:
+        print("腾讯云COS SDK未安装")
+        return None
     
-    # 从环境变量获取session_id
-    if JIMENG_SESSION_ID is None:
-        return json.dumps({
-            "error": "环境变量JIMENG_SESSION_ID未设置",
-            "help": "请在.env文件中设置JIMENG_SESSION_ID环境变量"
-        }, ensure_ascii=False, indent=2)
+    if not TENCENT_CLOUD_SECRET_ID or not TENCENT_CLOUD_SECRET_KEY:
+        print("腾讯云COS配置不完整")
+        return None
     
-    # 验证模型参数
-    if model not in AVAILABLE_MODELS:
-        return json.dumps({
-            "error": f"不支持的模型: {model}",
-            "available_models": AVAILABLE_MODELS
-        }, ensure_ascii=False, indent=2)
+    async with byte_budget.hold() as lease:
+        # 异步下载图片，图片占用的字节额度保持到上传完成
+        await report_stage(STAGE_DOWNLOADING)
+        image_data = await download_image_async(image_url, reserve=lease.reserve)
+        if not image_data:
+            print("图片下载失败")
+            return None
+        digest = cached_digest(image_url)
     
-    # 验证参数范围
-    if not (0 <= sample_strength <= 1):
-        return json.dumps({
-            "error": "sample_strength 必须在 0-1 范围内"
-        }, ensure_ascii=False, indent=2)
+        # 计算感知哈希，查找已上传过的近似图片
+        fingerprint = await image_dedup_index.compute_fingerprint(image_data)
+        if dedup and fingerprint is not None:
+            duplicate = image_dedup_index.find_duplicate(*fingerprint)
+            if duplicate:
+                print(f"发现近似图片(距离{duplicate['distance']})，复用已有对象: {duplicate['url']}")
+                duplicate_url = resolve_cos_url(duplicate["key"]) if duplicate["key"] else duplicate["url"]
+                remember_cached_url(duplicate_url, digest)
+                return duplicate_url
     
-    if width <= 0 or height <= 0:
-        return json.dumps({
-            "error": "图片尺寸必须大于0"
-        }, ensure_ascii=False, indent=2)
+        # 生成文件名
+        file_extension = get_file_extension_from_url(image_url)
+        if key:
+            file_name = key
+        else:
+            safe_prompt = sanitize_filename(prompt)
+            unique_id = uuid.uuid4().hex[:8]
+            file_name = f"jimeng/{safe_prompt}_{unique_id}.{file_extension}"
+    
+        # 确定Content-Type
+        content_type_map = {
+            'jpg': 'image/jpeg',
+            'jpeg': 'image/jpeg',
+            'png': 'image/png',
+            'gif': 'image/gif',
+            'webp': 'image/webp',
+            'bmp': 'image/bmp'
+        }
+        content_type = content_type_map.get(file_extension, 'image/jpeg')
+    
+        await report_stage(STAGE_UPLOADING)
+        cos_url = await upload_bytes_to_tencent_cos(image_data, file_name, content_type)
+        if not cos_url:
+            return None
+    
+        if fingerprint is not None:
+            image_hash, width, height = fingerprint
+            await asyncio.get_running_loop().run_in_executor(
+                None, lambda: image_dedup_index.add(image_hash, cos_url, file_name, width, height)
+            )
+        remember_cached_url(cos_url, digest)
     
+        print(f"腾讯云COS上传成功: {cos_url}")
+        return cos_url
+
+async def generate_image_result(
+    prompt: str,
+    model: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    sample_strength: float,
+    dedup_images: bool = False,
+    cos_key: Optional[str] = None,
+    priority: str = PRIORITY_INTERACTIVE,
+    job_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    调用即梦API生成图片并上传COS，返回格式化后的结果
+    
+    参数需已通过校验，失败时返回包含 "error" 字段的字典。
+    指定 cos_key 时图片上传到该Key，覆盖已有对象；priority 决定上游调度的优先级。
+    指定 job_id 时每个步骤的进度写入持久化任务表：已完成的任务直接返回保存的结果，
+    上游已生成的任务只补做上传
+    """
+    job = await job_store.get(job_id) if job_store is not None and job_id else None
+    if job is not None and job["status"] == STATUS_DONE:
+        return job["result"]
+    
+    if job is not None and job["upstream"] is not None:
+        # 上游图片已生成，上传到生成时确定的Key，重复上传是幂等的
+        result = job["upstream"]
+        cos_key = cos_key or job["upload_key"]
+    else:
+        result = await request_image_generation(
+            prompt, model, negative_prompt, width, height, sample_strength, priority
+        )
+        if job is not None and result and "error" not in result and result.get("data"):
+            if cos_key is None and cos_configured():
+                extension = get_file_extension_from_url(result["data"][0].get("url", ""))
+                cos_key = f"jimeng/{sanitize_filename(prompt)}_{job_id[:8]}.{extension}"
+            await job_store.mark_generated(job_id, result, cos_key)
+    
+    if result is None:
+        result = {
+            "error": "无法连接到即梦API服务",
+            "retryable": True
+        }
+    
+    return await record_job_outcome(job_id, await format_generation_result(
+        result, prompt, model, width, height, dedup_images, cos_key,
+        negative_prompt=negative_prompt, sample_strength=sample_strength
+    ))
+
+async def record_job_outcome(job_id: Optional[str], outcome: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将任务的结果写入持久化任务表
+
+    超时、连接失败、5xx等可重试的错误不标记任务失败，只记录错误信息，租约释放后由恢复流程重新执行
+    """
+    if job_store is not None and job_id:
+        if "error" in outcome and outcome.get("retryable"):
+            await job_store.record_error(job_id, str(outcome["error"]))
+        elif "error" in outcome:
+            await job_store.fail(job_id, str(outcome["error"]))
+        else:
+            await job_store.complete(job_id, outcome)
+    return outcome
+
+async def request_image_generation(
+    prompt: str,
+    model: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    sample_strength: float,
+    priority: str = PRIORITY_INTERACTIVE
+) -> Optional[Dict[str, Any]]:
+    """调用即梦API生成图片，返回上游的原始响应"""
     # 构建请求数据
     request_data = {
         "model": model,
@@ -263,17 +751,45 @@ async def generate_images(
         "sample_strength": sample_strength
     }
     
+    # 相同请求近期被上游确定性拒绝时直接返回原错误，不再排队
+    negative_key = request_key(**request_data)
+    if negative_cache is not None:
+        cached_error = negative_cache.get(negative_key)
+        if cached_error is not None:
+            return cached_error
+    
     # 调用即梦API
     url = f"{JIMENG_API_BASE}/v1/images/generations"
-    result = await make_jimeng_request(url, request_data, JIMENG_SESSION_ID)
-    
-    if result is None:
-        return json.dumps({
-            "error": "无法连接到即梦API服务"
-        }, ensure_ascii=False, indent=2)
-    
+    async with AsyncExitStack() as stack:
+        async with progress_stage(STAGE_QUEUED):
+            await stack.enter_async_context(upstream_scheduler.slot(priority))
+        # 生成阶段的进度按该模型/尺寸最近的中位耗时估算
+        expected = model_latency.model_stats(model, width, height)["latency_p50"]
+        async with progress_stage(STAGE_GENERATING, expected):
+            started_at = time.monotonic()
+            result = await make_jimeng_request(url, request_data, JIMENG_SESSION_ID)
+    model_latency.record(
+        model, width, height, time.monotonic() - started_at,
+        bool(result) and "error" not in result
+    )
+    if negative_cache is not None:
+        negative_cache.record(negative_key, result)
+    return result
+
+async def format_generation_result(
+    result: Dict[str, Any],
+    prompt: str,
+    model: str,
+    width: int,
+    height: int,
+    dedup_images: bool = False,
+    cos_key: Optional[str] = None,
+    negative_prompt: str = "",
+    sample_strength: Optional[float] = None
+) -> Dict[str, Any]:
+    """上传上游返回的图片并格式化结果"""
     if "error" in result:
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        return result
     
     # 格式化响应，提取关键信息
     if "data" in result and len(result["data"]) > 0:
@@ -297,7 +813,9 @@ async def generate_images(
             cos_url = None
             
             if TENCENT_CLOUD_SECRET_ID and TENCENT_COS_AVAILABLE:
-                cos_url = await upload_to_tencent_cos(original_url, prompt)
+                cos_url = await upload_to_tencent_cos(
+                    original_url, prompt, dedup=dedup_images, key=cos_key
+                )
                 if cos_url:
                     final_url = cos_url
             
@@ -307,6 +825,13 @@ async def generate_images(
                 "description": f"基于提示词'{prompt}'生成的图片 #{i}"
             }
             
+            # 图片已在本地缓存时，客户端可直接通过MCP资源读取内容
+            if not cos_url:
+                await cache_original_image(original_url)
+            resource_uri = cached_resource_uri(cos_url, original_url)
+            if resource_uri:
+                image_info["resource_uri"] = resource_uri
+            
             # 如果上传到了腾讯云COS，添加相关信息
             if cos_url:
                 #image_info["original_url"] = original_url
@@ -317,20 +842,733 @@ async def generate_images(
             
             formatted_result["images"].append(image_info)
         
-        return json.dumps(formatted_result, ensure_ascii=False, indent=2)
+        # 记录到提示词索引，供后续相似请求复用；上游链接会过期，只记录已存入COS的结果。
+        # 签名计算和持久化文件的追加、重写在线程池中执行
+        if result_stored_in_cos(formatted_result):
+            await asyncio.get_running_loop().run_in_executor(None, lambda: prompt_index.add(
+                prompt, model, width, height, formatted_result,
+                negative_prompt=negative_prompt, sample_strength=sample_strength
+            ))
+        
+        return formatted_result
     else:
-        return json.dumps({
+        return {
             "error": "API返回了空的图片数据",
             "raw_response": result
+        }
+
+async def complete_placeholder_job(
+    job_id: str,
+    prompt: str,
+    model: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    sample_strength: float,
+    cos_key: Optional[str],
+    priority: str = PRIORITY_INTERACTIVE,
+    callback_url: str = ""
+) -> None:
+    """后台生成真实图片，上传后覆盖占位图所在的Key"""
+    job = placeholder_jobs.get(job_id, {})
+    try:
+        if job_store is not None:
+            result = await run_durable_job(job_id)
+        else:
+            # 覆盖固定Key时不做去重，否则占位图将不会被替换
+            result = await generate_image_result(
+                prompt, model, negative_prompt, width, height, sample_strength,
+                cos_key=cos_key, priority=priority
+            )
+    except Exception as e:
+        result = {"error": f"后台生成异常: {str(e)}"}
+    
+    if result.get("status") == "pending":
+        # 持久化任务已由恢复流程接手执行
+        return
+    job["status"] = "failed" if "error" in result else "done"
+    job["result"] = result
+    if job_store is None:
+        # 持久化任务在 run_durable_job 中发送回调
+        notify_completion(callback_url, job_id, result)
+
+async def start_placeholder_generation(
+    prompt: str,
+    model: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    sample_strength: float,
+    priority: str = PRIORITY_INTERACTIVE,
+    callback_url: str = ""
+) -> Dict[str, Any]:
+    """
+    立即返回本地渲染的占位图，同时在后台生成真实图片
+    
+    配置了腾讯云COS时占位图上传到固定Key，真实图片生成后覆盖该Key，URL保持不变；
+    否则返回内联的占位图，真实结果通过 get_generation_result 查询或由 callback_url 接收
+    """
+    job_id = uuid.uuid4().hex
+    svg = render_placeholder_svg(width, height, prompt)
+    
+    cos_key = None
+    placeholder_url = None
+    if TENCENT_CLOUD_SECRET_ID and TENCENT_COS_AVAILABLE:
+        cos_key = f"jimeng/live/{sanitize_filename(prompt)}_{job_id[:8]}"
+        placeholder_url = await upload_bytes_to_tencent_cos(svg, cos_key, "image/svg+xml")
+        if not placeholder_url:
+            cos_key = None
+    if not placeholder_url:
+        placeholder_url = "data:image/svg+xml;base64," + base64.b64encode(svg).decode("ascii")
+    
+    placeholder_jobs[job_id] = {"status": "pending", "placeholder_url": placeholder_url}
+    if job_store is not None:
+        await job_store.create(job_id, "placeholder", {
+            "request": generation_request(
+                prompt, model, negative_prompt, width, height, sample_strength,
+                cos_key=cos_key, priority=priority
+            ),
+            "placeholder_url": placeholder_url,
+            "callback_url": callback_url
+        })
+    while len(placeholder_jobs) > MAX_PLACEHOLDER_JOBS:
+        placeholder_jobs.popitem(last=False)
+    
+    task = asyncio.create_task(complete_placeholder_job(
+        job_id, prompt, model, negative_prompt, width, height, sample_strength, cos_key, priority,
+        callback_url
+    ))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    
+    return {
+        "model_used": model,
+        "job_id": job_id,
+        "status": "pending",
+        "images": [{
+            "url": placeholder_url,
+            "description": f"基于提示词'{prompt}'的临时占位图，真实图片生成中",
+            "placeholder": True,
+            "blurhash": placeholder_blurhash(width, height, prompt),
+            "lqip": render_lqip_data_uri(prompt)
+        }],
+        "help": "真实图片生成后会覆盖同一COS地址；也可调用 get_generation_result 查询结果"
+    }
+
+def generation_request(
+    prompt: str,
+    model: str,
+    negative_prompt: str,
+    width: int,
+    height: int,
+    sample_strength: float,
+    dedup_images: bool = False,
+    cos_key: Optional[str] = None,
+    priority: str = PRIORITY_INTERACTIVE
+) -> Dict[str, Any]:
+    """持久化任务保存的生成参数，与 generate_image_result 的参数一致"""
+    return {
+        "prompt": prompt,
+        "model": model,
+        "negative_prompt": negative_prompt,
+        "width": width,
+        "height": height,
+        "sample_strength": sample_strength,
+        "dedup_images": dedup_images,
+        "cos_key": cos_key,
+        "priority": priority
+    }
+
+def durable_job_id(idempotency_key: str = "") -> str:
+    """幂等键相同的请求对应同一个任务，未指定时生成新的任务ID"""
+    if idempotency_key:
+        return hashlib.sha256(idempotency_key.encode("utf-8")).hexdigest()[:32]
+    return uuid.uuid4().hex
+
+def job_status_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """将持久化任务转换为 get_generation_result 的返回格式"""
+    view: Dict[str, Any] = {"status": job["status"] if job["status"] in (STATUS_DONE, STATUS_FAILED) else "pending"}
+    if job["params"].get("placeholder_url"):
+        view["placeholder_url"] = job["params"]["placeholder_url"]
+    if job["status"] == STATUS_DONE:
+        view["result"] = job["result"]
+    elif job["status"] == STATUS_FAILED:
+        view["result"] = {"error": job["error"]}
+    elif job["error"]:
+        # 等待自动重试的任务附带上次执行的错误
+        view["last_error"] = job["error"]
+    return view
+
+def pending_job_view(job_id: str, message: str, last_error: Optional[str] = None) -> Dict[str, Any]:
+    """任务尚未结束（执行中或等待自动重试）时返回给调用方的结果，不包含 error 字段"""
+    view = {
+        "job_id": job_id,
+        "status": "pending",
+        "message": message,
+        "help": "请稍后通过 get_generation_result 查询结果"
+    }
+    if last_error:
+        view["last_error"] = last_error
+    return view
+
+async def run_durable_job(job_id: str) -> Dict[str, Any]:
+    """
+    持有租约执行（或恢复）持久化任务，任务已完成时直接返回保存的结果
+
+    任务未结束（其他请求正在执行，或连接失败等待恢复流程重试）时返回 pending 状态
+    """
+    async with job_store.lease(job_id) as acquired:
+        job = await job_store.get(job_id)
+        if job is None:
+            return {"error": f"任务不存在: {job_id}"}
+        if not acquired:
+            if job["status"] == STATUS_DONE:
+                return job["result"]
+            if job["status"] == STATUS_FAILED:
+                return {"error": job["error"], "job_id": job_id}
+            return pending_job_view(job_id, "任务正在执行中")
+        result = await generate_image_result(**job["params"]["request"], job_id=job_id)
+        job = await job_store.get(job_id)
+        if job["status"] not in (STATUS_DONE, STATUS_FAILED) and job["attempts"] >= job_store.max_attempts:
+            # 最后一次重试仍未成功，标记失败并通知调用方
+            await job_store.fail(job_id, f"超过最大重试次数: {job['error'] or result.get('error')}")
+            job = await job_store.get(job_id)
+            result = {"error": job["error"], "job_id": job_id}
+        if job["status"] not in (STATUS_DONE, STATUS_FAILED):
+            # 未写入最终结果的任务由恢复流程重新执行，不能告诉调用方已失败
+            return pending_job_view(job_id, "本次执行未完成，任务将自动重试", result.get("error"))
+        # 任务结束时发送回调（包括重启后恢复执行的任务）
+        notify_completion(job["params"].get("callback_url", ""), job_id, result)
+        return result
+
+async def resume_jobs_loop() -> None:
+    """定期恢复无租约或租约已过期的未完成任务（包括重启前中断的任务），并清理过期记录"""
+    while True:
+        try:
+            for job in await job_store.resumable():
+                print(f"恢复未完成的生成任务: {job['id']} ({job['status']})")
+                task = asyncio.create_task(run_durable_job(job["id"]))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+            await job_store.purge(JOB_RETENTION_DAYS * 86400)
+        except Exception as e:
+            print(f"恢复生成任务失败: {str(e)}")
+        await asyncio.sleep(JOB_LEASE_SECONDS / 2)
+
+def notify_completion(callback_url: str, job_id: Optional[str], result: Dict[str, Any]) -> None:
+    """生成结果确定后向调用方的回调地址投递通知（不等待投递完成）"""
+    # 恢复执行的任务可能是在设置密钥时提交的，重启后未设置密钥时不发送未签名的通知
+    if not callback_url or not WEBHOOK_SECRET:
+        return
+    event = EVENT_FAILED if "error" in result else EVENT_COMPLETED
+    webhooks.submit(callback_url, event, {"job_id": job_id, "result": refresh_result_urls(result)})
+
+def with_model_selection(result: Dict[str, Any], selection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """model为auto时在返回结果中附加所选模型及原因"""
+    if selection is None:
+        return result
+    result = dict(result)
+    result["model_selection"] = selection
+    return result
+
+async def close_shared_clients() -> None:
+    """关闭按需创建的即梦API连接池和COS传输引擎，供未经生命周期直接调用生成流程的脚本退出前使用"""
+    global _cos_engine, _jimeng_client
+    if _jimeng_client is not None:
+        await _jimeng_client.aclose()
+        _jimeng_client = None
+    if _cos_engine is not None:
+        await _cos_engine.close()
+        _cos_engine = None
+
+async def generate_site_asset(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """生成清单中的一个条目，以批量优先级排队，不阻塞交互式请求"""
+    model = spec["model"]
+    if model == AUTO_MODEL:
+        model = model_latency.select(AUTO_MODEL_ORDER, spec["width"], spec["height"], AUTO_MODEL_LATENCY_SLO)["model"]
+    return await generate_image_result(
+        spec["prompt"], model, spec["negative_prompt"], spec["width"], spec["height"],
+        spec["sample_strength"], priority=PRIORITY_BULK
+    )
+
+def site_asset_builder(concurrency: int = 0) -> SiteAssetBuilder:
+    """按清单增量生成网站图片的构建器，清单未指定的参数使用服务器默认值"""
+    return SiteAssetBuilder(
+        generate_site_asset,
+        {
+            "model": DEFAULT_MODEL,
+            "width": DEFAULT_WIDTH,
+            "height": DEFAULT_HEIGHT,
+            "sample_strength": DEFAULT_SAMPLE_STRENGTH
+        },
+        concurrency=concurrency or SITE_ASSETS_CONCURRENCY,
+        models=AVAILABLE_MODELS + [AUTO_MODEL],
+        cos_key=lambda image: cos_key_from_stored_url(image["cos_url"]) if image.get("cos_url") else None,
+        resolve_url=resolve_cos_url,
+        url_ttl=SITE_ASSETS_URL_TTL
+    )
+
+async def cancel_task(task: asyncio.Task) -> None:
+    """取消后台任务并等待其结束"""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+# 占位图池直接复用生成流程，补充的图片同样会记录到提示词索引
+placeholder_pool = PlaceholderPool(
+    lambda prompt, model, width, height: generate_image_result(
+        prompt, model, "", width, height, DEFAULT_SAMPLE_STRENGTH, priority=PRIORITY_BULK
+    ),
+    load_pool_specs(PLACEHOLDER_POOL_SPEC, DEFAULT_MODEL),
+    target_size=PLACEHOLDER_POOL_SIZE,
+    refill_concurrency=PLACEHOLDER_POOL_CONCURRENCY,
+    accept=result_stored_in_cos
+)
+
+@mcp.tool()
+@tool_profiler.wrap
+@reports_progress(PROGRESS_INTERVAL)
+async def generate_images(
+    prompt: str,
+    model: str = DEFAULT_MODEL,
+    negative_prompt: str = "",
+    width: int = DEFAULT_WIDTH,
+    height: int = DEFAULT_HEIGHT,
+    sample_strength: float = DEFAULT_SAMPLE_STRENGTH,
+    reuse_similar: float = 0.0,
+    dedup_images: bool = False,
+    instant_placeholder: bool = False,
+    priority: str = PRIORITY_INTERACTIVE,
+    idempotency_key: str = "",
+    latency_slo: float = AUTO_MODEL_LATENCY_SLO,
+    callback_url: str = "",
+    ctx: Context = None
+) -> str:
+    """
+    生成AI图片，适用于网站开发中的图片设计和占位填充
+    
+    Args:
+        prompt: 图片描述提示词，必填。例如："少女祈祷中..."、"现代办公室背景"、"产品展示图"等
+        model: 模型选择，可选值：jimeng-3.1(默认)、jimeng-2.1、jimeng-2.0-pro、jimeng-2.0、jimeng-1.4、jimeng-xl-pro，
+            或auto(按当前各模型的生成耗时自动选择满足 latency_slo 的质量最高的模型)
+        negative_prompt: 反向提示词，描述不想要的元素，默认为空
+        width: 图片宽度，默认1024像素
+        height: 图片高度，默认1024像素  
+        sample_strength: 精细度，取值范围0-1，默认0.5
+        reuse_similar: 相似提示词复用阈值，取值范围0-1，默认0表示不复用。
+            大于0时，若存在尺寸和模型一致且相似度不低于该值的历史提示词，直接返回其图片
+        dedup_images: 上传COS前是否按感知哈希去重，为True时视觉上近似的图片直接返回已有对象，默认False
+        instant_placeholder: 是否立即返回本地渲染的占位图，真实图片在后台生成后覆盖同一地址，默认False
+        priority: 调度优先级，interactive(默认，交互式单次请求)或bulk(批量任务)
+        idempotency_key: 幂等键，可选。启用持久化任务队列时，相同幂等键的重复调用返回同一任务的结果，
+            服务器重启后重试不会重复生成
+        latency_slo: model为auto时的生成耗时目标(秒)，按最近的p95耗时判断，0表示只按质量和失败率选择
+        callback_url: 回调地址，可选。生成和COS上传完成（或失败）后服务器向该地址POST带签名的JSON结果，
+            服务器需要设置WEBHOOK_SECRET，适合配合 instant_placeholder 使用，无需轮询 get_generation_result
+    
+    Returns:
+        包含4个图片链接的JSON字符串，每次调用返回4个不同的图片供选择
+    """
+    
+    # 从环境变量获取session_id
+    if JIMENG_SESSION_ID is None:
+        return json.dumps({
+            "error": "环境变量JIMENG_SESSION_ID未设置",
+            "help": "请在.env文件中设置JIMENG_SESSION_ID环境变量"
+        }, ensure_ascii=False, indent=2)
+    
+    # 验证模型参数
+    if model != AUTO_MODEL and model not in AVAILABLE_MODELS:
+        return json.dumps({
+            "error": f"不支持的模型: {model}",
+            "available_models": AVAILABLE_MODELS + [AUTO_MODEL]
+        }, ensure_ascii=False, indent=2)
+    
+    # 验证参数范围
+    if not (0 <= sample_strength <= 1):
+        return json.dumps({
+            "error": "sample_strength 必须在 0-1 范围内"
         }, ensure_ascii=False, indent=2)
+    
+    if width <= 0 or height <= 0:
+        return json.dumps({
+            "error": "图片尺寸必须大于0"
+        }, ensure_ascii=False, indent=2)
+    
+    if not (0 <= reuse_similar <= 1):
+        return json.dumps({
+            "error": "reuse_similar 必须在 0-1 范围内"
+        }, ensure_ascii=False, indent=2)
+    
+    if priority not in DEFAULT_WEIGHTS:
+        return json.dumps({
+            "error": f"不支持的优先级: {priority}",
+            "available_priorities": list(DEFAULT_WEIGHTS)
+        }, ensure_ascii=False, indent=2)
+    
+    if callback_url:
+        if not WEBHOOK_SECRET:
+            # 未签名的回调无法让接收方确认来源，任何人都能伪造生成结果
+            return json.dumps({
+                "error": "未设置回调签名密钥，不接受callback_url",
+                "help": "请设置环境变量WEBHOOK_SECRET"
+            }, ensure_ascii=False, indent=2)
+        callback_error = await validate_callback_url(
+            callback_url, WEBHOOK_ALLOWED_HOSTS, WEBHOOK_ALLOW_PRIVATE
+        )
+        if callback_error:
+            return json.dumps({"error": callback_error}, ensure_ascii=False, indent=2)
+    
+    # 自动选择模型，选择结果附加在返回值中
+    selection = None
+    if model == AUTO_MODEL:
+        selection = model_latency.select(AUTO_MODEL_ORDER, width, height, latency_slo)
+        model = selection["model"]
+    
+    # 查找可复用的相似提示词结果
+    if reuse_similar > 0:
+        match = prompt_index.lookup(
+            prompt, model, width, height, reuse_similar,
+            negative_prompt=negative_prompt, sample_strength=sample_strength,
+            accept=result_stored_in_cos
+        )
+        if match:
+            reused_result = dict(refresh_result_urls(match["result"]))
+            reused_result["reused_from"] = {
+                "prompt": match["prompt"],
+                "similarity": match["similarity"]
+            }
+            notify_completion(callback_url, None, reused_result)
+            return json.dumps(with_model_selection(reused_result, selection), ensure_ascii=False, indent=2)
+    
+    if instant_placeholder:
+        result = await start_placeholder_generation(
+            prompt, model, negative_prompt, width, height, sample_strength, priority,
+            callback_url
+        )
+        return json.dumps(with_model_selection(result, selection), ensure_ascii=False, indent=2)
+    
+    if job_store is not None:
+        # 持久化任务：记录每个步骤的进度，重启后可恢复
+        job_id = durable_job_id(idempotency_key)
+        await job_store.create(job_id, "generate", {"request": generation_request(
+            prompt, model, negative_prompt, width, height, sample_strength, dedup_images,
+            priority=priority
+        ), "callback_url": callback_url})
+        result = refresh_result_urls(await run_durable_job(job_id))
+        return json.dumps(with_model_selection(result, selection), ensure_ascii=False, indent=2)
+    
+    result = await generate_image_result(
+        prompt, model, negative_prompt, width, height, sample_strength, dedup_images,
+        priority=priority
+    )
+    notify_completion(callback_url, None, result)
+    return json.dumps(with_model_selection(result, selection), ensure_ascii=False, indent=2)
+
+@mcp.tool()
+@tool_profiler.wrap
+async def get_generation_result(job_id: str) -> str:
+    """
+    查询即时占位图对应的后台生成结果
+    
+    Args:
+        job_id: generate_images 在 instant_placeholder 模式下返回的任务ID，
+            启用持久化任务队列时也可以查询执行中被中断的任务
+    
+    Returns:
+        任务状态(pending/done/failed)及生成结果的JSON字符串
+    """
+    stored = await job_store.get(job_id) if job_store is not None else None
+    job = job_status_view(stored) if stored is not None else placeholder_jobs.get(job_id)
+    if job is None:
+        return json.dumps({
+            "error": f"任务不存在或已过期: {job_id}"
+        }, ensure_ascii=False, indent=2)
+    
+    job = dict(job, job_id=job_id)
+    if "result" in job:
+        job["result"] = refresh_result_urls(job["result"])
+    return json.dumps(job, ensure_ascii=False, indent=2)
 
 @mcp.tool()
+@tool_profiler.wrap
+@reports_progress(PROGRESS_INTERVAL)
+async def get_placeholder(
+    category: str,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    model: Optional[str] = None,
+    ctx: Context = None
+) -> str:
+    """
+    从预生成池中立即获取一张常用占位图，取用后后台自动补充
+    
+    Args:
+        category: 占位图类别，例如：web_header、office_background、product_image、thumbnail、mobile_banner
+        width: 图片宽度，可选，不指定时匹配该类别的任意尺寸
+        height: 图片高度，可选，不指定时匹配该类别的任意尺寸
+        model: 模型，可选，不指定时匹配该类别的任意模型
+    
+    Returns:
+        图片结果的JSON字符串，from_pool 表示是否直接取自预生成池
+    """
+    if JIMENG_SESSION_ID is None:
+        return json.dumps({
+            "error": "环境变量JIMENG_SESSION_ID未设置",
+            "help": "请在.env文件中设置JIMENG_SESSION_ID环境变量"
+        }, ensure_ascii=False, indent=2)
+    
+    spec = placeholder_pool.find_spec(category, width, height, model)
+    if spec is None:
+        return json.dumps({
+            "error": f"没有匹配的占位图类别: {category}",
+            "available_categories": placeholder_pool.categories
+        }, ensure_ascii=False, indent=2)
+    
+    result = placeholder_pool.pop(spec)
+    if result is not None:
+        return json.dumps(dict(refresh_result_urls(result), from_pool=True), ensure_ascii=False, indent=2)
+    
+    # 池为空（未启用或尚未补充完成）时直接生成
+    result = await generate_image_result(
+        spec["prompt"], spec["model"], "", spec["width"], spec["height"], DEFAULT_SAMPLE_STRENGTH
+    )
+    if "error" not in result:
+        result = dict(result, from_pool=False)
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+@tool_profiler.wrap
+async def build_site_assets(
+    manifest_path: str,
+    output_path: str = "",
+    force: bool = False,
+    dry_run: bool = False
+) -> str:
+    """
+    按网站图片清单(YAML/JSON)增量生成图片，只重新生成规格有变化的条目，并写出资源ID到图片URL的映射文件
+    
+    Args:
+        manifest_path: 清单文件路径，列出每张图片的 id、prompt，以及可选的 width、height、model、negative_prompt、sample_strength
+        output_path: 映射文件路径，可选，默认使用清单中的 output 或 {清单名}.assets.json
+        force: 是否忽略上次的结果重新生成所有条目，默认False
+        dry_run: 是否只列出需要生成的条目而不生成，默认False
+    
+    Returns:
+        构建报告的JSON字符串：新生成、未变化、失败和已移除的条目，以及资源ID到URL的映射
+    """
+    if JIMENG_SESSION_ID is None and not dry_run:
+        return json.dumps({
+            "error": "环境变量JIMENG_SESSION_ID未设置",
+            "help": "请在.env文件中设置JIMENG_SESSION_ID环境变量"
+        }, ensure_ascii=False, indent=2)
+    
+    try:
+        report = await site_asset_builder().build(
+            manifest_path, output_path or None, force=force, dry_run=dry_run
+        )
+    except (OSError, ValueError, RuntimeError) as e:
+        return json.dumps({
+            "error": f"读取清单失败: {str(e)}"
+        }, ensure_ascii=False, indent=2)
+    
+    return json.dumps(report, ensure_ascii=False, indent=2)
+
+def forget_deleted_objects(keys: List[str]) -> None:
+    """对象被清理后同步移除索引中的引用和缓存的签名（会重写索引文件，由 collect_garbage 在线程池中调用）"""
+    deleted = set(keys)
+    prompt_index.remove_where(lambda result: any(
+        key in deleted for key in result_cos_keys(result)
+    ))
+    image_dedup_index.remove_keys(deleted)
+    if TENCENT_COS_PRIVATE:
+        presigned_urls = get_presigned_urls()
+        for key in deleted:
+            presigned_urls.invalidate(key)
+
+def unreferenced_gc_blocker() -> Optional[str]:
+    """
+    检查能否按引用关系清理COS对象，不能时返回原因
+
+    未持久化或尚未加载的索引只记录了本次运行以来的对象，据此清理会误删仍在使用的图片
+    """
+    if not PROMPT_INDEX_PATH or not IMAGE_HASH_INDEX_PATH:
+        return "按引用关系清理需要设置 PROMPT_INDEX_PATH 和 IMAGE_HASH_INDEX_PATH 持久化历史记录"
+    if not prompt_index.loaded or not image_dedup_index.loaded:
+        return "历史记录尚未加载完成或加载失败，不能按引用关系清理"
+    if not prompt_index.history_complete:
+        return ("提示词索引设置了有效期(PROMPT_INDEX_TTL)或已淘汰、替换过历史记录，"
+                "被丢弃记录中的图片可能仍在使用，不能按引用关系清理，请改用 older_than_days")
+    missing = [path for path in COS_GC_ASSET_MAPS if not os.path.exists(path)]
+    if missing:
+        return f"网站图片映射文件不存在: {', '.join(missing)}"
+    return None
+
+async def collect_referenced_keys() -> Set[str]:
+    """
+    汇总所有记录了COS对象的存储中仍被引用的Key
+
+    包括提示词索引、图片去重索引、持久化任务表（结果、上传Key和实时占位图Key）、
+    占位图池中的就绪图片，以及 COS_GC_ASSET_MAPS 中的网站图片映射。
+    提示词索引记录了所有存入COS的生成结果，调用前需确认其历史记录完整（见 unreferenced_gc_blocker）
+    """
+    referenced = image_dedup_index.keys()
+    results = prompt_index.results() + placeholder_pool.results()
+    if job_store is not None:
+        for job in await job_store.retained():
+            if job["result"]:
+                results.append(job["result"])
+            for key in (job["upload_key"], job["params"].get("cos_key")):
+                if key:
+                    referenced.add(key)
+    for result in results:
+        referenced.update(result_cos_keys(result))
+    
+    loop = asyncio.get_event_loop()
+    for path in COS_GC_ASSET_MAPS:
+        assets = await loop.run_in_executor(None, load_asset_map, path)
+        for entry in assets.values():
+            if entry.get("cos_key"):
+                referenced.add(entry["cos_key"])
+            elif entry.get("cos_url"):
+                referenced.add(cos_key_from_stored_url(entry["cos_url"]))
+    return referenced
+
+def register_image_resource(extension: str, content_type: str) -> None:
+    """
+    为一种图片格式注册资源模板 jimeng://image/{hash}.{扩展名}
+
+    FastMCP的资源MIME类型按模板声明，每种格式单独注册，返回的MIME类型与缓存中保存的图片格式一致
+    """
+    async def get_cached_image(image_hash: str) -> bytes:
+        if image_cache is None:
+            raise ValueError("未启用本地图片缓存 (IMAGE_CACHE_DIR)")
+        loop = asyncio.get_event_loop()
+        cached = await loop.run_in_executor(None, image_cache.read, image_hash)
+        if cached is None or cached[1] != content_type:
+            raise ValueError(f"图片不在本地缓存中: {image_hash}.{extension}")
+        return cached[0]
+
+    mcp.resource(
+        f"{RESOURCE_URI_PREFIX}{{image_hash}}.{extension}",
+        name=f"cached_image_{extension}",
+        description=f"读取本地缓存中的生成图片（生成结果中的 resource_uri），格式为 {content_type}",
+        mime_type=content_type
+    )(get_cached_image)
+
+for _extension, _content_type in CONTENT_TYPES.items():
+    register_image_resource(_extension, _content_type)
+
+@mcp.tool()
+@tool_profiler.wrap
+async def cleanup_cos_objects(
+    older_than_days: float = 0,
+    unreferenced: bool = False,
+    dry_run: bool = True,
+    prefix: str = "jimeng/"
+) -> str:
+    """
+    清理COS中过期或不再被引用的生成图片（需设置COS_GC_ADMIN=true）
+    
+    Args:
+        older_than_days: 删除早于该天数的对象，0表示不按时间清理
+        unreferenced: 删除未被历史记录（提示词索引、图片去重索引、任务表、占位图池、网站图片映射）引用的对象，
+            需要持久化历史记录，刚上传的对象会保留一段时间
+        dry_run: 只列出将被清理的对象而不删除，默认为True
+        prefix: 清理的对象前缀，默认为jimeng/
+    
+    Returns:
+        扫描数量、匹配数量、释放字节数，以及待清理对象列表(dry_run)或删除结果的JSON字符串
+    """
+    if not COS_GC_ADMIN:
+        return json.dumps({
+            "error": "未开启COS清理管理功能",
+            "help": "请设置环境变量COS_GC_ADMIN=true"
+        }, ensure_ascii=False, indent=2)
+    
+    if not cos_configured():
+        return json.dumps({
+            "error": "腾讯云COS未配置"
+        }, ensure_ascii=False, indent=2)
+    
+    if older_than_days < 0:
+        return json.dumps({
+            "error": "older_than_days 不能为负数"
+        }, ensure_ascii=False, indent=2)
+    
+    if older_than_days == 0 and not unreferenced:
+        return json.dumps({
+            "error": "请指定 older_than_days 或 unreferenced"
+        }, ensure_ascii=False, indent=2)
+    
+    referenced_keys = None
+    if unreferenced:
+        blocker = unreferenced_gc_blocker()
+        if blocker:
+            return json.dumps({
+                "error": blocker
+            }, ensure_ascii=False, indent=2)
+    
+    try:
+        if unreferenced:
+            referenced_keys = await collect_referenced_keys()
+        result = await collect_garbage(
+            get_cos_client(),
+            TENCENT_COS_BUCKET,
+            prefix=prefix,
+            ttl_seconds=older_than_days * 86400 if older_than_days > 0 else None,
+            referenced_keys=referenced_keys,
+            grace_seconds=COS_GC_GRACE_SECONDS,
+            dry_run=dry_run,
+            concurrency=COS_DELETE_CONCURRENCY,
+            executor=get_cos_engine().executor,
+            on_deleted=forget_deleted_objects
+        )
+    except CosServiceError as e:
+        return json.dumps({
+            "error": f"腾讯云COS服务错误: {e.get_error_code()} - {e.get_error_msg()}"
+        }, ensure_ascii=False, indent=2)
+    except Exception as e:
+        return json.dumps({
+            "error": f"清理失败: {str(e)}"
+        }, ensure_ascii=False, indent=2)
+    
+    return json.dumps(result, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+@tool_profiler.wrap
+async def get_server_status() -> str:
+    """
+    查询服务器当前负载
+    
+    Returns:
+        包含上游各优先级排队统计、图片字节预算使用/等待统计、事件循环延迟和连接保活状态的JSON字符串
+    """
+    status = {
+        "upstream": upstream_scheduler.stats(),
+        "byte_budget": byte_budget.stats()
+    }
+    if LOOP_MONITOR:
+        status["event_loop"] = loop_monitor.stats()
+    if job_store is not None:
+        status["jobs"] = await job_store.stats()
+    if connection_warmer is not None:
+        status["connections"] = connection_warmer.stats()
+    if image_cache is not None:
+        status["image_cache"] = image_cache.stats()
+    if negative_cache is not None:
+        status["negative_cache"] = negative_cache.stats()
+    status["webhooks"] = webhooks.stats()
+    
+    return json.dumps(status, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+@tool_profiler.wrap
 async def list_available_models() -> str:
     """
     列出所有可用的即梦图片生成模型
     
     Returns:
-        可用模型列表的JSON字符串，包含模型名称和描述
+        可用模型列表的JSON字符串，包含模型名称、描述以及最近的生成耗时和失败率
     """
     models_info = {
         "available_models": [
@@ -365,12 +1603,25 @@ async def list_available_models() -> str:
             }
         ],
         "default_model": DEFAULT_MODEL,
-        "usage_note": "选择模型时请考虑图片质量需求和生成时间的平衡"
+        "usage_note": "选择模型时请考虑图片质量需求和生成时间的平衡",
+        "auto_selection": {
+            "usage": "model设为auto时，按质量顺序选择最近p95生成耗时不超过latency_slo且失败率可接受的模型",
+            "quality_order": AUTO_MODEL_ORDER,
+            "default_latency_slo": AUTO_MODEL_LATENCY_SLO,
+            "max_error_rate": model_latency.max_error_rate,
+            "stats_window_seconds": model_latency.window_seconds
+        }
     }
     
+    # 附加最近的生成耗时(秒)和失败率统计
+    for model_info in models_info["available_models"]:
+        model_info["recent_stats"] = model_latency.model_stats(model_info["name"])
+        model_info["recent_stats_by_size"] = model_latency.size_stats(model_info["name"])
+    
     return json.dumps(models_info, ensure_ascii=False, indent=2)
 
 @mcp.tool()
+@tool_profiler.wrap
 async def get_generation_tips() -> str:
     """
     获取图片生成的最佳实践建议
@@ -413,6 +1664,44 @@ async def get_generation_tips() -> str:
     
     return json.dumps(tips, ensure_ascii=False, indent=2)
 
+@mcp.tool()
+async def start_profiling(calls: int = 20, mode: str = "cprofile", memory: bool = False) -> str:
+    """
+    开启性能剖析，接下来的若干次工具调用完成后把结果写入服务器的剖析目录（需设置PROFILING_ADMIN=true）
+    
+    Args:
+        calls: 剖析的工具调用次数，默认20
+        mode: cprofile(默认，输出pstats文件和文本摘要) 或 sample(定时采样调用栈，输出speedscope格式)
+        memory: 是否同时用tracemalloc记录内存分配变化
+    
+    Returns:
+        剖析状态的JSON字符串
+    """
+    if not PROFILING_ADMIN:
+        return json.dumps({
+            "error": "未开启剖析管理功能",
+            "help": "请设置环境变量PROFILING_ADMIN=true"
+        }, ensure_ascii=False, indent=2)
+    
+    try:
+        status = tool_profiler.arm(calls, mode, memory)
+    except (ValueError, RuntimeError) as e:
+        return json.dumps({
+            "error": str(e)
+        }, ensure_ascii=False, indent=2)
+    
+    return json.dumps(status, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+async def get_profiling_status() -> str:
+    """
+    查询性能剖析进度和上一次剖析的结果文件
+    
+    Returns:
+        当前剖析进度和上一次结果(模式、调用次数、耗时、文件路径)的JSON字符串
+    """
+    return json.dumps(tool_profiler.status(), ensure_ascii=False, indent=2)
+
 if __name__ == "__main__":
     # 运行MCP服务器
     mcp.run(transport='stdio')
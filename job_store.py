@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+持久化生成任务队列
+
+使用SQLite(WAL模式)记录每个生成任务的参数和步骤进度：上游生成完成后立即保存
+上游返回的图片地址和确定的上传Key，上传完成后保存最终结果。进程重启后按步骤
+幂等恢复——已生成的任务只补做上传，不会重复调用上游。任务执行期间持有带过期时间
+的租约并定期续期，租约过期的任务可由任意进程接手。
+
+SQLite调用是同步的，全部在一个专用线程中串行执行，不阻塞事件循环。
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+STATUS_PENDING = "pending"
+STATUS_GENERATED = "generated"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    upstream TEXT,
+    upload_key TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+"""
+
+_JSON_COLUMNS = ("params", "upstream", "result")
+
+
+class JobStore:
+    """基于SQLite WAL的持久化任务表"""
+
+    def __init__(self, path: str, lease_seconds: float = 60.0, max_attempts: int = 3):
+        """
+        Args:
+            path: SQLite数据库文件路径
+            lease_seconds: 租约有效期(秒)，执行中的任务每隔三分之一有效期续期一次
+            max_attempts: 单个任务最多执行次数，超过后标记为失败
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute_sync(self, sql: str, args, fetch: Optional[str]) -> Any:
+        with self._lock:
+            cursor = self._conn.execute(sql, args)
+            if fetch == "one":
+                return cursor.fetchone()
+            if fetch == "all":
+                return cursor.fetchall()
+            return cursor.rowcount
+
+    async def _execute(self, sql: str, args=(), fetch: Optional[str] = None) -> Any:
+        """在专用线程中执行SQL，fetch 为 "one"/"all" 时返回查询结果，否则返回影响的行数"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, self._execute_sync, sql, args, fetch
+        )
+
+    @staticmethod
+    def _decode(row: Optional[sqlite3.Row]) -> Optional[Dict[str, Any]]:
+        if row is None:
+            return None
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    async def create(self, job_id: str, kind: str, params: Dict[str, Any]) -> bool:
+        """创建任务，任务已存在时不做修改并返回False"""
+        now = time.time()
+        rowcount = await self._execute(
+            "INSERT OR IGNORE INTO jobs (id, kind, params, status, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params, ensure_ascii=False), STATUS_PENDING, now, now)
+        )
+        return rowcount == 1
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """查询任务，不存在时返回None"""
+        return self._decode(await self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,), fetch="one"))
+
+    async def acquire(self, job_id: str) -> bool:
+        """获取未完成任务的租约，任务已有有效租约（包括本进程中正在执行）时返回False"""
+        now = time.time()
+        rowcount = await self._execute(
+            "UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+            "WHERE id = ? AND status NOT IN (?, ?) "
+            "AND (lease_owner IS NULL OR lease_expires < ?)",
+            (self.owner, now + self.lease_seconds, now, job_id,
+             STATUS_DONE, STATUS_FAILED, now)
+        )
+        return rowcount == 1
+
+    async def renew(self, job_id: str) -> None:
+        await self._execute(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ?",
+            (time.time() + self.lease_seconds, job_id, self.owner)
+        )
+
+    async def release(self, job_id: str) -> None:
+        await self._execute(
+            "UPDATE jobs SET lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ?",
+            (job_id, self.owner)
+        )
+
+    @asynccontextmanager
+    async def lease(self, job_id: str) -> AsyncIterator[bool]:
+        """持有任务租约期间在后台定期续期，返回是否获得租约"""
+        if not await self.acquire(job_id):
+            yield False
+            return
+
+        async def keep_alive() -> None:
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    await self.renew(job_id)
+                except sqlite3.Error as e:
+                    # 续期失败时继续执行，下次续期再试；租约过期后任务可能被其他进程接手
+                    print(f"任务租约续期失败 {job_id}: {str(e)}", file=sys.stderr)
+
+        renewer = asyncio.create_task(keep_alive())
+        try:
+            yield True
+        finally:
+            renewer.cancel()
+            await asyncio.gather(renewer, return_exceptions=True)
+            await self.release(job_id)
+
+    async def mark_generated(self, job_id: str, upstream: Dict[str, Any], upload_key: Optional[str]) -> None:
+        """保存上游生成结果和确定的上传Key，恢复时不再重复调用上游"""
+        await self._execute(
+            "UPDATE jobs SET status = ?, upstream = ?, upload_key = ?, updated_at = ? WHERE id = ?",
+            (STATUS_GENERATED, json.dumps(upstream, ensure_ascii=False), upload_key,
+             time.time(), job_id)
+        )
+
+    async def complete(self, job_id: str, result: Dict[str, Any]) -> None:
+        await self._execute(
+            "UPDATE jobs SET status = ?, result = ?, upstream = NULL, updated_at = ? WHERE id = ?",
+            (STATUS_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id)
+        )
+
+    async def record_error(self, job_id: str, error: str) -> None:
+        """记录可重试的错误，任务保持未完成状态，等待租约释放后重新执行"""
+        await self._execute(
+            "UPDATE jobs SET error = ?, updated_at = ? WHERE id = ?",
+            (error, time.time(), job_id)
+        )
+
+    async def fail(self, job_id: str, error: str) -> None:
+        await self._execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+            (STATUS_FAILED, error, time.time(), job_id)
+        )
+
+    async def resumable(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        返回可恢复的未完成任务（无租约或租约已过期）
+
+        执行次数已达上限的任务直接标记为失败
+        """
+        now = time.time()
+        await self._execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ? "
+            "WHERE status NOT IN (?, ?) AND attempts >= ? "
+            "AND (lease_owner IS NULL OR lease_expires < ?)",
+            (STATUS_FAILED, "超过最大重试次数", now, STATUS_DONE, STATUS_FAILED,
+             self.max_attempts, now)
+        )
+        rows = await self._execute(
+            "SELECT * FROM jobs WHERE status NOT IN (?, ?) "
+            "AND (lease_owner IS NULL OR lease_expires < ?) ORDER BY created_at LIMIT ?",
+            (STATUS_DONE, STATUS_FAILED, now, limit),
+            fetch="all"
+        )
+        return [self._decode(row) for row in rows]
+
+    async def retained(self) -> List[Dict[str, Any]]:
+        """返回已完成和进行中的任务（不含失败的任务），用于确定仍被引用的上传Key和结果中的图片"""
+        rows = await self._execute("SELECT * FROM jobs WHERE status != ?", (STATUS_FAILED,), fetch="all")
+        return [self._decode(row) for row in rows]
+
+    async def purge(self, older_than: float) -> int:
+        """删除早于指定时间(秒)完成或失败的任务"""
+        return await self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (STATUS_DONE, STATUS_FAILED, time.time() - older_than)
+        )
+
+    async def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        rows = await self._execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status", fetch="all")
+        return {row["status"]: row["count"] for row in rows}
+
+    def close(self) -> None:
+        """等待执行中的SQL完成后关闭数据库连接"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+事件循环延迟监控
+
+事件循环中的心跳任务定期休眠并测量实际唤醒时间与预期的差值（循环延迟）；
+独立的看门狗线程检查心跳是否按时更新，心跳停滞超过阈值时抓取事件循环线程
+当前的调用栈并输出，从而直接定位阻塞事件循环的同步调用。可选开启asyncio
+调试模式，由asyncio记录执行时间过长的回调。
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from percentiles import percentile
+
+
+class LoopLagMonitor:
+    """事件循环延迟度量与阻塞调用栈检测"""
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1,
+                 stack_limit: int = 30, stats_window: int = 600,
+                 asyncio_debug: bool = False):
+        """
+        Args:
+            interval: 心跳间隔(秒)
+            threshold: 循环延迟超过该值(秒)时视为阻塞并输出调用栈
+            stack_limit: 输出的调用栈最大帧数
+            stats_window: 保留的最近延迟样本数
+            asyncio_debug: 是否开启asyncio调试模式记录慢回调（有额外开销）
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stack_limit = stack_limit
+        self.asyncio_debug = asyncio_debug
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        self._last_beat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._lags: Deque[float] = deque(maxlen=stats_window)
+        self._blocks: Deque[Dict[str, Any]] = deque(maxlen=5)
+        self.max_lag = 0.0
+        self.slow_beats = 0
+        self.blocked_reports = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """在当前事件循环中启动监控（需在事件循环内调用）"""
+        if self.running:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if self.asyncio_debug:
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.threshold
+
+        self._last_beat = time.monotonic()
+        self._stopping = threading.Event()
+        self._task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(self._stopping,), name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def ensure_started(self) -> None:
+        """未运行时在当前事件循环中启动，用于无法使用生命周期的无状态服务器"""
+        if not self.running or self._loop is not asyncio.get_running_loop():
+            # 事件循环已更换时旧的心跳任务不会再运行，只需停止旧的看门狗线程
+            self._stopping.set()
+            self._task = None
+            self.start()
+
+    async def stop(self) -> None:
+        """停止心跳任务和看门狗线程"""
+        self._stopping.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._watchdog = None
+
+    async def _heartbeat(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self._lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.slow_beats += 1
+            self._last_beat = time.monotonic()
+
+    def _watch(self, stopping: threading.Event) -> None:
+        """看门狗线程：心跳停滞超过阈值时抓取事件循环线程的调用栈，每次阻塞只输出一次"""
+        check_interval = max(self.threshold / 2, 0.01)
+        while not stopping.wait(check_interval):
+            last_beat = self._last_beat
+            stalled = time.monotonic() - last_beat - self.interval
+            if stalled <= self.threshold or self._reported_beat == last_beat:
+                continue
+
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame, limit=self.stack_limit)
+            del frame
+
+            self._reported_beat = last_beat
+            self.blocked_reports += 1
+            self._blocks.append({
+                "detected_at": time.time(),
+                "stalled_seconds": round(stalled, 3),
+                "stack_top": [line.strip().splitlines()[0] for line in stack[-3:]]
+            })
+            print(
+                f"事件循环已阻塞 {stalled:.3f} 秒，事件循环线程当前调用栈:\n" + "".join(stack),
+                file=sys.stderr
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """循环延迟指标和最近检测到的阻塞"""
+        lags = list(self._lags)
+        blocks: List[Dict[str, Any]] = list(self._blocks)
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "lag_current": round(lags[-1], 4) if lags else 0.0,
+            "lag_p50": round(percentile(lags, 50), 4),
+            "lag_p95": round(percentile(lags, 95), 4),
+            "lag_p99": round(percentile(lags, 99), 4),
+            "lag_max": round(self.max_lag, 4),
+            "slow_beats": self.slow_beats,
+            "blocked_reports": self.blocked_reports,
+            "recent_blocks": blocks
+        }
@@ -6,14 +6,32 @@
 """
 
 import asyncio
+import importlib.util
 import json
 import os
 import sys
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 from typing import Any, Dict, List
 import httpx
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 from dotenv import load_dotenv
 
+from admission import AdmissionController, AdmissionRejected
+from graceful import GracefulDrain
+from loop_monitor import LoopLagMonitor
+from model_selector import AUTO_MODEL, ModelLatencyTracker, parse_quality_order
+from negative_cache import NegativeCache, is_deterministic_error, request_key
+from progress import STAGE_GENERATING, STAGE_QUEUED, progress_stage, reports_progress
+from result_cache import CACHE_MISS, ResultCache, create_backend
+from scheduler import DEFAULT_WEIGHTS, PRIORITY_INTERACTIVE, FairScheduler
+from tenants import TenantRegistry, tenant_label
+from tool_profiler import ToolProfiler
+from webhooks import EVENT_COMPLETED, EVENT_FAILED, WebhookDispatcher, validate_callback_url
+
+# 只检查uvloop是否已安装，事件循环由uvicorn按 loop="uvloop" 创建
+UVLOOP_AVAILABLE = importlib.util.find_spec("uvloop") is not None
+
 # 加载环境变量
 load_dotenv()
 
@@ -28,6 +46,112 @@ DEFAULT_HEIGHT = int(os.getenv("DEFAULT_HEIGHT", "1024"))
 DEFAULT_SAMPLE_STRENGTH = float(os.getenv("DEFAULT_SAMPLE_STRENGTH", "0.5"))
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", "120000"))
 
+# 准入控制：最大并发生成数、最大排队数、最长排队时间(秒)
+MAX_IN_FLIGHT = int(os.getenv("MAX_IN_FLIGHT", "8"))
+MAX_QUEUE = int(os.getenv("MAX_QUEUE", "32"))
+MAX_QUEUE_WAIT = float(os.getenv("MAX_QUEUE_WAIT", "30"))
+admission = AdmissionController(
+    max_in_flight=MAX_IN_FLIGHT,
+    max_queue=MAX_QUEUE,
+    max_queue_wait=MAX_QUEUE_WAIT
+)
+
+# 上游调度：同时发往即梦API的最大请求数，按优先级和session_id公平排队
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "4"))
+STARVATION_TIMEOUT = float(os.getenv("STARVATION_TIMEOUT", "60"))
+upstream_scheduler = FairScheduler(
+    concurrency=UPSTREAM_CONCURRENCY,
+    starvation_timeout=STARVATION_TIMEOUT
+)
+
+# 租户隔离：每个session_id的并发配额、配额等待时间(秒)、连接池空闲回收时间(秒)
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "2"))
+TENANT_QUEUE_WAIT = float(os.getenv("TENANT_QUEUE_WAIT", "10"))
+TENANT_IDLE_TIMEOUT = float(os.getenv("TENANT_IDLE_TIMEOUT", "300"))
+tenant_registry = TenantRegistry(
+    max_concurrency=TENANT_MAX_CONCURRENCY,
+    queue_wait=TENANT_QUEUE_WAIT,
+    idle_timeout=TENANT_IDLE_TIMEOUT,
+    request_timeout=REQUEST_TIMEOUT
+)
+
+# 事件循环延迟监控：心跳间隔(秒)、阻塞阈值(秒)，超过阈值时输出事件循环线程的调用栈
+LOOP_MONITOR = os.getenv("LOOP_MONITOR", "false").lower() in ("1", "true", "yes")
+LOOP_MONITOR_INTERVAL = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.1"))
+LOOP_ASYNCIO_DEBUG = os.getenv("LOOP_ASYNCIO_DEBUG", "false").lower() in ("1", "true", "yes")
+loop_monitor = LoopLagMonitor(
+    interval=LOOP_MONITOR_INTERVAL,
+    threshold=LOOP_LAG_THRESHOLD,
+    asyncio_debug=LOOP_ASYNCIO_DEBUG
+)
+
+# 按需性能剖析：PROFILE_TOOL_CALLS 大于0时启动后剖析该数量的工具调用；
+# PROFILING_ADMIN 为true时允许通过 start_profiling 工具随时开启
+PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "profiles")
+PROFILE_TOOL_CALLS = int(os.getenv("PROFILE_TOOL_CALLS", "0"))
+PROFILE_MODE = os.getenv("PROFILE_MODE", "cprofile")
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "false").lower() in ("1", "true", "yes")
+PROFILING_ADMIN = os.getenv("PROFILING_ADMIN", "false").lower() in ("1", "true", "yes")
+tool_profiler = ToolProfiler(output_dir=PROFILE_OUTPUT_DIR)
+if PROFILE_TOOL_CALLS > 0:
+    tool_profiler.arm(PROFILE_TOOL_CALLS, PROFILE_MODE, PROFILE_MEMORY)
+
+# 生成完成回调：签名密钥、投递队列上限、单个通知最多投递次数、投递超时(秒)、
+# 允许的回调主机(逗号分隔，为空表示不限制)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_MAX_QUEUE = int(os.getenv("WEBHOOK_MAX_QUEUE", "1000"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_ALLOWED_HOSTS = [host.strip().lower() for host in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()]
+# 允许回调到内网、回环等非公网地址（仅用于本地开发）
+WEBHOOK_ALLOW_PRIVATE = os.getenv("WEBHOOK_ALLOW_PRIVATE", "false").lower() in ("1", "true", "yes")
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "10"))
+webhooks = WebhookDispatcher(
+    secret=WEBHOOK_SECRET,
+    max_queue=WEBHOOK_MAX_QUEUE,
+    max_attempts=WEBHOOK_MAX_ATTEMPTS,
+    timeout=WEBHOOK_TIMEOUT,
+    allowed_hosts=WEBHOOK_ALLOWED_HOSTS,
+    allow_private=WEBHOOK_ALLOW_PRIVATE
+)
+
+# 生成结果缓存：相同参数的请求在TTL(秒)内复用结果，多副本部署时使用disk或redis后端共享；
+# 后端为空时不缓存。RESULT_CACHE_SCOPE 为tenant(默认)时各session_id的缓存相互隔离，global时所有租户共享
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "").lower()
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "result_cache")
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", "redis://localhost:6379/0")
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_LOCK_TTL = float(os.getenv("RESULT_CACHE_LOCK_TTL", "180"))
+RESULT_CACHE_WAIT = float(os.getenv("RESULT_CACHE_WAIT", "150"))
+RESULT_CACHE_SCOPE = os.getenv("RESULT_CACHE_SCOPE", "tenant").lower()
+result_cache = None
+if RESULT_CACHE_BACKEND:
+    result_cache = ResultCache(
+        create_backend(RESULT_CACHE_BACKEND, RESULT_CACHE_DIR, RESULT_CACHE_REDIS_URL),
+        ttl=RESULT_CACHE_TTL,
+        lock_ttl=RESULT_CACHE_LOCK_TTL,
+        wait_timeout=RESULT_CACHE_WAIT
+    )
+
+# 负缓存：参数校验失败、内容审核拒绝等确定性上游错误按请求参数缓存的时间(秒)，期间相同请求直接返回原错误；0表示禁用
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "600"))
+NEGATIVE_CACHE_MAX_ENTRIES = int(os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "10000"))
+negative_cache = NegativeCache(NEGATIVE_CACHE_TTL, NEGATIVE_CACHE_MAX_ENTRIES) if NEGATIVE_CACHE_TTL > 0 else None
+
+# 多进程服务：HTTP_WORKERS 大于1时在同一端口启动多个工作进程（主进程监听端口，由内核在各进程间分配连接），
+# 准入控制、上游并发和租户配额按进程计算，结果缓存需使用disk或redis后端才能在进程间共享；
+# HTTP_LOOP 为 auto(已安装uvloop时使用)、uvloop 或 asyncio；
+# 收到SIGTERM后进入排空状态：仍然接受连接，但新的生成请求立即返回繁忙响应（由客户端重试到其他进程或节点），
+# 最多等待 SHUTDOWN_DRAIN_TIMEOUT 秒让进行中的生成完成后再交给uvicorn关闭监听端口
+HTTP_WORKERS = int(os.getenv("HTTP_WORKERS", "1"))
+HTTP_LOOP = os.getenv("HTTP_LOOP", "auto").lower()
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", str(REQUEST_TIMEOUT / 1000 + 30)))
+drain = GracefulDrain(timeout=SHUTDOWN_DRAIN_TIMEOUT)
+
+# 进度通知：生成期间向请求了进度的客户端发送阶段通知，长耗时阶段内的心跳间隔(秒)
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "5"))
+
 # 可用模型列表
 AVAILABLE_MODELS = [
     "jimeng-3.0",
@@ -39,26 +163,115 @@ AVAILABLE_MODELS = [
     "jimeng-xl-pro"
 ]
 
-async def make_jimeng_request(url: str, data: Dict[str, Any], session_id: str) -> Dict[str, Any] | None:
-    """向即梦API发送请求"""
+# 自适应模型选择：model="auto" 时选择当前p95耗时满足延迟目标(秒)的质量最高的模型
+AUTO_MODEL_ORDER = parse_quality_order(os.getenv("AUTO_MODEL_ORDER", ""), AVAILABLE_MODELS)
+AUTO_MODEL_LATENCY_SLO = float(os.getenv("AUTO_MODEL_LATENCY_SLO", "60"))
+model_latency = ModelLatencyTracker(
+    window=int(os.getenv("MODEL_STATS_WINDOW", "50")),
+    window_seconds=float(os.getenv("MODEL_STATS_WINDOW_SECONDS", "900")),
+    min_samples=int(os.getenv("AUTO_MODEL_MIN_SAMPLES", "3")),
+    max_error_rate=float(os.getenv("AUTO_MODEL_MAX_ERROR_RATE", "0.3"))
+)
+
+def start_background_tasks() -> None:
+    """无状态HTTP模式下生命周期随请求创建，后台监控在首次调用工具时于服务器事件循环中启动"""
+    if LOOP_MONITOR:
+        loop_monitor.ensure_started()
+
+async def shutdown_background_tasks() -> None:
+    """进程退出前投递剩余的回调通知，关闭租户连接池、结果缓存后端和事件循环监控"""
+    await webhooks.close(WEBHOOK_DRAIN_TIMEOUT)
+    await tenant_registry.close()
+    if result_cache is not None:
+        await result_cache.close()
+    if LOOP_MONITOR:
+        await loop_monitor.stop()
+
+def create_app():
+    """
+    创建流式HTTP应用（uvicorn工厂函数，每个工作进程调用一次）
+    
+    收到退出信号后先等待进行中的请求完成，再执行生命周期的清理
+    """
+    app = mcp.streamable_http_app()
+    session_lifespan = app.router.lifespan_context
+    
+    @asynccontextmanager
+    async def lifespan(app):
+        async with session_lifespan(app):
+            # 此时uvicorn已安装信号处理函数，在其之前先排空进行中的请求
+            drain.install()
+            try:
+                yield
+            finally:
+                await shutdown_background_tasks()
+    
+    app.router.lifespan_context = lifespan
+    return drain.wrap_asgi(app)
+
+def resolve_event_loop(name: str) -> str:
+    """返回uvicorn使用的事件循环实现，未安装uvloop时退回asyncio"""
+    if name in ("auto", "uvloop"):
+        if UVLOOP_AVAILABLE:
+            return "uvloop"
+        if name == "uvloop":
+            print("uvloop 未安装，使用默认事件循环，请运行: pip install uvloop", file=sys.stderr)
+        return "asyncio"
+    return "asyncio"
+
+def serve() -> None:
+    """以一个或多个工作进程运行流式HTTP服务"""
+    import uvicorn
+    
+    if HTTP_WORKERS > 1 and RESULT_CACHE_BACKEND == "memory":
+        print("多进程模式下 memory 结果缓存不在进程间共享，建议使用 disk 或 redis 后端", file=sys.stderr)
+    
+    uvicorn.run(
+        # 多进程时工作进程按导入路径重新加载本模块
+        create_app if HTTP_WORKERS <= 1 else "mcp_server_http:create_app",
+        factory=True,
+        host=mcp.settings.host,
+        port=mcp.settings.port,
+        workers=max(1, HTTP_WORKERS),
+        loop=resolve_event_loop(HTTP_LOOP),
+        timeout_graceful_shutdown=SHUTDOWN_DRAIN_TIMEOUT,
+        log_level=mcp.settings.log_level.lower()
+    )
+
+async def make_jimeng_request(
+    url: str,
+    data: Dict[str, Any],
+    session_id: str,
+    client: httpx.AsyncClient | None = None
+) -> Dict[str, Any] | None:
+    """向即梦API发送请求，传入client时复用该连接池"""
     headers = {
         "Authorization": f"Bearer {session_id}",
         "Content-Type": "application/json"
     }
     
-    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
-        try:
-            response = await client.post(url, json=data, headers=headers)
-            response.raise_for_status()
-            return response.json()
-        except httpx.TimeoutException:
-            return {"error": "请求超时，图片生成可能需要更长时间"}
-        except httpx.HTTPStatusError as e:
-            return {"error": f"API请求失败: {e.response.status_code} - {e.response.text}"}
-        except Exception as e:
-            return {"error": f"请求发生错误: {str(e)}"}
+    if client is None:
+        async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+            return await make_jimeng_request(url, data, session_id, client)
+    
+    try:
+        response = await client.post(url, json=data, headers=headers)
+        response.raise_for_status()
+        return response.json()
+    except httpx.TimeoutException:
+        return {"error": "请求超时，图片生成可能需要更长时间", "retryable": True}
+    except httpx.HTTPStatusError as e:
+        # 参数校验失败和内容审核拒绝属于确定性错误，相同请求重试不会成功
+        return {
+            "error": f"API请求失败: {e.response.status_code} - {e.response.text}",
+            "retryable": not is_deterministic_error(e.response.status_code, e.response.text)
+        }
+    except Exception as e:
+        return {"error": f"请求发生错误: {str(e)}", "retryable": True}
 
 @mcp.tool()
+@tool_profiler.wrap
+@reports_progress(PROGRESS_INTERVAL)
 async def generate_images(
     prompt: str,
     session_id: str =None,
@@ -66,7 +279,12 @@ async def generate_images(
     negative_prompt: str = "",
     width: int = DEFAULT_WIDTH,
     height: int = DEFAULT_HEIGHT,
-    sample_strength: float = DEFAULT_SAMPLE_STRENGTH
+    sample_strength: float = DEFAULT_SAMPLE_STRENGTH,
+    priority: str = PRIORITY_INTERACTIVE,
+    latency_slo: float = AUTO_MODEL_LATENCY_SLO,
+    callback_url: str = "",
+    use_cache: bool = True,
+    ctx: Context = None
 ) -> str:
     """
     生成AI图片，适用于网站开发中的图片设计和占位填充
@@ -74,16 +292,26 @@ async def generate_images(
     Args:
         prompt: 图片描述提示词，必填。例如："少女祈祷中..."、"现代办公室背景"、"产品展示图"等
         session_id: API接口密钥，必填
-        model: 模型选择，可选值：jimeng-3.0(默认)、jimeng-2.1、jimeng-2.0-pro、jimeng-2.0、jimeng-1.4、jimeng-xl-pro
+        model: 模型选择，可选值：jimeng-3.0(默认)、jimeng-2.1、jimeng-2.0-pro、jimeng-2.0、jimeng-1.4、jimeng-xl-pro，
+            或auto(按当前各模型的生成耗时自动选择满足 latency_slo 的质量最高的模型)
         negative_prompt: 反向提示词，描述不想要的元素，默认为空
         width: 图片宽度，默认1024像素
         height: 图片高度，默认1024像素  
         sample_strength: 精细度，取值范围0-1，默认0.5
+        priority: 调度优先级，interactive(默认，交互式单次请求)或bulk(批量任务)
+        latency_slo: model为auto时的生成耗时目标(秒)，按最近的p95耗时判断，0表示只按质量和失败率选择
+        callback_url: 回调地址，可选。生成完成（或失败）后服务器向该地址POST带签名的JSON结果，
+            服务器需要设置WEBHOOK_SECRET
+        use_cache: 是否复用相同参数的近期生成结果，默认true；需要重新生成不同图片时设为false
     
     Returns:
         包含4个图片链接的JSON字符串，每次调用返回4个不同的图片供选择
     """
-    print(f"接收到的session_id: {session_id}")
+    start_background_tasks()
+    
+    # 进程正在退出，让客户端重试到其他进程或节点
+    if drain.draining:
+        return json.dumps(AdmissionRejected("draining", 1).to_dict(), ensure_ascii=False, indent=2)
     
     # 验证session_id参数
     if not session_id or session_id.strip() == "":
@@ -93,10 +321,10 @@ async def generate_images(
         }, ensure_ascii=False, indent=2)
     
     # 验证模型参数
-    if model not in AVAILABLE_MODELS:
+    if model != AUTO_MODEL and model not in AVAILABLE_MODELS:
         return json.dumps({
             "error": f"不支持的模型: {model}",
-            "available_models": AVAILABLE_MODELS
+            "available_models": AVAILABLE_MODELS + [AUTO_MODEL]
         }, ensure_ascii=False, indent=2)
     
     # 验证参数范围
@@ -110,6 +338,31 @@ async def generate_images(
             "error": "图片尺寸必须大于0"
         }, ensure_ascii=False, indent=2)
     
+    if priority not in DEFAULT_WEIGHTS:
+        return json.dumps({
+            "error": f"不支持的优先级: {priority}",
+            "available_priorities": list(DEFAULT_WEIGHTS)
+        }, ensure_ascii=False, indent=2)
+    
+    if callback_url:
+        if not WEBHOOK_SECRET:
+            # 未签名的回调无法让接收方确认来源，任何人都能伪造生成结果
+            return json.dumps({
+                "error": "未设置回调签名密钥，不接受callback_url",
+                "help": "请设置环境变量WEBHOOK_SECRET"
+            }, ensure_ascii=False, indent=2)
+        callback_error = await validate_callback_url(
+            callback_url, WEBHOOK_ALLOWED_HOSTS, WEBHOOK_ALLOW_PRIVATE
+        )
+        if callback_error:
+            return json.dumps({"error": callback_error}, ensure_ascii=False, indent=2)
+    
+    # 自动选择模型，选择结果附加在返回值中
+    selection = None
+    if model == AUTO_MODEL:
+        selection = model_latency.select(AUTO_MODEL_ORDER, width, height, latency_slo)
+        model = selection["model"]
+    
     # 构建请求数据
     request_data = {
         "model": model,
@@ -120,17 +373,74 @@ async def generate_images(
         "sample_strength": sample_strength
     }
     
-    # 调用即梦API
-    url = f"{JIMENG_API_BASE}/v1/images/generations"
-    result = await make_jimeng_request(url, request_data, session_id)
+    # 确定性错误可能与租户有关（如参数权限），负缓存按租户隔离
+    negative_key = request_key(tenant=tenant_label(session_id), **request_data)
+    
+    async def generate() -> Dict[str, Any]:
+        # 相同请求近期被上游确定性拒绝时直接返回原错误，不占用配额和上游名额
+        if negative_cache is not None:
+            cached_error = negative_cache.get(negative_key)
+            if cached_error is not None:
+                return cached_error
+        
+        # 调用即梦API，过载时立即返回繁忙响应
+        url = f"{JIMENG_API_BASE}/v1/images/generations"
+        try:
+            # 先占用租户配额，超出配额的租户不会占用全局名额
+            async with AsyncExitStack() as stack:
+                async with progress_stage(STAGE_QUEUED):
+                    client = await stack.enter_async_context(tenant_registry.acquire(session_id))
+                    await stack.enter_async_context(admission.admit())
+                    await stack.enter_async_context(upstream_scheduler.slot(priority, session_id))
+                expected = model_latency.model_stats(model, width, height)["latency_p50"]
+                async with progress_stage(STAGE_GENERATING, expected):
+                    started_at = time.monotonic()
+                    result = None
+                    try:
+                        result = await make_jimeng_request(url, request_data, session_id, client)
+                    finally:
+                        # 只统计实际发出的请求（包括被取消的），被准入拒绝的请求不计入
+                        succeeded = bool(result) and "error" not in result
+                        latency = time.monotonic() - started_at
+                        tenant_registry.record_result(session_id, succeeded, latency)
+                model_latency.record(model, width, height, latency, succeeded)
+            if negative_cache is not None:
+                negative_cache.record(negative_key, result)
+        except AdmissionRejected as e:
+            return e.to_dict()
+        return format_generation_result(result, prompt, model, selection)
+    
+    if result_cache is not None and use_cache:
+        # 失败和繁忙响应都带有 "error" 字段，不会被缓存
+        scope = "global" if RESULT_CACHE_SCOPE == "global" else tenant_label(session_id)
+        key = ResultCache.make_key(scope=scope, **request_data)
+        response, cache_status = await result_cache.get_or_compute(key, generate)
+        if cache_status != CACHE_MISS:
+            response = dict(response, cache=cache_status)
+    else:
+        response = await generate()
     
+    if "busy" in response:
+        return json.dumps(response, ensure_ascii=False, indent=2)
+    if callback_url:
+        event = EVENT_FAILED if "error" in response else EVENT_COMPLETED
+        webhooks.submit(callback_url, event, {"job_id": None, "result": response})
+    return json.dumps(response, ensure_ascii=False, indent=2)
+
+def format_generation_result(
+    result: Dict[str, Any] | None,
+    prompt: str,
+    model: str,
+    selection: Dict[str, Any] | None = None
+) -> Dict[str, Any]:
+    """格式化上游的生成结果，失败时返回包含 "error" 字段的字典"""
     if result is None:
-        return json.dumps({
+        return {
             "error": "无法连接到即梦API服务"
-        }, ensure_ascii=False, indent=2)
+        }
     
     if "error" in result:
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        return result
     
     # 格式化响应，提取关键信息
     if "data" in result and len(result["data"]) > 0:
@@ -142,6 +452,8 @@ async def generate_images(
             "image_count": len(result["data"]),
             "images": []
         }
+        if selection is not None:
+            formatted_result["model_selection"] = selection
         
         for i, img_data in enumerate(result["data"], 1):
             formatted_result["images"].append({
@@ -150,20 +462,21 @@ async def generate_images(
                 "description": f"基于提示词'{prompt}'生成的图片 #{i}"
             })
         
-        return json.dumps(formatted_result, ensure_ascii=False, indent=2)
+        return formatted_result
     else:
-        return json.dumps({
+        return {
             "error": "API返回了空的图片数据",
             "raw_response": result
-        }, ensure_ascii=False, indent=2)
+        }
 
 @mcp.tool()
+@tool_profiler.wrap
 async def list_available_models() -> str:
     """
     列出所有可用的即梦图片生成模型
     
     Returns:
-        可用模型列表的JSON字符串，包含模型名称和描述
+        可用模型列表的JSON字符串，包含模型名称、描述以及最近的生成耗时和失败率
     """
     models_info = {
         "available_models": [
@@ -194,12 +507,25 @@ async def list_available_models() -> str:
             }
         ],
         "default_model": DEFAULT_MODEL,
-        "usage_note": "选择模型时请考虑图片质量需求和生成时间的平衡"
+        "usage_note": "选择模型时请考虑图片质量需求和生成时间的平衡",
+        "auto_selection": {
+            "usage": "model设为auto时，按质量顺序选择最近p95生成耗时不超过latency_slo且失败率可接受的模型",
+            "quality_order": AUTO_MODEL_ORDER,
+            "default_latency_slo": AUTO_MODEL_LATENCY_SLO,
+            "max_error_rate": model_latency.max_error_rate,
+            "stats_window_seconds": model_latency.window_seconds
+        }
     }
     
+    # 附加最近的生成耗时(秒)和失败率统计
+    for model_info in models_info["available_models"]:
+        model_info["recent_stats"] = model_latency.model_stats(model_info["name"])
+        model_info["recent_stats_by_size"] = model_latency.size_stats(model_info["name"])
+    
     return json.dumps(models_info, ensure_ascii=False, indent=2)
 
 @mcp.tool()
+@tool_profiler.wrap
 async def get_generation_tips() -> str:
     """
     获取图片生成的最佳实践建议
@@ -242,6 +568,87 @@ async def get_generation_tips() -> str:
     
     return json.dumps(tips, ensure_ascii=False, indent=2)
 
+@mcp.tool()
+@tool_profiler.wrap
+async def get_server_status() -> str:
+    """
+    查询服务器当前负载
+    
+    Returns:
+        包含执行中/排队中的请求数、平均耗时、估算吞吐量、各优先级排队统计和事件循环延迟的JSON字符串
+    """
+    start_background_tasks()
+    status = {
+        "admission": admission.stats(),
+        "upstream": upstream_scheduler.stats(),
+        "tenant_count": tenant_registry.stats()["tenant_count"],
+        "retry_after_if_busy": admission.retry_after()
+    }
+    if LOOP_MONITOR:
+        status["event_loop"] = loop_monitor.stats()
+    status["webhooks"] = webhooks.stats()
+    if result_cache is not None:
+        status["result_cache"] = result_cache.stats()
+    if negative_cache is not None:
+        status["negative_cache"] = negative_cache.stats()
+    status["worker"] = dict(drain.stats(), pid=os.getpid())
+    
+    return json.dumps(status, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+@tool_profiler.wrap
+async def get_tenant_stats(session_id: str = None) -> str:
+    """
+    查询租户的延迟和吞吐统计
+    
+    Args:
+        session_id: 指定时只返回该租户的统计，不指定时返回所有租户（以session_id哈希标识）
+    
+    Returns:
+        包含执行中/等待中请求数、完成/失败/拒绝次数、延迟p50/p95和每分钟吞吐量的JSON字符串
+    """
+    stats = tenant_registry.stats(session_id or None)
+    
+    return json.dumps(stats, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+async def start_profiling(calls: int = 20, mode: str = "cprofile", memory: bool = False) -> str:
+    """
+    开启性能剖析，接下来的若干次工具调用完成后把结果写入服务器的剖析目录（需设置PROFILING_ADMIN=true）
+    
+    Args:
+        calls: 剖析的工具调用次数，默认20
+        mode: cprofile(默认，输出pstats文件和文本摘要) 或 sample(定时采样调用栈，输出speedscope格式)
+        memory: 是否同时用tracemalloc记录内存分配变化
+    
+    Returns:
+        剖析状态的JSON字符串
+    """
+    if not PROFILING_ADMIN:
+        return json.dumps({
+            "error": "未开启剖析管理功能",
+            "help": "请设置环境变量PROFILING_ADMIN=true"
+        }, ensure_ascii=False, indent=2)
+    
+    try:
+        status = tool_profiler.arm(calls, mode, memory)
+    except (ValueError, RuntimeError) as e:
+        return json.dumps({
+            "error": str(e)
+        }, ensure_ascii=False, indent=2)
+    
+    return json.dumps(status, ensure_ascii=False, indent=2)
+
+@mcp.tool()
+async def get_profiling_status() -> str:
+    """
+    查询性能剖析进度和上一次剖析的结果文件
+    
+    Returns:
+        当前剖析进度和上一次结果(模式、调用次数、耗时、文件路径)的JSON字符串
+    """
+    return json.dumps(tool_profiler.status(), ensure_ascii=False, indent=2)
+
 if __name__ == "__main__":
     # 运行MCP服务器
-    mcp.run(transport='streamable-http')
+    serve()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+按延迟自适应选择模型
+
+记录每个模型、每个尺寸最近一段时间内的上游生成耗时和失败率；model="auto" 时按
+质量从高到低检查候选模型，选择当前p95耗时满足延迟目标(SLO)且失败率可接受的
+质量最高的模型。上游拥塞时慢模型会自动被跳过，拥塞缓解、统计窗口滚动后再恢复。
+"""
+
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from percentiles import percentile
+
+AUTO_MODEL = "auto"
+
+# 质量从高到低的默认顺序
+DEFAULT_QUALITY_ORDER = [
+    "jimeng-3.1",
+    "jimeng-3.0",
+    "jimeng-2.1",
+    "jimeng-2.0-pro",
+    "jimeng-xl-pro",
+    "jimeng-2.0",
+    "jimeng-1.4"
+]
+
+
+def parse_quality_order(spec: str, available: List[str]) -> List[str]:
+    """解析逗号分隔的模型质量顺序，为空时使用默认顺序，只保留可用模型"""
+    order = [name.strip() for name in spec.split(",") if name.strip()] if spec else DEFAULT_QUALITY_ORDER
+    order = [name for name in order if name in available]
+    # 未出现在顺序中的可用模型按默认顺序排在最后
+    for name in DEFAULT_QUALITY_ORDER + available:
+        if name in available and name not in order:
+            order.append(name)
+    return order
+
+
+class ModelLatencyTracker:
+    """按 (模型, 尺寸) 统计滚动窗口内的生成耗时和失败率"""
+
+    def __init__(self, window: int = 50, window_seconds: float = 900.0,
+                 min_samples: int = 3, max_error_rate: float = 0.3):
+        """
+        Args:
+            window: 每个 (模型, 尺寸) 保留的最近样本数
+            window_seconds: 只使用最近该时间(秒)内的样本，过期样本不再参与统计
+            min_samples: 样本数达到该值才认为统计可信，尺寸样本不足时使用模型整体统计
+            max_error_rate: 失败率超过该值的模型不会被自动选择
+        """
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float, bool]]] = {}
+
+    @staticmethod
+    def size_key(width: int, height: int) -> str:
+        return f"{width}x{height}"
+
+    def record(self, model: str, width: int, height: int, latency: float, ok: bool) -> None:
+        """记录一次上游生成的耗时(秒)和是否成功"""
+        key = (model, self.size_key(width, height))
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append((time.time(), latency, ok))
+
+    def _recent(self, model: str, size: Optional[str] = None) -> List[Tuple[float, float, bool]]:
+        cutoff = time.time() - self.window_seconds
+        recent = []
+        for (name, sample_size), samples in self._samples.items():
+            if name != model or (size is not None and sample_size != size):
+                continue
+            recent.extend(sample for sample in samples if sample[0] >= cutoff)
+        return recent
+
+    @staticmethod
+    def _summarize(samples: List[Tuple[float, float, bool]]) -> Dict[str, Any]:
+        latencies = [latency for _, latency, _ in samples]
+        errors = sum(1 for _, _, ok in samples if not ok)
+        return {
+            "samples": len(samples),
+            "latency_p50": round(percentile(latencies, 50), 2),
+            "latency_p95": round(percentile(latencies, 95), 2),
+            "error_rate": round(errors / len(samples), 3) if samples else 0.0
+        }
+
+    def model_stats(self, model: str, width: Optional[int] = None,
+                    height: Optional[int] = None) -> Dict[str, Any]:
+        """模型整体或指定尺寸的统计"""
+        size = self.size_key(width, height) if width and height else None
+        return self._summarize(self._recent(model, size))
+
+    def size_stats(self, model: str) -> Dict[str, Dict[str, Any]]:
+        """模型各尺寸的统计"""
+        sizes = sorted({size for name, size in self._samples if name == model})
+        stats = {size: self._summarize(self._recent(model, size)) for size in sizes}
+        return {size: item for size, item in stats.items() if item["samples"]}
+
+    def _estimate(self, model: str, width: int, height: int) -> Optional[Dict[str, Any]]:
+        """优先使用同尺寸的统计，样本不足时使用模型整体统计，都不足时返回None"""
+        stats = self.model_stats(model, width, height)
+        if stats["samples"] >= self.min_samples:
+            stats["basis"] = "size"
+            return stats
+        stats = self.model_stats(model)
+        if stats["samples"] >= self.min_samples:
+            stats["basis"] = "model"
+            return stats
+        return None
+
+    def select(self, candidates: List[str], width: int, height: int,
+               latency_slo: float) -> Dict[str, Any]:
+        """
+        按质量顺序选择满足延迟目标的模型
+
+        没有足够样本的模型视为满足目标（按质量优先尝试，积累样本）；latency_slo 不大于0
+        时只检查失败率。所有模型都不满足时选择失败率可接受且p95耗时最低的模型。
+
+        Returns:
+            包含 model、reason 和所选模型统计的字典
+        """
+        if not candidates:
+            raise ValueError("candidates 不能为空")
+
+        estimates = {model: self._estimate(model, width, height) for model in candidates}
+        for model in candidates:
+            stats = estimates[model]
+            if stats is None:
+                return {"model": model, "reason": "样本不足，按质量优先尝试", "stats": None}
+            if stats["error_rate"] > self.max_error_rate:
+                continue
+            if latency_slo <= 0 or stats["latency_p95"] <= latency_slo:
+                return {"model": model, "reason": "满足延迟目标的最高质量模型", "stats": stats}
+
+        model = min(
+            candidates,
+            key=lambda name: (estimates[name]["error_rate"] > self.max_error_rate,
+                              estimates[name]["latency_p95"])
+        )
+        return {"model": model, "reason": "没有模型满足延迟目标，选择当前最快的模型", "stats": estimates[model]}
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+确定性上游错误的负缓存
+
+即梦API的错误分为两类：
+- 暂时性错误：超时、网络错误、429、5xx，重试可能成功
+- 确定性错误：参数校验失败(400/404/413/422)或提示词未通过内容审核，相同请求重试必然失败
+
+内容审核错误按上游响应体中的错误码识别，不匹配错误文本中的关键词。确定性错误按
+请求参数（提示词先规范化）缓存一段时间，期间相同请求直接返回原始错误信息，
+不再排队和调用上游。
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+from prompt_index import canonicalize_prompt
+
+# 请求本身有问题，重试不会改变结果的状态码
+DETERMINISTIC_STATUS_CODES = frozenset({400, 404, 405, 413, 414, 422})
+
+# 内容审核拒绝的上游错误码，上游可能以5xx返回这类错误：
+# jimeng-free-api 的 API_CONTENT_FILTERED，以及OpenAI兼容接口的 error.code
+MODERATION_ERROR_CODES = frozenset({-2006, "content_policy_violation", "content_filter"})
+
+# 规范化后参与缓存键的提示词参数
+PROMPT_PARAMS = ("prompt", "negative_prompt")
+
+
+def upstream_error_code(body: str) -> Optional[Union[int, str]]:
+    """从上游错误响应体中取出错误码，支持 {"code": ...} 和 {"error": {"code": ...}}"""
+    try:
+        data = json.loads(body or "")
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    error = data.get("error")
+    if isinstance(error, dict) and error.get("code") is not None:
+        return error["code"]
+    return data.get("code")
+
+
+def is_deterministic_error(status_code: Optional[int], body: str = "") -> bool:
+    """
+    判断上游错误是否为确定性错误
+
+    Args:
+        status_code: HTTP状态码，网络错误和超时为None
+        body: 上游返回的错误响应体
+    """
+    if status_code is None:
+        return False
+    if status_code in DETERMINISTIC_STATUS_CODES:
+        return True
+    return upstream_error_code(body) in MODERATION_ERROR_CODES
+
+
+def request_key(**params: Any) -> str:
+    """按请求参数生成规范化的缓存键，提示词中的大小写、标点、空白和词序差异不影响结果"""
+    for name in PROMPT_PARAMS:
+        if isinstance(params.get(name), str):
+            params[name] = canonicalize_prompt(params[name])
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class NegativeCache:
+    """确定性错误的TTL缓存（线程安全，超过条目上限时淘汰最久未使用的条目）"""
+
+    def __init__(self, ttl: float = 600.0, max_entries: int = 10000):
+        """
+        Args:
+            ttl: 错误的缓存时间(秒)
+            max_entries: 缓存条目上限
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.stored = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """返回缓存的错误（附带剩余缓存时间），未缓存或已过期时返回None"""
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, error = item
+            remaining = expires_at - time.time()
+            if remaining <= 0:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return dict(error, negative_cached=True, cache_expires_in=round(remaining))
+
+    def put(self, key: str, error: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, dict(error))
+            self._entries.move_to_end(key)
+            self.stored += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, key: str, result: Optional[Dict[str, Any]]) -> None:
+        """上游结果为确定性错误时写入缓存"""
+        if result and "error" in result and result.get("retryable") is False:
+            self.put(key, result)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存使用情况"""
+        with self._lock:
+            return {
+                "ttl": self.ttl,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stored": self.stored
+            }
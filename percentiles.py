@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+"""
+统计窗口的百分位数
+
+调度器、租户、字节预算、事件循环监控和模型选择的统计共用。
+"""
+
+from typing import Iterable
+
+
+def percentile(values: Iterable[float], percent: float) -> float:
+    """按最近秩取百分位数，values为空时返回0"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
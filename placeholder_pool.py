@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+常用占位图预生成池
+
+按 (类别, 尺寸, 模型) 维护若干张预先生成好的图片，调用方可立即取用，
+取用后由后台补充任务异步补足，把生成耗时移出关键路径。
+"""
+
+import asyncio
+import json
+import os
+import sys
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+# 默认占位图类别，尺寸与 get_generation_tips 中的推荐尺寸一致
+DEFAULT_POOL_SPECS = [
+    {
+        "category": "web_header",
+        "prompt": "现代科技感网站横幅背景，渐变色彩，商务风格，高分辨率",
+        "width": 1920,
+        "height": 1080
+    },
+    {
+        "category": "office_background",
+        "prompt": "现代简约的办公室背景，明亮的自然光，专业摄影",
+        "width": 1920,
+        "height": 1080
+    },
+    {
+        "category": "product_image",
+        "prompt": "电商产品展示图，白色背景，专业摄影，商业用途",
+        "width": 1024,
+        "height": 1024
+    },
+    {
+        "category": "thumbnail",
+        "prompt": "简约的插画风格缩略图，柔和配色，扁平化设计",
+        "width": 512,
+        "height": 512
+    },
+    {
+        "category": "mobile_banner",
+        "prompt": "竖屏移动端横幅背景，渐变色彩，现代感",
+        "width": 1080,
+        "height": 1920
+    }
+]
+
+PoolKey = Tuple[str, int, int, str]
+GenerateFunc = Callable[[str, str, int, int], Awaitable[Dict[str, Any]]]
+AcceptFunc = Callable[[Dict[str, Any]], bool]
+
+
+def load_pool_specs(spec: str, default_model: str) -> List[Dict[str, Any]]:
+    """
+    解析占位图池配置
+
+    Args:
+        spec: JSON字符串或JSON文件路径，为空时使用默认类别
+        default_model: 未指定模型时使用的模型
+    """
+    specs = DEFAULT_POOL_SPECS
+    if spec:
+        if os.path.exists(spec):
+            with open(spec, "r", encoding="utf-8") as f:
+                specs = json.load(f)
+        else:
+            specs = json.loads(spec)
+
+    return [
+        {
+            "category": item["category"],
+            "prompt": item["prompt"],
+            "width": int(item.get("width", 1024)),
+            "height": int(item.get("height", 1024)),
+            "model": item.get("model", default_model)
+        }
+        for item in specs
+    ]
+
+
+class PlaceholderPool:
+    """占位图预生成池"""
+
+    def __init__(self, generate: GenerateFunc, specs: List[Dict[str, Any]],
+                 target_size: int = 2, refill_concurrency: int = 1,
+                 accept: Optional[AcceptFunc] = None):
+        """
+        Args:
+            generate: 生成函数，参数为 (prompt, model, width, height)，
+                返回格式化后的结果字典，失败时包含 "error" 字段
+            specs: 占位图类别配置列表
+            target_size: 每个 (类别, 尺寸, 模型) 保持的就绪图片数量
+            refill_concurrency: 后台补充的最大并发生成数
+            accept: 判断结果能否放入池中长期保存，为None时接受所有成功结果
+        """
+        self.generate = generate
+        self.specs: Dict[PoolKey, Dict[str, Any]] = {
+            self._key(s["category"], s["width"], s["height"], s["model"]): s for s in specs
+        }
+        self.target_size = target_size
+        self.refill_concurrency = refill_concurrency
+        self.accept = accept
+
+        self._ready: Dict[PoolKey, Deque[Dict[str, Any]]] = {key: deque() for key in self.specs}
+        self._pending: Dict[PoolKey, int] = {key: 0 for key in self.specs}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._refiller: Optional[asyncio.Task] = None
+        self._tasks = set()
+
+    @staticmethod
+    def _key(category: str, width: int, height: int, model: str) -> PoolKey:
+        return (category, width, height, model)
+
+    @property
+    def categories(self) -> List[Dict[str, Any]]:
+        """所有可用类别及当前就绪数量"""
+        return [
+            {
+                "category": spec["category"],
+                "width": spec["width"],
+                "height": spec["height"],
+                "model": spec["model"],
+                "ready": len(self._ready[key])
+            }
+            for key, spec in self.specs.items()
+        ]
+
+    def find_spec(self, category: str, width: Optional[int] = None,
+                  height: Optional[int] = None,
+                  model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """按类别查找配置，未指定的尺寸/模型匹配任意值"""
+        for spec in self.specs.values():
+            if spec["category"] != category:
+                continue
+            if width is not None and spec["width"] != width:
+                continue
+            if height is not None and spec["height"] != height:
+                continue
+            if model is not None and spec["model"] != model:
+                continue
+            return spec
+        return None
+
+    def pop(self, spec: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """取出一张就绪图片并触发后台补充，池为空时返回None"""
+        key = self._key(spec["category"], spec["width"], spec["height"], spec["model"])
+        ready = self._ready[key]
+        result = ready.popleft() if ready else None
+        self.request_refill()
+        return result
+
+    def results(self) -> List[Dict[str, Any]]:
+        """返回所有就绪的图片结果"""
+        return [result for ready in self._ready.values() for result in ready]
+
+    def request_refill(self) -> None:
+        """唤醒后台补充任务"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        """启动后台补充任务"""
+        if self._refiller is not None or self.target_size <= 0:
+            return
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._refiller = asyncio.create_task(self._refill_loop())
+
+    async def stop(self) -> None:
+        """停止后台补充任务"""
+        if self._refiller is None:
+            return
+        self._refiller.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._refiller, *self._tasks, return_exceptions=True)
+        self._refiller = None
+        self._wakeup = None
+
+    async def _refill_loop(self) -> None:
+        semaphore = asyncio.Semaphore(self.refill_concurrency)
+
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+
+            for key, spec in self.specs.items():
+                missing = self.target_size - len(self._ready[key]) - self._pending[key]
+                for _ in range(max(missing, 0)):
+                    self._pending[key] += 1
+                    task = asyncio.create_task(self._refill_one(key, spec, semaphore))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+    async def _refill_one(self, key: PoolKey, spec: Dict[str, Any],
+                          semaphore: asyncio.Semaphore) -> None:
+        try:
+            async with semaphore:
+                result = await self.generate(
+                    spec["prompt"], spec["model"], spec["width"], spec["height"]
+                )
+            if not result or "error" in result:
+                print(f"占位图池补充失败 {spec['category']}: {(result or {}).get('error')}",
+                      file=sys.stderr)
+            elif self.accept is not None and not self.accept(result):
+                print(f"占位图池补充结果不可长期保存，已丢弃 {spec['category']}", file=sys.stderr)
+            else:
+                self._ready[key].append(result)
+        except Exception as e:
+            print(f"占位图池补充异常 {spec['category']}: {str(e)}", file=sys.stderr)
+        finally:
+            self._pending[key] -= 1
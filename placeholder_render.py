@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+本地占位图渲染
+
+不依赖上游生成，立即在本地渲染轻量级占位图：带尺寸标注的渐变SVG，
+并附带BlurHash字符串和内联的LQIP数据URI，便于页面先行搭建。
+"""
+
+import base64
+import hashlib
+import math
+from typing import List, Sequence, Tuple
+
+RGB = Tuple[int, int, int]
+
+_BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def placeholder_colors(prompt: str) -> Tuple[RGB, RGB]:
+    """根据提示词确定性地选取一对柔和的渐变色"""
+    digest = hashlib.md5(prompt.encode("utf-8")).digest()
+
+    def soften(value: int) -> int:
+        return 96 + value % 128
+
+    start = (soften(digest[0]), soften(digest[1]), soften(digest[2]))
+    end = (soften(digest[3]), soften(digest[4]), soften(digest[5]))
+    return start, end
+
+
+def _hex(color: RGB) -> str:
+    return "#%02x%02x%02x" % color
+
+
+def render_placeholder_svg(width: int, height: int, prompt: str = "") -> bytes:
+    """渲染带尺寸标注的渐变SVG占位图"""
+    start, end = placeholder_colors(prompt)
+    font_size = max(12, min(width, height) // 10)
+    svg = (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}">'
+        '<defs><linearGradient id="g" x1="0" y1="0" x2="1" y2="1">'
+        f'<stop offset="0" stop-color="{_hex(start)}"/>'
+        f'<stop offset="1" stop-color="{_hex(end)}"/>'
+        '</linearGradient></defs>'
+        f'<rect width="{width}" height="{height}" fill="url(#g)"/>'
+        f'<text x="50%" y="50%" fill="#ffffff" fill-opacity="0.85" font-family="sans-serif" '
+        f'font-size="{font_size}" text-anchor="middle" dominant-baseline="middle">'
+        f'{width}×{height}</text>'
+        '</svg>'
+    )
+    return svg.encode("utf-8")
+
+
+def render_lqip_data_uri(prompt: str) -> str:
+    """返回不含文字的极小渐变SVG数据URI，可作为低质量预览图内联使用"""
+    start, end = placeholder_colors(prompt)
+    svg = (
+        '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 1 1" preserveAspectRatio="none">'
+        '<linearGradient id="g" x2="1" y2="1">'
+        f'<stop stop-color="{_hex(start)}"/><stop offset="1" stop-color="{_hex(end)}"/>'
+        '</linearGradient><rect width="1" height="1" fill="url(#g)"/></svg>'
+    )
+    return "data:image/svg+xml;base64," + base64.b64encode(svg.encode("utf-8")).decode("ascii")
+
+
+def gradient_pixels(width: int, height: int, start: RGB, end: RGB) -> List[List[RGB]]:
+    """生成对角线方向渐变的像素矩阵"""
+    span = max(width + height - 2, 1)
+    pixels = []
+    for y in range(height):
+        row = []
+        for x in range(width):
+            t = (x + y) / span
+            row.append(tuple(round(s + (e - s) * t) for s, e in zip(start, end)))
+        pixels.append(row)
+    return pixels
+
+
+def _encode83(value: int, length: int) -> str:
+    result = ""
+    for i in range(1, length + 1):
+        digit = (value // (83 ** (length - i))) % 83
+        result += _BASE83_CHARS[digit]
+    return result
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def encode_blurhash(pixels: Sequence[Sequence[RGB]], x_components: int = 4,
+                    y_components: int = 3) -> str:
+    """将像素矩阵编码为BlurHash字符串"""
+    height = len(pixels)
+    width = len(pixels[0])
+    linear = [[tuple(_srgb_to_linear(c) for c in pixel) for pixel in row] for row in pixels]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            total = [0.0, 0.0, 0.0]
+            for y in range(height):
+                cos_y = math.cos(math.pi * j * y / height)
+                for x in range(width):
+                    basis = normalisation * math.cos(math.pi * i * x / width) * cos_y
+                    pixel = linear[y][x]
+                    total[0] += basis * pixel[0]
+                    total[1] += basis * pixel[1]
+                    total[2] += basis * pixel[2]
+            scale = 1 / (width * height)
+            factors.append([c * scale for c in total])
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = max(0, min(82, int(math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        max_value = 1.0
+        result += _encode83(0, 1)
+
+    dc_value = (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2])
+    result += _encode83(dc_value, 4)
+
+    for factor in ac:
+        r, g, b = (
+            max(0, min(18, int(math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5))))
+            for c in factor
+        )
+        result += _encode83(r * 19 * 19 + g * 19 + b, 2)
+
+    return result
+
+
+def placeholder_blurhash(width: int, height: int, prompt: str = "") -> str:
+    """计算与渲染的渐变占位图一致的BlurHash"""
+    start, end = placeholder_colors(prompt)
+    grid_width = 16
+    grid_height = max(4, min(64, round(grid_width * height / max(width, 1))))
+    return encode_blurhash(gradient_pixels(grid_width, grid_height, start, end))
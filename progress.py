@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+工具调用进度通知
+
+生成图片需要30-60秒，期间通过MCP进度通知(notifications/progress)告知客户端当前
+所处阶段：排队、上游生成、下载、上传、完成。耗时较长的阶段内定期发送心跳，进度
+在阶段内按已等待时间逐渐增加，客户端据此区分慢调用和卡死的调用，不必超时重试。
+
+进度报告器通过 contextvars 随调用链传递，内部函数无需增加参数。只有工具调用所在
+的任务会发送通知，由该调用派生的后台任务（如占位图的后台生成、占位图池补充）继承了
+报告器也不会发送；工具调用结束后报告器被关闭。
+"""
+
+import asyncio
+import functools
+import sys
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+STAGE_QUEUED = "queued"
+STAGE_GENERATING = "generating"
+STAGE_DOWNLOADING = "downloading"
+STAGE_UPLOADING = "uploading"
+STAGE_DONE = "done"
+
+STAGES = (STAGE_QUEUED, STAGE_GENERATING, STAGE_DOWNLOADING, STAGE_UPLOADING, STAGE_DONE)
+
+STAGE_MESSAGES = {
+    STAGE_QUEUED: "排队等待上游",
+    STAGE_GENERATING: "上游生成中",
+    STAGE_DOWNLOADING: "下载图片",
+    STAGE_UPLOADING: "上传到COS",
+    STAGE_DONE: "完成"
+}
+
+_current: ContextVar[Optional["ProgressReporter"]] = ContextVar("progress_reporter", default=None)
+
+
+class ProgressReporter:
+    """向一次工具调用的客户端发送阶段进度"""
+
+    def __init__(self, ctx: Any, interval: float = 5.0):
+        """
+        Args:
+            ctx: FastMCP 注入的 Context，客户端未请求进度时发送操作为空操作
+            interval: 长耗时阶段内的心跳间隔(秒)，0表示不发送心跳
+        """
+        self._ctx = ctx
+        self.interval = interval
+        self.total = float(len(STAGES))
+        self.progress = 0.0
+        self.closed = False
+        self._owner = asyncio.current_task()
+
+    async def report(self, stage: str, fraction: float = 0.0, message: Optional[str] = None) -> None:
+        """报告进入某个阶段（fraction 为阶段内进度，0-1），进度只增不减"""
+        if asyncio.current_task() is self._owner:
+            await self._report(stage, fraction, message)
+
+    async def _report(self, stage: str, fraction: float = 0.0, message: Optional[str] = None) -> None:
+        progress = STAGES.index(stage) + 1 + min(max(fraction, 0.0), 0.99)
+        if stage == STAGE_DONE:
+            progress = self.total
+        if self.closed or progress <= self.progress:
+            return
+        self.progress = progress
+
+        message = message or STAGE_MESSAGES[stage]
+        try:
+            try:
+                await self._ctx.report_progress(progress, self.total, message)
+            except TypeError:
+                # 旧版本的 report_progress 不支持 message 参数
+                await self._ctx.report_progress(progress, self.total)
+        except Exception as e:
+            # 进度通知失败不影响工具调用，之后不再发送
+            self.closed = True
+            print(f"发送进度通知失败: {str(e)}", file=sys.stderr)
+
+    @asynccontextmanager
+    async def stage(self, stage: str, expected: float = 0.0) -> AsyncIterator[None]:
+        """
+        在阶段内定期发送心跳
+
+        阶段内进度为 已等待时间/(已等待时间+预计耗时)，在预计耗时处达到一半，之后逐渐趋近但不超过1
+        """
+        await self.report(stage)
+        if self.interval <= 0 or self.closed or asyncio.current_task() is not self._owner:
+            yield
+            return
+
+        expected = expected if expected > 0 else 60.0
+        started_at = time.monotonic()
+
+        async def heartbeat() -> None:
+            while True:
+                await asyncio.sleep(self.interval)
+                elapsed = time.monotonic() - started_at
+                await self._report(
+                    stage,
+                    elapsed / (elapsed + expected),
+                    f"{STAGE_MESSAGES[stage]}，已等待{elapsed:.0f}秒"
+                )
+
+        task = asyncio.create_task(heartbeat())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+
+@contextmanager
+def reporting(ctx: Any, interval: float = 5.0) -> Iterator[Optional[ProgressReporter]]:
+    """在工具调用期间设置当前的进度报告器（需在工具调用所在的任务中调用），ctx 为None时不报告"""
+    if ctx is None:
+        yield None
+        return
+    reporter = ProgressReporter(ctx, interval)
+    token = _current.set(reporter)
+    try:
+        yield reporter
+    finally:
+        reporter.closed = True
+        _current.reset(token)
+
+
+async def report_stage(stage: str) -> None:
+    """向当前工具调用报告进入某个阶段，不在工具调用中时为空操作"""
+    reporter = _current.get()
+    if reporter is not None:
+        await reporter.report(stage)
+
+
+@asynccontextmanager
+async def progress_stage(stage: str, expected: float = 0.0) -> AsyncIterator[None]:
+    """当前工具调用的长耗时阶段，期间定期发送心跳"""
+    reporter = _current.get()
+    if reporter is None:
+        yield
+        return
+    async with reporter.stage(stage, expected):
+        yield
+
+
+def reports_progress(interval: float = 5.0) -> Callable[[Callable[..., Awaitable[Any]]], Callable[..., Awaitable[Any]]]:
+    """
+    工具函数装饰器：从 ctx 参数取得 FastMCP Context，调用期间报告进度，返回前报告完成
+
+    保留原函数签名，FastMCP 据此注入 Context 并从参数说明中排除 ctx
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with reporting(kwargs.get("ctx"), interval) as reporter:
+                result = await func(*args, **kwargs)
+                if reporter is not None:
+                    await reporter.report(STAGE_DONE)
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+提示词近似匹配索引
+
+对提示词进行规范化（全角/半角、大小写、标点、空白、词序），
+并基于字符n-gram + MinHash LSH 建立索引，用于在生成前找到
+足够相似且生成参数（模型、尺寸、反向提示词、精细度）一致的历史提示词，直接复用已生成的图片。
+
+历史记录数量有上限，超过后按最近最少使用淘汰，也可以设置过期时间；每个LSH桶只保留
+最近的若干条记录，模板化的提示词集中在少数桶中时查找耗时仍然有界。
+"""
+
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+
+def _is_separator(char: str) -> bool:
+    """判断字符是否为分隔符（标点、空白、符号、控制字符）"""
+    return unicodedata.category(char)[0] in ("P", "Z", "S", "C")
+
+
+def tokenize_prompt(prompt: str) -> List[str]:
+    """
+    将提示词切分为规范化后的片段
+
+    先做NFKC规范化（全角转半角）并转小写，再按标点和空白切分，
+    去重后排序，从而忽略词序差异。
+    """
+    text = unicodedata.normalize("NFKC", prompt or "").lower()
+    tokens = []
+    current = []
+    for char in text:
+        if _is_separator(char):
+            if current:
+                tokens.append("".join(current))
+                current = []
+        else:
+            current.append(char)
+    if current:
+        tokens.append("".join(current))
+    return sorted(set(tokens))
+
+
+def canonicalize_prompt(prompt: str) -> str:
+    """返回提示词的规范化形式，可直接作为精确匹配的键"""
+    return " ".join(tokenize_prompt(prompt))
+
+
+def prompt_shingles(prompt: str, ngram: int = 2) -> FrozenSet[str]:
+    """按片段提取字符n-gram集合，片段之间不跨越，与词序无关"""
+    shingles = set()
+    for token in tokenize_prompt(prompt):
+        if len(token) <= ngram:
+            shingles.add(token)
+            continue
+        for i in range(len(token) - ngram + 1):
+            shingles.add(token[i:i + ngram])
+    return frozenset(shingles)
+
+
+def jaccard_similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """计算两个集合的Jaccard相似度"""
+    if not a and not b:
+        return 1.0
+    intersection = len(a & b)
+    return intersection / (len(a) + len(b) - intersection)
+
+
+def generation_scope(model: str, width: int, height: int, negative_prompt: str = "",
+                     sample_strength: Optional[float] = None) -> Tuple[Any, ...]:
+    """
+    参与匹配的生成参数，只有这些参数全部一致的历史记录才会被复用
+
+    反向提示词按规范化形式比较；未记录精细度的旧记录(None)不会与任何请求匹配
+    """
+    return (
+        model,
+        int(width),
+        int(height),
+        canonicalize_prompt(negative_prompt),
+        None if sample_strength is None else round(float(sample_strength), 3)
+    )
+
+
+class PromptIndex:
+    """基于MinHash LSH的提示词近似匹配索引"""
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, ngram: int = 2,
+                 storage_path: Optional[str] = None, seed: int = 1,
+                 max_entries: int = 100000, ttl: float = 0.0, bucket_size: int = 32):
+        """
+        Args:
+            num_perm: MinHash签名长度
+            bands: LSH分段数，num_perm 必须能被其整除
+            ngram: 字符n-gram长度
+            storage_path: JSONL持久化文件路径，设置后需调用 load() 加载历史记录
+            seed: 哈希种子
+            max_entries: 历史记录上限，超过后淘汰最近最少使用的记录
+            ttl: 记录的有效期(秒)，0表示不过期
+            bucket_size: 每个LSH桶保留的最近记录数，限制一次查找需要比较的候选数量
+        """
+        if num_perm % bands != 0:
+            raise ValueError("num_perm 必须能被 bands 整除")
+        if max_entries <= 0 or bucket_size <= 0:
+            raise ValueError("max_entries 和 bucket_size 必须大于0")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self.storage_path = storage_path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bucket_size = bucket_size
+        self.evictions = 0
+        # 被相同提示词和参数的新结果替换的记录数
+        self.replaced = 0
+        # 未设置持久化文件时无需加载
+        self.loaded = not storage_path
+
+        self._seed = struct.pack("<I", seed)
+        self._unpack = struct.Struct(f"<{num_perm}I").unpack
+
+        self._lock = threading.Lock()
+        # 持久化文件的写入锁：重写文件时只持有该锁，不阻塞事件循环中的查找
+        self._file_lock = threading.Lock()
+        # 按最近使用顺序排列，最久未使用的在前
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._exact: Dict[Tuple[Any, ...], int] = {}
+        self._buckets: Dict[Tuple[Any, ...], "OrderedDict[int, None]"] = {}
+        # 持久化文件中的记录行数，远多于有效记录时重写文件
+        self._file_records = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _signature(self, shingles: FrozenSet[str]) -> List[int]:
+        """
+        计算MinHash签名
+
+        每个n-gram用一次SHAKE-128摘要得到num_perm个独立的32位哈希值，
+        再逐列取最小值，避免在Python层逐个排列循环计算。
+        """
+        if not shingles:
+            return [0] * self.num_perm
+        size = 4 * self.num_perm
+        rows = [
+            self._unpack(hashlib.shake_128(self._seed + s.encode("utf-8")).digest(size))
+            for s in shingles
+        ]
+        return list(map(min, zip(*rows)))
+
+    def _band_keys(self, signature: List[int]) -> List[Tuple[int, ...]]:
+        rows = self.rows
+        return [tuple(signature[i * rows:(i + 1) * rows]) for i in range(self.bands)]
+
+    def _min_band_hits(self, threshold: float) -> int:
+        """
+        相似度达到阈值的记录至少应命中的LSH分段数
+
+        相似度为 s 的记录每个分段命中的概率为 s**rows，取命中数期望减两个标准差作为下限；
+        命中分段更少的候选几乎不可能达到阈值，不再计算精确相似度
+        """
+        p = max(0.0, min(threshold, 1.0)) ** self.rows
+        spread = 2 * math.sqrt(self.bands * p * (1 - p))
+        return max(1, math.floor(self.bands * p - spread))
+
+    @staticmethod
+    def _scope(entry: Dict[str, Any]) -> Tuple[Any, ...]:
+        return generation_scope(entry["model"], entry["width"], entry["height"],
+                                entry.get("negative_prompt", ""), entry.get("sample_strength"))
+
+    def _prepare(self, entry: Dict[str, Any]) -> Tuple[FrozenSet[str], List[Tuple[int, ...]]]:
+        """计算条目的n-gram集合和LSH分段（不需要持有锁）"""
+        shingles = prompt_shingles(entry["prompt"], self.ngram)
+        return shingles, self._band_keys(self._signature(shingles))
+
+    def _expired(self, entry: Dict[str, Any], now: float) -> bool:
+        return self.ttl > 0 and now - entry.get("created_at", 0) > self.ttl
+
+    def _insert(self, entry: Dict[str, Any], shingles: FrozenSet[str],
+                band_keys: List[Tuple[int, ...]]) -> None:
+        """将条目写入内存索引（调用方需持有锁）"""
+        entry_id = self._next_id
+        self._next_id += 1
+        entry["shingles"] = shingles
+        entry["band_keys"] = band_keys
+
+        scope = self._scope(entry)
+        previous = self._exact.get(scope + (entry["canonical"],))
+        if previous is not None:
+            # 相同提示词和参数只保留最新的结果
+            self._drop(previous)
+            self.replaced += 1
+        self._entries[entry_id] = entry
+        self._exact[scope + (entry["canonical"],)] = entry_id
+        for band, key in enumerate(band_keys):
+            bucket = self._buckets.setdefault(scope + (band, key), OrderedDict())
+            bucket[entry_id] = None
+            if len(bucket) > self.bucket_size:
+                bucket.popitem(last=False)
+
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """从内存索引中移除条目（调用方需持有锁）"""
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return None
+        scope = self._scope(entry)
+        exact_key = scope + (entry["canonical"],)
+        if self._exact.get(exact_key) == entry_id:
+            del self._exact[exact_key]
+        for band, key in enumerate(entry["band_keys"]):
+            bucket_key = scope + (band, key)
+            bucket = self._buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.pop(entry_id, None)
+                if not bucket:
+                    del self._buckets[bucket_key]
+        return entry
+
+    def add(self, prompt: str, model: str, width: int, height: int,
+            result: Dict[str, Any], negative_prompt: str = "",
+            sample_strength: Optional[float] = None) -> None:
+        """记录一次成功的生成结果"""
+        entry = {
+            "prompt": prompt,
+            "canonical": canonicalize_prompt(prompt),
+            "model": model,
+            "width": width,
+            "height": height,
+            "negative_prompt": negative_prompt,
+            "sample_strength": sample_strength,
+            "created_at": time.time(),
+            "result": result,
+        }
+        shingles, band_keys = self._prepare(entry)
+
+        # 写入内存索引和持久化文件在文件锁内完成，重写文件时不会漏掉或重复记录
+        with self._file_lock:
+            with self._lock:
+                self._insert(entry, shingles, band_keys)
+                compact = self.storage_path and self._file_records + 1 > 2 * self.max_entries
+                snapshot = self._snapshot() if compact else None
+            if snapshot is not None:
+                self._rewrite(*snapshot)
+            elif self.storage_path:
+                self._append(entry)
+
+    def lookup(self, prompt: str, model: str, width: int, height: int,
+               threshold: float, negative_prompt: str = "",
+               sample_strength: Optional[float] = None,
+               accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Dict[str, Any]]:
+        """
+        查找生成参数一致且提示词相似度不低于阈值的历史记录
+
+        Args:
+            accept: 对候选记录的生成结果做额外检查（例如图片链接仍然有效），返回False的记录不会被复用
+
+        Returns:
+            包含 prompt、similarity、result 的字典，未命中返回None
+        """
+        scope = generation_scope(model, width, height, negative_prompt, sample_strength)
+        canonical = canonicalize_prompt(prompt)
+        shingles = prompt_shingles(prompt, self.ngram)
+        band_keys = self._band_keys(self._signature(shingles))
+        now = time.time()
+
+        min_hits = self._min_band_hits(threshold)
+        size = len(shingles)
+
+        with self._lock:
+            # 统计每个候选命中的分段数
+            hits: Counter = Counter()
+            for band, key in enumerate(band_keys):
+                bucket = self._buckets.get(scope + (band, key))
+                if bucket:
+                    hits.update(bucket.keys())
+            exact_id = self._exact.get(scope + (canonical,))
+            if exact_id is not None:
+                hits[exact_id] = self.bands
+
+            best_id = None
+            best_score = 0.0
+            for entry_id, count in hits.items():
+                if count < min_hits:
+                    continue
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._drop(entry_id)
+                    continue
+                other_size = len(entry["shingles"])
+                # Jaccard相似度不超过两个集合大小之比，不可能达到阈值的候选无需求交集
+                if entry_id != exact_id and min(size, other_size) < threshold * max(size, other_size):
+                    continue
+                score = 1.0 if entry_id == exact_id else jaccard_similarity(shingles, entry["shingles"])
+                if score < threshold or score <= best_score:
+                    continue
+                if accept is not None and not accept(entry["result"]):
+                    continue
+                best_id, best_score = entry_id, score
+
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            best_entry = self._entries[best_id]
+
+        return {"prompt": best_entry["prompt"], "similarity": round(best_score, 4),
+                "result": best_entry["result"]}
+
+    def results(self) -> List[Dict[str, Any]]:
+        """返回所有仍有效记录的生成结果"""
+        now = time.time()
+        with self._lock:
+            return [entry["result"] for entry in self._entries.values() if not self._expired(entry, now)]
+
+    def remove_where(self, predicate: Callable[[Dict[str, Any]], bool]) -> int:
+        """
+        移除生成结果满足条件的记录（例如图片对象已被清理），返回移除数量
+
+        设置了持久化文件时会重写文件，只保留有效记录
+        """
+        with self._file_lock:
+            with self._lock:
+                matched = [entry_id for entry_id, entry in self._entries.items() if predicate(entry["result"])]
+                for entry_id in matched:
+                    self._drop(entry_id)
+                snapshot = self._snapshot() if matched and self.storage_path else None
+            if snapshot is not None:
+                self._rewrite(*snapshot)
+        return len(matched)
+
+    @property
+    def history_complete(self) -> bool:
+        """
+        历史记录是否完整：未设置有效期，且从未因容量上限淘汰或被新结果替换而丢弃记录
+
+        丢弃的记录中的图片可能仍在使用，历史记录不完整时不能据此判断COS对象是否仍被引用
+        """
+        return self.ttl <= 0 and self.evictions == 0 and self.replaced == 0
+
+    def stats(self) -> Dict[str, Any]:
+        """索引使用情况"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "replaced": self.replaced,
+                "loaded": self.loaded
+            }
+
+    @staticmethod
+    def _record(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in entry.items() if k not in ("shingles", "band_keys")}
+
+    def _snapshot(self) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """重写文件所需的有效记录（按最近使用顺序）和丢弃计数（调用方需持有锁）"""
+        return list(self._entries.values()), {"evictions": self.evictions, "replaced": self.replaced}
+
+    def _rewrite(self, entries: List[Dict[str, Any]], meta: Dict[str, int]) -> None:
+        """将记录写入临时文件后替换持久化文件（调用方需持有文件锁，不需要持有索引锁）"""
+        temp_path = self.storage_path + ".tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                if meta["evictions"] or meta["replaced"]:
+                    # 重写会去掉被丢弃的记录，丢弃数量单独保存，重启后仍能判断历史记录是否完整
+                    f.write(json.dumps({"meta": meta}) + "\n")
+                for entry in entries:
+                    f.write(json.dumps(self._record(entry), ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.storage_path)
+            self._file_records = len(entries)
+        except OSError as e:
+            print(f"提示词索引重写失败: {str(e)}")
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        """追加写入持久化文件（调用方需持有文件锁）"""
+        try:
+            with open(self.storage_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self._record(entry), ensure_ascii=False) + "\n")
+            self._file_records += 1
+        except OSError as e:
+            print(f"提示词索引写入失败: {str(e)}")
+
+    def load(self) -> int:
+        """
+        从持久化文件加载历史记录，返回加载的记录数
+
+        文件读取和签名计算都是同步操作，服务器应在线程池中调用。只为最近的 max_entries
+        条未过期记录计算签名；文件中无效或被淘汰的记录较多时重写文件。
+        """
+        if not self.storage_path or not os.path.exists(self.storage_path):
+            self.loaded = True
+            return 0
+
+        now = time.time()
+        records: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        lines = 0
+        evictions = 0
+        replaced = 0
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    lines += 1
+                    try:
+                        entry = json.loads(line)
+                        if "meta" in entry:
+                            evictions += int(entry["meta"].get("evictions", 0))
+                            replaced += int(entry["meta"].get("replaced", 0))
+                            continue
+                        entry["canonical"] = entry.get("canonical") or canonicalize_prompt(entry["prompt"])
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        continue
+                    if self._expired(entry, now):
+                        continue
+                    records[lines] = entry
+                    if len(records) > self.max_entries:
+                        records.popitem(last=False)
+                        evictions += 1
+        except OSError as e:
+            print(f"提示词索引加载失败: {str(e)}")
+            return 0
+
+        prepared = [(entry, self._prepare(entry)) for entry in records.values()]
+        with self._file_lock:
+            with self._lock:
+                self.evictions += evictions
+                self.replaced += replaced
+                for entry, (shingles, band_keys) in prepared:
+                    self._insert(entry, shingles, band_keys)
+                self._file_records += lines
+                compact = self._file_records > len(self._entries) * 2 and self._file_records > 100
+                snapshot = self._snapshot() if compact else None
+                self.loaded = True
+            if snapshot is not None:
+                self._rewrite(*snapshot)
+        return len(prepared)
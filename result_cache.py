@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""
+可插拔的生成结果缓存
+
+相同请求（模型、提示词、尺寸等参数一致）的生成结果在TTL内直接复用。缓存后端可选：
+- memory: 进程内LRU，适合单进程部署
+- disk: 本地目录中的JSON文件，同一台机器上的多个进程共享
+- redis: Redis协议服务（redis/valkey/fakeredis等），多个节点共享，需要安装 redis 包
+
+多个请求同时未命中时通过后端中的短期锁做跨节点的单飞(single-flight)：只有获得锁的
+请求调用上游，其他请求等待其结果写入缓存；持锁方失败或锁过期后由等待方重新竞争。
+后端不可用时退化为不使用缓存，不影响生成。
+"""
+
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+try:
+    import redis.asyncio as redis_asyncio
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_JOINED = "joined"
+CACHE_BYPASS = "bypass"
+
+
+class CacheBackend(abc.ABC):
+    """缓存后端接口：键值存取（带TTL）和带过期时间的互斥锁，值为字符串"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[str]:
+        """返回未过期的值，不存在时返回None"""
+
+    @abc.abstractmethod
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        """写入值，ttl 秒后过期"""
+
+    @abc.abstractmethod
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        """锁空闲时获取并返回令牌，已被持有时返回None"""
+
+    @abc.abstractmethod
+    async def release_lock(self, key: str, token: str) -> None:
+        """只释放令牌匹配的锁，锁已过期并被他人获取时不做处理"""
+
+    @abc.abstractmethod
+    async def lock_held(self, key: str) -> bool:
+        """锁是否被持有（未过期）"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """进程内LRU后端"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._values: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._locks: Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        item = self._values.get(key)
+        if item is None:
+            return None
+        if item[0] < time.time():
+            del self._values[key]
+            return None
+        self._values.move_to_end(key)
+        return item[1]
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        self._values[key] = (time.time() + ttl, value)
+        self._values.move_to_end(key)
+        while len(self._values) > self.max_entries:
+            self._values.popitem(last=False)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        if await self.lock_held(key):
+            return None
+        token = uuid.uuid4().hex
+        self._locks[key] = (time.time() + ttl, token)
+        return token
+
+    async def release_lock(self, key: str, token: str) -> None:
+        lock = self._locks.get(key)
+        if lock is not None and lock[1] == token:
+            del self._locks[key]
+
+    async def lock_held(self, key: str) -> bool:
+        lock = self._locks.get(key)
+        if lock is not None and lock[0] < time.time():
+            del self._locks[key]
+            return False
+        return lock is not None
+
+
+class DiskBackend(CacheBackend):
+    """本地目录后端：值写入JSON文件，锁为独占创建的锁文件，同机多进程共享"""
+
+    name = "disk"
+
+    def __init__(self, directory: str, lock_write_timeout: float = 10.0):
+        """
+        Args:
+            directory: 缓存目录
+            lock_write_timeout: 锁文件创建后仍为空超过该时间(秒)时，视为持有方已崩溃
+        """
+        self.directory = directory
+        self.lock_write_timeout = lock_write_timeout
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + suffix)
+
+    def _read_json(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _get(self, key: str) -> Optional[str]:
+        path = self._path(key, ".json")
+        item = self._read_json(path)
+        if item is None:
+            return None
+        if item["expires_at"] < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return item["value"]
+
+    def _set(self, key: str, value: str, ttl: float) -> None:
+        path = self._path(key, ".json")
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + ttl, "value": value}, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        path = self._path(key, ".lock")
+        token = uuid.uuid4().hex
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._lock_file_held(path):
+                    return None
+                # 锁已过期（或持有方写入前崩溃），删除后重新竞争一次
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"expires_at": time.time() + ttl, "token": token}, f)
+            return token
+        return None
+
+    def _release_lock(self, key: str, token: str) -> None:
+        path = self._path(key, ".lock")
+        lock = self._read_json(path)
+        if lock is not None and lock["token"] == token:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _lock_file_held(self, path: str) -> bool:
+        """
+        锁文件是否仍有效
+
+        锁文件在独占创建后才写入内容，内容为空时持有方可能正在写入，按文件的修改时间判断是否过期
+        """
+        lock = self._read_json(path)
+        if lock is not None:
+            return lock["expires_at"] >= time.time()
+        try:
+            return os.path.getmtime(path) + self.lock_write_timeout >= time.time()
+        except OSError:
+            return False
+
+    def _lock_held(self, key: str) -> bool:
+        return self._lock_file_held(self._path(key, ".lock"))
+
+    # 文件操作在线程池中执行，避免阻塞事件循环
+    async def get(self, key: str) -> Optional[str]:
+        return await asyncio.get_event_loop().run_in_executor(None, self._get, key)
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await asyncio.get_event_loop().run_in_executor(None, self._set, key, value, ttl)
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        return await asyncio.get_event_loop().run_in_executor(None, self._acquire_lock, key, ttl)
+
+    async def release_lock(self, key: str, token: str) -> None:
+        await asyncio.get_event_loop().run_in_executor(None, self._release_lock, key, token)
+
+    async def lock_held(self, key: str) -> bool:
+        return await asyncio.get_event_loop().run_in_executor(None, self._lock_held, key)
+
+
+class RedisBackend(CacheBackend):
+    """Redis协议后端，多个节点共享缓存和锁"""
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client: Any = None):
+        """
+        Args:
+            url: Redis连接地址
+            client: 已创建的 redis.asyncio 兼容客户端（例如 fakeredis），传入时忽略 url
+        """
+        if client is None:
+            if not REDIS_AVAILABLE:
+                raise RuntimeError("redis 未安装，请运行: pip install redis")
+            client = redis_asyncio.from_url(url, decode_responses=True)
+        self._client = client
+
+    @staticmethod
+    def _decode(value: Any) -> Optional[str]:
+        if isinstance(value, bytes):
+            return value.decode("utf-8")
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._decode(await self._client.get(key))
+
+    async def set(self, key: str, value: str, ttl: float) -> None:
+        await self._client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def acquire_lock(self, key: str, ttl: float) -> Optional[str]:
+        token = uuid.uuid4().hex
+        if await self._client.set(key, token, nx=True, px=max(1, int(ttl * 1000))):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> None:
+        # 用 WATCH 事务比较并删除，避免删除过期后被其他节点获取的锁；
+        # 不使用Lua脚本，兼容不支持脚本的Redis协议服务
+        async with self._client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(key)
+                if self._decode(await pipe.get(key)) != token:
+                    await pipe.unwatch()
+                    return
+                pipe.multi()
+                pipe.delete(key)
+                await pipe.execute()
+            except redis_asyncio.WatchError:
+                # 锁在比较后被修改，说明已过期并被其他节点获取
+                pass
+
+    async def lock_held(self, key: str) -> bool:
+        return bool(await self._client.exists(key))
+
+    async def close(self) -> None:
+        if hasattr(self._client, "aclose"):
+            await self._client.aclose()
+        else:
+            await self._client.close()
+
+
+def create_backend(kind: str, directory: str = "", redis_url: str = "") -> CacheBackend:
+    """按名称创建缓存后端: memory、disk、redis"""
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "disk":
+        if not directory:
+            raise ValueError("disk 后端需要指定缓存目录")
+        return DiskBackend(directory)
+    if kind == "redis":
+        return RedisBackend(redis_url or "redis://localhost:6379/0")
+    raise ValueError(f"不支持的缓存后端: {kind}")
+
+
+class ResultCache:
+    """带跨节点单飞的生成结果缓存"""
+
+    def __init__(self, backend: CacheBackend, ttl: float = 3600.0, lock_ttl: float = 180.0,
+                 wait_timeout: float = 150.0, poll_interval: float = 0.5, prefix: str = "jimeng"):
+        """
+        Args:
+            backend: 缓存后端
+            ttl: 结果保留时间(秒)，应短于上游图片链接的有效期
+            lock_ttl: 单飞锁的过期时间(秒)，应长于一次生成的耗时，持锁方异常退出后锁自动失效
+            wait_timeout: 等待其他节点生成结果的最长时间(秒)，超时后自行生成
+            poll_interval: 等待期间检查结果的间隔(秒)
+            prefix: 后端中键的前缀
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.wait_timeouts = 0
+        self.errors = 0
+
+    @staticmethod
+    def make_key(**params: Any) -> str:
+        """按请求参数生成规范化的缓存键"""
+        canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = await self.backend.get(f"{self.prefix}:result:{key}")
+        return json.loads(value) if value is not None else None
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Dict[str, Any]]],
+        cacheable: Callable[[Dict[str, Any]], bool] = lambda result: "error" not in result
+    ) -> Tuple[Dict[str, Any], str]:
+        """
+        返回缓存的结果，未命中时计算并写入缓存
+
+        Returns:
+            (结果, 状态)，状态为 hit(命中)、joined(等待其他请求的结果)、miss(本次计算)
+            或 bypass(后端不可用，直接计算)
+        """
+        lock_key = f"{self.prefix}:lock:{key}"
+        deadline = time.monotonic() + self.wait_timeout
+        token = None
+        timed_out = False
+        # compute 都在 try 的保护范围之外调用，生成本身抛出的异常不会被当作后端故障再生成一次
+        try:
+            cached = await self._get(key)
+            if cached is not None:
+                self.hits += 1
+                return cached, CACHE_HIT
+
+            while True:
+                token = await self.backend.acquire_lock(lock_key, self.lock_ttl)
+                if token is not None:
+                    break
+                # 其他请求正在生成，等待其结果写入缓存；持锁方失败释放锁后重新竞争
+                while await self.backend.lock_held(lock_key):
+                    if time.monotonic() >= deadline:
+                        timed_out = True
+                        break
+                    await asyncio.sleep(self.poll_interval)
+                if timed_out:
+                    break
+                cached = await self._get(key)
+                if cached is not None:
+                    self.joined += 1
+                    return cached, CACHE_JOINED
+            if token is not None:
+                # 获得锁后再检查一次，避免前一个持锁方刚写入结果
+                cached = await self._get(key)
+                if cached is not None:
+                    await self._release(lock_key, token)
+                    self.joined += 1
+                    return cached, CACHE_JOINED
+        except Exception as e:
+            self.errors += 1
+            print(f"结果缓存不可用，直接生成: {str(e)}", file=sys.stderr)
+            if token is not None:
+                await self._release(lock_key, token)
+            return await compute(), CACHE_BYPASS
+
+        self.misses += 1
+        if timed_out:
+            # 等待其他请求超时，自行生成（不持有锁，结果仍写入缓存）
+            self.wait_timeouts += 1
+        try:
+            result = await compute()
+            if cacheable(result):
+                try:
+                    await self.backend.set(
+                        f"{self.prefix}:result:{key}",
+                        json.dumps(result, ensure_ascii=False),
+                        self.ttl
+                    )
+                except Exception as e:
+                    self.errors += 1
+                    print(f"写入结果缓存失败: {str(e)}", file=sys.stderr)
+            return result, CACHE_MISS
+        finally:
+            if token is not None:
+                await self._release(lock_key, token)
+
+    async def _release(self, lock_key: str, token: str) -> None:
+        try:
+            await self.backend.release_lock(lock_key, token)
+        except Exception as e:
+            self.errors += 1
+            print(f"释放结果缓存锁失败: {str(e)}", file=sys.stderr)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        return {
+            "backend": self.backend.name,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "joined": self.joined,
+            "misses": self.misses,
+            "wait_timeouts": self.wait_timeouts,
+            "errors": self.errors
+        }
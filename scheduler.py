@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+上游请求公平调度
+
+在即梦API前增加调度层：按优先级(interactive/bulk)加权，并在不同会话/租户之间
+做加权公平排队(起始时间公平排队, SFQ)，等待超时的请求优先放行以防止饥饿。
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+
+from percentiles import percentile
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+DEFAULT_WEIGHTS = {
+    PRIORITY_INTERACTIVE: 8.0,
+    PRIORITY_BULK: 1.0
+}
+
+
+class _Waiter:
+    __slots__ = ("future", "start_tag", "priority", "enqueued_at", "done")
+
+    def __init__(self, future: asyncio.Future, start_tag: float, priority: str):
+        self.future = future
+        self.start_tag = start_tag
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.done = False
+
+
+class FairScheduler:
+    """按 (优先级, 租户) 加权公平排队的并发调度器"""
+
+    def __init__(self, concurrency: int = 4, weights: Optional[Dict[str, float]] = None,
+                 starvation_timeout: float = 60.0, stats_window: int = 200):
+        """
+        Args:
+            concurrency: 同时发往上游的最大请求数
+            weights: 各优先级的权重，权重越大分得的上游份额越多
+            starvation_timeout: 等待超过该时间(秒)的请求不再参与排序，直接优先放行
+            stats_window: 每个优先级保留用于统计的最近等待时间样本数
+        """
+        if concurrency <= 0:
+            raise ValueError("concurrency 必须大于0")
+
+        self.concurrency = concurrency
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self.starvation_timeout = starvation_timeout
+
+        self._available = concurrency
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._arrivals: Deque[_Waiter] = deque()
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[Tuple[str, str], float] = {}
+
+        self._waits: Dict[str, Deque[float]] = {
+            priority: deque(maxlen=stats_window) for priority in self.weights
+        }
+        self._dispatched: Dict[str, int] = {priority: 0 for priority in self.weights}
+        self._starvation_boosts = 0
+
+    @asynccontextmanager
+    async def slot(self, priority: str = PRIORITY_INTERACTIVE,
+                   tenant: str = "default") -> AsyncIterator[None]:
+        """
+        获取一个上游执行名额
+
+        用法:
+            async with scheduler.slot("bulk", session_id):
+                await make_jimeng_request(...)
+        """
+        await self._acquire(priority, tenant)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, priority: str, tenant: str) -> None:
+        weight = self.weights.get(priority)
+        if weight is None:
+            raise ValueError(f"不支持的优先级: {priority}")
+
+        flow = (priority, tenant)
+        start_tag = max(self._virtual_time, self._finish_tags.get(flow, 0.0))
+        self._finish_tags[flow] = start_tag + 1.0 / weight
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), start_tag, priority)
+        heapq.heappush(self._heap, (start_tag, next(self._sequence), waiter))
+        self._arrivals.append(waiter)
+
+        # 有空闲名额时立即放行，无需挂起
+        self._dispatch()
+        if waiter.done:
+            return
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 已分配名额但调用方被取消，归还名额
+                self._release()
+            else:
+                waiter.done = True
+            raise
+
+    def _release(self) -> None:
+        self._available += 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._available > 0:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            waiter.done = True
+            self._available -= 1
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._record_wait(waiter.priority, time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+        if not self._heap and len(self._finish_tags) > 1024:
+            # 队列清空时清理已经落后于虚拟时间的租户记录
+            self._finish_tags = {
+                flow: tag for flow, tag in self._finish_tags.items() if tag > self._virtual_time
+            }
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        while self._arrivals and self._arrivals[0].done:
+            self._arrivals.popleft()
+
+        # 防饥饿：最早到达的请求等待过久时优先放行
+        if self._arrivals:
+            oldest = self._arrivals[0]
+            if time.monotonic() - oldest.enqueued_at >= self.starvation_timeout:
+                self._arrivals.popleft()
+                self._starvation_boosts += 1
+                return oldest
+
+        while self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if not waiter.done:
+                return waiter
+        return None
+
+    def _record_wait(self, priority: str, wait: float) -> None:
+        self._waits[priority].append(wait)
+        self._dispatched[priority] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """各优先级的排队统计"""
+        queued: Dict[str, int] = {priority: 0 for priority in self.weights}
+        for _, _, waiter in self._heap:
+            if not waiter.done:
+                queued[waiter.priority] += 1
+
+        return {
+            "concurrency": self.concurrency,
+            "in_flight": self.concurrency - self._available,
+            "starvation_boosts": self._starvation_boosts,
+            "priorities": {
+                priority: {
+                    "weight": weight,
+                    "queued": queued[priority],
+                    "dispatched": self._dispatched[priority],
+                    "wait_p50": round(percentile(list(self._waits[priority]), 50), 3),
+                    "wait_p95": round(percentile(list(self._waits[priority]), 95), 3)
+                }
+                for priority, weight in self.weights.items()
+            }
+        }
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+网站图片清单的增量构建
+
+清单文件(YAML或JSON)列出网站需要的每张图片：资源ID、提示词、尺寸和模型。构建时计算
+每个条目规格的哈希，与上次构建输出的映射文件比较，只重新生成规格有变化（或新增、
+上次失败）的条目，其余条目直接沿用上次的图片；需要生成的条目并发执行。构建结果
+写入映射文件（资源ID -> 图片URL），每完成一个条目即保存，中途中断后重新构建不会
+重复生成已完成的条目。
+
+存入COS的图片在映射文件中记录对象Key，每次构建时按Key重新获取URL（私有存储桶的
+预签名URL会过期，重新构建即可刷新，无需重新生成）；未存入COS的图片只有上游返回的
+临时链接，超过有效期后视为需要重新生成。
+
+清单格式:
+    defaults:            # 可选，各条目未指定时使用的参数
+      model: jimeng-3.1
+      width: 1024
+      height: 1024
+    output: assets.map.json   # 可选，映射文件路径（相对于清单文件），默认为 {清单名}.assets.json
+    assets:
+      - id: home_hero
+        prompt: 现代简约的办公室内景，明亮的自然光
+        width: 1920
+        height: 1080
+      - id: product_card
+        prompt: 电商产品展示图，白色背景
+        negative_prompt: 文字,水印
+
+assets 也可以写成以资源ID为键的映射。YAML格式需要安装PyYAML。
+
+命令行用法:
+    python site_assets.py site.yaml [--output 路径] [--force] [--dry-run] [--concurrency N]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+MAP_VERSION = 1
+
+# 参与哈希的规格字段，变化时重新生成
+SPEC_FIELDS = ("prompt", "negative_prompt", "model", "width", "height", "sample_strength")
+
+# 生成函数：参数为资源规格（SPEC_FIELDS），返回格式化后的结果字典，失败时包含 "error" 字段
+GenerateFunc = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+# 从结果中的图片信息（或旧版映射条目）解析COS对象Key，未存入COS时返回None
+CosKeyFunc = Callable[[Dict[str, Any]], Optional[str]]
+# 按COS对象Key返回当前可访问的URL
+ResolveUrlFunc = Callable[[str], str]
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """读取清单文件，扩展名为 .yaml/.yml 时按YAML解析，否则按JSON解析"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        if not YAML_AVAILABLE:
+            raise RuntimeError("读取YAML清单需要安装PyYAML: pip install PyYAML")
+        manifest = yaml.safe_load(text)
+    else:
+        manifest = json.loads(text)
+    if not isinstance(manifest, dict):
+        raise ValueError("清单文件的顶层必须是对象")
+    return manifest
+
+
+def normalize_assets(manifest: Dict[str, Any], defaults: Dict[str, Any],
+                     models: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    解析清单中的条目，返回 资源ID -> 完整规格（按清单顺序）
+
+    Args:
+        manifest: 清单内容
+        defaults: 服务器默认参数，清单的 defaults 优先于它
+        models: 允许的模型，为None时不校验
+    """
+    merged_defaults = dict(defaults)
+    merged_defaults.update(manifest.get("defaults") or {})
+
+    items = manifest.get("assets")
+    if isinstance(items, dict):
+        items = [dict(spec or {}, id=asset_id) for asset_id, spec in items.items()]
+    if not isinstance(items, list) or not items:
+        raise ValueError("清单中没有 assets 条目")
+
+    assets: Dict[str, Dict[str, Any]] = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"条目必须是对象: {item}")
+        asset_id = str(item.get("id") or "").strip()
+        if not asset_id:
+            raise ValueError(f"条目缺少 id: {item}")
+        if asset_id in assets:
+            raise ValueError(f"资源ID重复: {asset_id}")
+        if not str(item.get("prompt") or "").strip():
+            raise ValueError(f"条目缺少 prompt: {asset_id}")
+
+        spec = {field: item.get(field, merged_defaults.get(field)) for field in SPEC_FIELDS}
+        spec["negative_prompt"] = spec["negative_prompt"] or ""
+        spec["width"] = int(spec["width"])
+        spec["height"] = int(spec["height"])
+        spec["sample_strength"] = float(spec["sample_strength"])
+        if spec["width"] <= 0 or spec["height"] <= 0:
+            raise ValueError(f"图片尺寸必须大于0: {asset_id}")
+        if not (0 <= spec["sample_strength"] <= 1):
+            raise ValueError(f"sample_strength 必须在 0-1 范围内: {asset_id}")
+        if models is not None and spec["model"] not in models:
+            raise ValueError(f"不支持的模型 {spec['model']}: {asset_id}")
+        assets[asset_id] = spec
+    return assets
+
+
+def spec_hash(spec: Dict[str, Any]) -> str:
+    """条目规格的哈希，只由 SPEC_FIELDS 决定，与字段顺序无关"""
+    canonical = json.dumps({field: spec[field] for field in SPEC_FIELDS},
+                           sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def default_output_path(manifest_path: str, manifest: Dict[str, Any]) -> str:
+    """映射文件路径：清单中的 output（相对于清单所在目录），默认为 {清单名}.assets.json"""
+    output = manifest.get("output")
+    if output:
+        return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), output)
+    return os.path.splitext(manifest_path)[0] + ".assets.json"
+
+
+def load_asset_map(path: str) -> Dict[str, Dict[str, Any]]:
+    """读取上次构建的映射文件，不存在或无法解析时返回空映射"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get("assets", {}) if isinstance(data, dict) else {}
+
+
+def save_asset_map(path: str, assets: Dict[str, Dict[str, Any]]) -> None:
+    """先写入临时文件再原子替换，中断时不会留下写了一半的映射文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": MAP_VERSION, "updated_at": int(time.time()), "assets": assets},
+                      f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class SiteAssetBuilder:
+    """按清单增量生成网站图片"""
+
+    def __init__(self, generate: GenerateFunc, defaults: Dict[str, Any], concurrency: int = 4,
+                 models: Optional[List[str]] = None, cos_key: Optional[CosKeyFunc] = None,
+                 resolve_url: Optional[ResolveUrlFunc] = None, url_ttl: float = 0.0):
+        """
+        Args:
+            generate: 生成函数
+            defaults: 清单未指定时使用的参数（model、width、height、sample_strength 等）
+            concurrency: 同时生成的条目数上限
+            models: 允许的模型，为None时不校验
+            cos_key: 解析图片的COS对象Key，为None时不记录Key
+            resolve_url: 按对象Key获取URL，每次构建时刷新所有存入COS的条目
+            url_ttl: 未存入COS的图片链接的有效期(秒)，超过后重新生成，0表示不检查
+        """
+        self.generate = generate
+        self.defaults = defaults
+        self.concurrency = max(1, concurrency)
+        self.models = models
+        self.cos_key = cos_key
+        self.resolve_url = resolve_url
+        self.url_ttl = url_ttl
+
+    def _entry_cos_key(self, entry: Dict[str, Any]) -> Optional[str]:
+        """映射条目的COS对象Key，兼容只记录了 cos_url 的旧版映射文件"""
+        if entry.get("cos_key"):
+            return entry["cos_key"]
+        if self.cos_key is not None and entry.get("cos_url"):
+            return self.cos_key(entry)
+        return None
+
+    def _url_expired(self, entry: Dict[str, Any], now: float) -> bool:
+        """未存入COS的条目链接是否已超过有效期"""
+        if self.url_ttl <= 0 or self._entry_cos_key(entry):
+            return False
+        return now - entry.get("generated_at", 0) > self.url_ttl
+
+    async def build(self, manifest_path: str, output_path: Optional[str] = None,
+                    force: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        构建清单，返回构建报告
+
+        Args:
+            manifest_path: 清单文件路径
+            output_path: 映射文件路径，为空时由清单决定
+            force: 忽略上次的结果，重新生成所有条目
+            dry_run: 只计算需要生成的条目，不调用生成
+        """
+        loop = asyncio.get_event_loop()
+        manifest = await loop.run_in_executor(None, load_manifest, manifest_path)
+        assets = normalize_assets(manifest, self.defaults, self.models)
+        output_path = output_path or default_output_path(manifest_path, manifest)
+        previous = await loop.run_in_executor(None, load_asset_map, output_path)
+
+        hashes = {asset_id: spec_hash(spec) for asset_id, spec in assets.items()}
+        now = time.time()
+        expired = [
+            asset_id for asset_id in assets
+            if asset_id in previous and previous[asset_id].get("hash") == hashes[asset_id]
+            and self._url_expired(previous[asset_id], now)
+        ]
+        pending = [
+            asset_id for asset_id in assets
+            if force or previous.get(asset_id, {}).get("hash") != hashes[asset_id] or asset_id in expired
+        ]
+        pending_ids = set(pending)
+        # 只保留清单中仍存在的条目，未变化的条目沿用上次的结果
+        current = {asset_id: previous[asset_id] for asset_id in assets if asset_id in previous}
+        report: Dict[str, Any] = {
+            "manifest": manifest_path,
+            "output": output_path,
+            "total": len(assets),
+            "unchanged": [asset_id for asset_id in assets if asset_id not in pending_ids],
+            "removed": [asset_id for asset_id in previous if asset_id not in assets],
+            "expired": expired,
+            "generated": [],
+            "failed": {}
+        }
+        if dry_run:
+            report["to_generate"] = pending
+            return report
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        save_lock = asyncio.Lock()
+
+        async def save() -> None:
+            async with save_lock:
+                await loop.run_in_executor(None, save_asset_map, output_path, dict(current))
+
+        async def build_one(asset_id: str) -> None:
+            spec = assets[asset_id]
+            async with semaphore:
+                started_at = time.monotonic()
+                try:
+                    result = await self.generate(spec)
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {str(e)}"}
+            images = result.get("images") or []
+            if "error" in result or not images:
+                # 失败的条目保留上次的图片（如有），哈希不变，下次构建时重试
+                report["failed"][asset_id] = str(result.get("error", "没有返回图片"))
+                print(f"生成网站图片失败 {asset_id}: {report['failed'][asset_id]}", file=sys.stderr)
+                return
+            entry = {
+                "url": images[0]["url"],
+                "hash": hashes[asset_id],
+                "prompt": spec["prompt"],
+                "model": result.get("model_used", spec["model"]),
+                "width": spec["width"],
+                "height": spec["height"],
+                "generated_at": int(time.time()),
+                "elapsed": round(time.monotonic() - started_at, 2)
+            }
+            key = self.cos_key(images[0]) if self.cos_key is not None else None
+            if key:
+                entry["cos_key"] = key
+            current[asset_id] = entry
+            report["generated"].append(asset_id)
+            await save()
+
+        await asyncio.gather(*[build_one(asset_id) for asset_id in pending])
+        # 按清单顺序保存，同时移除已从清单中删除的条目；存入COS的条目按Key刷新URL
+        current = {asset_id: self._refresh(current[asset_id]) for asset_id in assets if asset_id in current}
+        await save()
+
+        report["urls"] = {asset_id: entry["url"] for asset_id, entry in current.items()}
+        return report
+
+
+    def _refresh(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """按COS对象Key刷新条目的URL，不保存会过期的签名URL"""
+        key = self._entry_cos_key(entry)
+        if not key:
+            return entry
+        entry = {field: value for field, value in entry.items() if field != "cos_url"}
+        entry["cos_key"] = key
+        if self.resolve_url is not None:
+            entry["url"] = self.resolve_url(key)
+        return entry
+
+
+async def _run_cli(args: argparse.Namespace) -> Dict[str, Any]:
+    # 复用服务器的生成流程（上游调度、COS上传、提示词索引）和配置
+    import jimeng_image_server as server
+
+    if server.JIMENG_SESSION_ID is None and not args.dry_run:
+        raise RuntimeError("环境变量JIMENG_SESSION_ID未设置")
+    try:
+        return await server.site_asset_builder(args.concurrency).build(
+            args.manifest, args.output or None, force=args.force, dry_run=args.dry_run
+        )
+    finally:
+        await server.close_shared_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="按清单增量生成网站图片")
+    parser.add_argument("manifest", help="清单文件路径(.yaml/.yml/.json)")
+    parser.add_argument("--output", default="", help="映射文件路径，默认由清单决定")
+    parser.add_argument("--force", action="store_true", help="重新生成所有条目")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要生成的条目")
+    parser.add_argument("--concurrency", type=int, default=0, help="同时生成的条目数，默认与上游并发数一致")
+    args = parser.parse_args()
+
+    try:
+        report = asyncio.run(_run_cli(args))
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"构建失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if report["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+多租户隔离
+
+HTTP服务器以调用方传入的session_id区分租户：每个租户拥有独立的并发配额、
+独立的上游连接池(空闲后自动回收)以及延迟/吞吐统计，避免单个租户拖慢其他租户。
+"""
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+import httpx
+
+from admission import AdmissionRejected
+from percentiles import percentile
+
+
+def tenant_label(session_id: str) -> str:
+    """session_id属于密钥，统计和日志中只使用其哈希前缀"""
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12]
+
+
+class _Tenant:
+    """单个租户的配额、连接池和统计"""
+
+    def __init__(self, client: httpx.AsyncClient, max_concurrency: int, stats_window: int):
+        self.client = client
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.last_used = time.monotonic()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.latencies: Deque[float] = deque(maxlen=stats_window)
+        self.finished_at: Deque[float] = deque(maxlen=stats_window)
+
+    def retry_after(self, max_concurrency: int) -> int:
+        avg = sum(self.latencies) / len(self.latencies) if self.latencies else 45.0
+        return max(1, math.ceil(avg * (self.waiting + 1) / max_concurrency))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        recent = [t for t in self.finished_at if now - t <= 60]
+        latencies = list(self.latencies)
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_p50": round(percentile(latencies, 50), 3),
+            "latency_p95": round(percentile(latencies, 95), 3),
+            "throughput_per_minute": len(recent),
+            "idle_seconds": round(now - self.last_used, 1)
+        }
+
+
+class TenantRegistry:
+    """按session_id管理租户配额与上游连接池"""
+
+    def __init__(self, max_concurrency: int = 2, queue_wait: float = 10.0,
+                 idle_timeout: float = 300.0, request_timeout: float = 120.0,
+                 client_factory: Optional[Callable[[int], httpx.AsyncClient]] = None,
+                 stats_window: int = 200):
+        """
+        Args:
+            max_concurrency: 每个租户同时进行的最大请求数
+            queue_wait: 租户配额用尽时最长等待时间(秒)，超时后返回繁忙响应
+            idle_timeout: 租户空闲超过该时间(秒)后关闭其连接池
+            request_timeout: 上游请求超时时间(秒)
+            client_factory: 创建租户连接池的函数，参数为连接数上限
+            stats_window: 每个租户保留的最近延迟样本数
+        """
+        self.max_concurrency = max_concurrency
+        self.queue_wait = queue_wait
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.client_factory = client_factory or self._default_client
+        self.stats_window = stats_window
+
+        self._tenants: Dict[str, _Tenant] = {}
+        self._last_eviction = time.monotonic()
+
+    def _default_client(self, max_connections: int) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            timeout=self.request_timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    def _get_tenant(self, session_id: str) -> _Tenant:
+        tenant = self._tenants.get(session_id)
+        if tenant is None:
+            tenant = _Tenant(
+                self.client_factory(self.max_concurrency),
+                self.max_concurrency,
+                self.stats_window
+            )
+            self._tenants[session_id] = tenant
+        return tenant
+
+    @asynccontextmanager
+    async def acquire(self, session_id: str) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        占用租户的一个并发配额，返回该租户的上游连接池
+
+        配额在 queue_wait 内无法获得时抛出 AdmissionRejected。请求结果和延迟由调用方在
+        实际发出上游请求后通过 record_result 记录，之后被全局准入拒绝的请求不计入统计
+        """
+        await self.evict_idle()
+        tenant = self._get_tenant(session_id)
+        tenant.last_used = time.monotonic()
+
+        tenant.waiting += 1
+        try:
+            await asyncio.wait_for(tenant.semaphore.acquire(), timeout=self.queue_wait)
+        except asyncio.TimeoutError:
+            tenant.rejected += 1
+            raise AdmissionRejected("tenant_quota", tenant.retry_after(self.max_concurrency))
+        finally:
+            tenant.waiting -= 1
+
+        tenant.in_flight += 1
+        try:
+            yield tenant.client
+        finally:
+            tenant.last_used = time.monotonic()
+            tenant.in_flight -= 1
+            tenant.semaphore.release()
+
+    def record_result(self, session_id: str, success: bool, latency: float) -> None:
+        """记录一次已发出的上游请求的结果和耗时(秒)，每个请求只记录一次"""
+        tenant = self._tenants.get(session_id)
+        if tenant is None:
+            return
+        if success:
+            tenant.completed += 1
+        else:
+            tenant.failed += 1
+        tenant.latencies.append(latency)
+        tenant.finished_at.append(time.monotonic())
+
+    async def evict_idle(self, force: bool = False) -> int:
+        """关闭空闲租户的连接池，返回回收的租户数"""
+        now = time.monotonic()
+        if not force and now - self._last_eviction < min(self.idle_timeout, 30.0):
+            return 0
+        self._last_eviction = now
+
+        idle = [
+            session_id for session_id, tenant in self._tenants.items()
+            if tenant.in_flight == 0 and tenant.waiting == 0
+            and now - tenant.last_used >= self.idle_timeout
+        ]
+        for session_id in idle:
+            tenant = self._tenants.pop(session_id)
+            await tenant.client.aclose()
+        return len(idle)
+
+    async def close(self) -> None:
+        """关闭所有租户的连接池"""
+        tenants, self._tenants = self._tenants, {}
+        for tenant in tenants.values():
+            await tenant.client.aclose()
+
+    def stats(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """返回指定租户或所有租户的统计，租户以session_id哈希标识"""
+        if session_id is not None:
+            tenant = self._tenants.get(session_id)
+            return {tenant_label(session_id): tenant.stats() if tenant else None}
+
+        return {
+            "tenant_count": len(self._tenants),
+            "max_concurrency_per_tenant": self.max_concurrency,
+            "tenants": {
+                tenant_label(sid): tenant.stats() for sid, tenant in self._tenants.items()
+            }
+        }
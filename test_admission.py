@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+准入控制测试：并发上限、队列长度、预计排队时间和排队超时
+"""
+
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+async def occupy(controller, gate):
+    async with controller.admit():
+        await gate.wait()
+
+
+def test_admits_up_to_limit_without_waiting():
+    controller = AdmissionController(max_in_flight=2)
+
+    async def run():
+        gate = asyncio.Event()
+        holders = [asyncio.create_task(occupy(controller, gate)) for _ in range(2)]
+        await asyncio.sleep(0)
+        stats = controller.stats()
+        gate.set()
+        await asyncio.gather(*holders)
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["in_flight"] == 2
+    assert stats["waiting"] == 0
+    assert controller.stats()["admitted"] == 2
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_rejects_when_queue_is_full():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, initial_service_time=0.01)
+
+    async def run():
+        gate = asyncio.Event()
+        holder = asyncio.create_task(occupy(controller, gate))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(occupy(controller, gate))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        gate.set()
+        await asyncio.gather(holder, queued)
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after >= 1
+    assert controller.stats()["rejected"] == 1
+    assert controller.stats()["admitted"] == 2
+
+
+def test_rejects_when_estimated_wait_too_long():
+    # 每个请求预计耗时100秒，排队一个就会超过30秒的上限
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=30, initial_service_time=100)
+
+    async def run():
+        gate = asyncio.Event()
+        holder = asyncio.create_task(occupy(controller, gate))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        gate.set()
+        await holder
+        return rejected.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "queue_wait_exceeded"
+    assert rejected.retry_after == 100
+    response = rejected.to_dict()
+    assert response["busy"] is True
+    assert response["retry_after"] == 100
+
+
+def test_rejects_after_queue_timeout():
+    controller = AdmissionController(max_in_flight=1, max_queue_wait=0.05, initial_service_time=0.001)
+
+    async def run():
+        gate = asyncio.Event()
+        holder = asyncio.create_task(occupy(controller, gate))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        stats = controller.stats()
+        gate.set()
+        await holder
+        return rejected.value, stats
+
+    rejected, stats = asyncio.run(run())
+    assert rejected.reason == "queue_timeout"
+    assert stats["waiting"] == 0
+    assert stats["in_flight"] == 1
+
+
+def test_service_time_tracks_completed_requests():
+    controller = AdmissionController(max_in_flight=1, initial_service_time=10, smoothing=0.5)
+
+    async def run():
+        async with controller.admit():
+            pass
+
+    asyncio.run(run())
+    # 实际耗时约为0，滑动平均向其靠近
+    assert controller.stats()["avg_service_time"] == pytest.approx(5, abs=0.01)
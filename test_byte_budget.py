@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+字节预算测试：先进先出放行、超大请求独占、追加预留和取消
+"""
+
+import asyncio
+
+import pytest
+
+from byte_budget import ByteBudget
+
+
+async def hold(budget, nbytes, gate, order, label):
+    async with budget.hold() as lease:
+        await lease.reserve(nbytes)
+        order.append(label)
+        await gate.wait()
+
+
+def test_waiters_are_served_in_arrival_order():
+    budget = ByteBudget(100)
+
+    async def run():
+        order = []
+        gates = {label: asyncio.Event() for label in ("a", "b", "c")}
+        a = asyncio.create_task(hold(budget, 80, gates["a"], order, "a"))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(hold(budget, 50, gates["b"], order, "b"))
+        c = asyncio.create_task(hold(budget, 10, gates["c"], order, "c"))
+        await asyncio.sleep(0)
+        # c的额度足够，但不能越过排在前面的b
+        assert order == ["a"]
+        assert budget.stats()["waiting"] == 2
+
+        gates["a"].set()
+        await asyncio.sleep(0.01)
+        assert order == ["a", "b", "c"]
+        assert budget.in_use == 60
+        gates["b"].set()
+        gates["c"].set()
+        await asyncio.gather(a, b, c)
+
+    asyncio.run(run())
+    stats = budget.stats()
+    assert stats["in_use_bytes"] == 0
+    assert stats["peak_bytes"] == 80
+    assert stats["granted"] == 3
+    assert stats["waited"] == 2
+
+
+def test_oversized_request_runs_alone():
+    budget = ByteBudget(100)
+
+    async def run():
+        order = []
+        gate = asyncio.Event()
+        big = asyncio.create_task(hold(budget, 500, gate, order, "big"))
+        await asyncio.sleep(0)
+        small = asyncio.create_task(hold(budget, 1, asyncio.Event(), order, "small"))
+        await asyncio.sleep(0)
+        assert order == ["big"]
+        gate.set()
+        await big
+        await asyncio.sleep(0)
+        assert order == ["big", "small"]
+        small.cancel()
+        await asyncio.gather(small, return_exceptions=True)
+
+    asyncio.run(run())
+    assert budget.peak == 500
+    assert budget.in_use == 0
+
+
+def test_additional_reserve_overcommits_instead_of_waiting():
+    budget = ByteBudget(100)
+
+    async def run():
+        async with budget.hold() as lease:
+            await lease.reserve(90)
+            await asyncio.wait_for(lease.reserve(50), timeout=1)
+            assert lease.held == 140
+            assert budget.in_use == 140
+
+    asyncio.run(run())
+    assert budget.in_use == 0
+    assert budget.overcommitted == 1
+
+
+def test_cancelled_waiter_wakes_next():
+    budget = ByteBudget(100)
+
+    async def run():
+        order = []
+        gate = asyncio.Event()
+        first = asyncio.create_task(hold(budget, 60, gate, order, "first"))
+        await asyncio.sleep(0)
+        blocked = asyncio.create_task(hold(budget, 100, gate, order, "blocked"))
+        small = asyncio.create_task(hold(budget, 30, gate, order, "small"))
+        await asyncio.sleep(0)
+        assert order == ["first"]
+
+        # 队首的等待者取消后，后面额度足够的请求立即放行
+        blocked.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await blocked
+        await asyncio.sleep(0)
+        assert order == ["first", "small"]
+        gate.set()
+        await asyncio.gather(first, small)
+
+    asyncio.run(run())
+    assert budget.in_use == 0
+    assert budget.stats()["waiting"] == 0
+
+
+def test_rejects_invalid_limit():
+    with pytest.raises(ValueError):
+        ByteBudget(0)
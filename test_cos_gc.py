@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+COS对象清理测试：分页列举、按引用关系和TTL清理、批量删除和dry_run
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from cos_gc import MAX_DELETE_BATCH, collect_garbage, parse_last_modified
+
+
+def iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class FakeCosClient:
+    """按Key排序分页返回对象的COS客户端"""
+
+    def __init__(self, objects, failing=()):
+        self.objects = dict(objects)
+        self.failing = set(failing)
+        self.delete_batches = []
+
+    def list_objects(self, Bucket, Prefix, Marker, MaxKeys):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > Marker)
+        page = keys[:MaxKeys]
+        return {
+            "Contents": [
+                {"Key": key, "Size": "10", "LastModified": iso(self.objects[key]), "ETag": '"etag"'}
+                for key in page
+            ],
+            "IsTruncated": "true" if len(keys) > MaxKeys else "false"
+        }
+
+    def delete_objects(self, Bucket, Delete):
+        keys = [item["Key"] for item in Delete["Object"]]
+        self.delete_batches.append(keys)
+        errors = []
+        for key in keys:
+            if key in self.failing:
+                errors.append({"Key": key, "Message": "AccessDenied"})
+            else:
+                self.objects.pop(key, None)
+        return {"Error": errors} if errors else {}
+
+
+def test_parse_last_modified():
+    expected = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc).timestamp()
+    assert parse_last_modified("2024-01-02T03:04:05.000Z") == expected
+    # 毫秒位数不是3或6位时至少精确到秒
+    assert int(parse_last_modified("2024-01-02T03:04:05.1Z")) == expected
+
+
+def test_dry_run_lists_unreferenced_candidates():
+    old = time.time() - 7200
+    client = FakeCosClient({
+        "jimeng/kept.png": old,
+        "jimeng/orphan.png": old,
+        "jimeng/new.png": time.time(),
+        "other/orphan.png": old
+    })
+
+    result = asyncio.run(collect_garbage(
+        client, "bucket", referenced_keys={"jimeng/kept.png"}, grace_seconds=3600
+    ))
+    assert result["dry_run"] is True
+    assert result["scanned"] == 3
+    # 刚上传的对象在保留期内
+    assert result["candidates"] == ["jimeng/orphan.png"]
+    assert result["candidates_truncated"] is False
+    assert result["reclaimed_bytes"] == 10
+    assert client.delete_batches == []
+
+
+def test_dry_run_candidate_list_is_capped():
+    old = time.time() - 7200
+    client = FakeCosClient({f"jimeng/{i:03d}.png": old for i in range(30)})
+
+    result = asyncio.run(collect_garbage(
+        client, "bucket", referenced_keys=set(), max_candidates=10
+    ))
+    assert result["matched"] == 30
+    assert len(result["candidates"]) == 10
+    assert result["candidates_truncated"] is True
+
+
+def test_unreferenced_objects_are_deleted_in_batches():
+    old = time.time() - 7200
+    objects = {f"jimeng/{i:05d}.png": old for i in range(2500)}
+    referenced = {f"jimeng/{i:05d}.png" for i in range(0, 2500, 5)}
+    client = FakeCosClient(objects, failing={"jimeng/00001.png"})
+    forgotten = []
+
+    result = asyncio.run(collect_garbage(
+        client, "bucket", referenced_keys=referenced, dry_run=False, concurrency=2,
+        on_deleted=forgotten.extend
+    ))
+    assert result["scanned"] == 2500
+    assert result["matched"] == 2000
+    assert result["deleted"] == 1999
+    assert result["errors"] == [{"key": "jimeng/00001.png", "message": "AccessDenied"}]
+    assert all(len(batch) <= MAX_DELETE_BATCH for batch in client.delete_batches)
+
+    # 被引用的对象和删除失败的对象都保留，失败的Key不从索引中移除
+    assert set(client.objects) == referenced | {"jimeng/00001.png"}
+    assert len(forgotten) == 1999
+    assert "jimeng/00001.png" not in forgotten
+
+
+def test_ttl_cleanup_ignores_references():
+    now = time.time()
+    client = FakeCosClient({
+        "jimeng/expired.png": now - 3 * 86400,
+        "jimeng/fresh.png": now - 3600
+    })
+
+    result = asyncio.run(collect_garbage(client, "bucket", ttl_seconds=86400, dry_run=False))
+    assert result["deleted"] == 1
+    assert set(client.objects) == {"jimeng/fresh.png"}
+
+
+def test_nothing_matches_without_criteria():
+    client = FakeCosClient({"jimeng/a.png": time.time() - 7200})
+    result = asyncio.run(collect_garbage(client, "bucket", dry_run=False))
+    assert result["matched"] == 0
+    assert client.delete_batches == []
+
+
+def test_server_refuses_unreferenced_cleanup_with_incomplete_history(tmp_path, monkeypatch):
+    import jimeng_image_server as server
+    from prompt_index import PromptIndex
+
+    index = PromptIndex(storage_path=str(tmp_path / "prompts.jsonl"), max_entries=1)
+    index.load()
+    monkeypatch.setattr(server, "PROMPT_INDEX_PATH", index.storage_path)
+    monkeypatch.setattr(server, "IMAGE_HASH_INDEX_PATH", str(tmp_path / "hashes.jsonl"))
+    monkeypatch.setattr(server, "prompt_index", index)
+    monkeypatch.setattr(server, "COS_GC_ASSET_MAPS", [])
+    assert server.unreferenced_gc_blocker() is None
+
+    for prompt in ("第一张", "第二张"):
+        index.add(prompt, "jimeng-3.1", 512, 512, {"images": []})
+    assert "older_than_days" in server.unreferenced_gc_blocker()
+
+
+def test_server_cleanup_requires_admin(monkeypatch):
+    import json
+    import jimeng_image_server as server
+
+    monkeypatch.setattr(server, "COS_GC_ADMIN", False)
+    result = json.loads(asyncio.run(server.cleanup_cos_objects(older_than_days=30)))
+    assert "COS_GC_ADMIN" in result["help"]
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+持久化生成任务测试：可重试的上游错误不会把任务标记为失败
+"""
+
+import asyncio
+
+import pytest
+
+import jimeng_image_server as server
+from job_store import STATUS_DONE, STATUS_FAILED, JobStore
+
+
+@pytest.fixture
+def durable(tmp_path, monkeypatch):
+    store = JobStore(str(tmp_path / "jobs.db"), lease_seconds=60, max_attempts=2)
+    monkeypatch.setattr(server, "job_store", store)
+    monkeypatch.setattr(server, "negative_cache", None)
+    yield store
+    store.close()
+
+
+def fake_upstream(monkeypatch, responses):
+    calls = []
+
+    async def make_jimeng_request(url, data, session_id):
+        calls.append(data["prompt"])
+        return responses[min(len(calls), len(responses)) - 1]
+
+    monkeypatch.setattr(server, "make_jimeng_request", make_jimeng_request)
+    return calls
+
+
+async def submit(store, job_id):
+    await store.create(job_id, "generate", {"request": server.generation_request(
+        "猫", "jimeng-3.1", "", 512, 512, 0.5
+    )})
+    return await server.run_durable_job(job_id)
+
+
+def test_transient_error_leaves_job_pending_for_retry(durable, monkeypatch):
+    calls = fake_upstream(monkeypatch, [
+        {"error": "请求发生错误: ConnectError", "retryable": True},
+        {"data": [{"url": "https://upstream.example.com/cat.png"}]}
+    ])
+    monkeypatch.setattr(server, "TENCENT_CLOUD_SECRET_ID", None)
+    monkeypatch.setattr(server, "image_cache", None)
+
+    async def run():
+        first = await submit(durable, "j1")
+        job = await durable.get("j1")
+        assert job["status"] not in (STATUS_DONE, STATUS_FAILED)
+        assert job["attempts"] == 1
+        assert job["lease_owner"] is None
+        assert [j["id"] for j in await durable.resumable()] == ["j1"]
+        assert server.job_status_view(job)["last_error"] == "请求发生错误: ConnectError"
+
+        # 恢复流程重试成功
+        second = await server.run_durable_job("j1")
+        return first, second, await durable.get("j1")
+
+    first, second, job = asyncio.run(run())
+    assert first["status"] == "pending"
+    assert "error" not in first
+    assert first["last_error"] == "请求发生错误: ConnectError"
+    assert second["images"][0]["url"] == "https://upstream.example.com/cat.png"
+    assert job["status"] == STATUS_DONE
+    assert len(calls) == 2
+
+
+def test_transient_errors_fail_after_max_attempts(durable, monkeypatch):
+    calls = fake_upstream(monkeypatch, [{"error": "请求超时", "retryable": True}])
+
+    async def run():
+        await submit(durable, "j1")
+        last = await server.run_durable_job("j1")
+        return last, await durable.get("j1")
+
+    last, job = asyncio.run(run())
+    assert len(calls) == 2
+    assert job["status"] == STATUS_FAILED
+    assert "请求超时" in job["error"]
+    assert "error" in last
+
+
+def test_deterministic_error_fails_immediately(durable, monkeypatch):
+    fake_upstream(monkeypatch, [{"error": "API请求失败: 400 - 参数错误", "retryable": False}])
+
+    async def run():
+        result = await submit(durable, "j1")
+        return result, await durable.get("j1")
+
+    result, job = asyncio.run(run())
+    assert result["error"].startswith("API请求失败: 400")
+    assert job["status"] == STATUS_FAILED
+    assert job["attempts"] == 1
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+图片去重测试：BK树范围查询、索引的标记删除和持久化加载
+"""
+
+import io
+import random
+
+import pytest
+
+from image_dedup import (BKTree, ImageDedupIndex, compute_dhash, compute_fingerprint,
+                         hamming_distance)
+
+
+def test_bktree_search_matches_brute_force():
+    rng = random.Random(7)
+    hashes = [rng.getrandbits(64) for _ in range(300)]
+    tree = BKTree()
+    for i, value in enumerate(hashes):
+        tree.add(value, i)
+    assert len(tree) == len(hashes)
+
+    for query in hashes[:20] + [rng.getrandbits(64) for _ in range(20)]:
+        for max_distance in (0, 4, 24):
+            expected = sorted(
+                (hamming_distance(query, value), i) for i, value in enumerate(hashes)
+                if hamming_distance(query, value) <= max_distance
+            )
+            found = tree.search(query, max_distance)
+            assert sorted(found) == expected
+            assert [distance for distance, _ in found] == sorted(distance for distance, _ in found)
+
+
+def test_bktree_keeps_duplicate_hashes():
+    tree = BKTree()
+    tree.add(0b1010, "a")
+    tree.add(0b1010, "b")
+    assert sorted(value for _, value in tree.search(0b1010, 0)) == ["a", "b"]
+    assert sorted(value for _, value in tree.items()) == ["a", "b"]
+
+
+def test_find_duplicate_skips_removed_keys():
+    index = ImageDedupIndex(max_distance=2)
+    index.add(0b1111, "https://x/jimeng/a.png", "jimeng/a.png", 64, 64)
+    index.add(0b1110, "https://x/jimeng/b.png", "jimeng/b.png", 64, 64)
+
+    assert index.find_duplicate(0b1111, 64, 64)["key"] == "jimeng/a.png"
+    assert index.find_duplicate(0b0000, 64, 64) is None
+
+    assert index.remove_keys(["jimeng/a.png"]) == 1
+    duplicate = index.find_duplicate(0b1111, 64, 64)
+    assert duplicate == {"url": "https://x/jimeng/b.png", "key": "jimeng/b.png", "distance": 1}
+    assert index.keys() == {"jimeng/b.png"}
+
+
+def test_duplicate_requires_same_dimensions():
+    index = ImageDedupIndex()
+    index.add(0b1111, "https://x/jimeng/small.png", "jimeng/small.png", 512, 512)
+    index.add(0b1111, "https://x/jimeng/legacy.png", "jimeng/legacy.png")
+
+    # 同一画面的不同尺寸哈希相同，不能互相复用；未记录尺寸的旧记录不参与复用
+    assert index.find_duplicate(0b1111, 1024, 1024) is None
+    assert index.find_duplicate(0b1111, 512, 512)["key"] == "jimeng/small.png"
+
+
+def test_persistence_roundtrip(tmp_path):
+    path = str(tmp_path / "hashes.jsonl")
+    index = ImageDedupIndex(storage_path=path)
+    assert not index.loaded
+    assert index.load() == 0
+    assert index.loaded
+    index.add(0xABCD, "https://x/jimeng/a.png", "jimeng/a.png", 800, 600)
+    index.add(0x1234, "https://x/jimeng/b.png", "jimeng/b.png", 800, 600)
+    index.remove_keys(["jimeng/b.png"])
+
+    reloaded = ImageDedupIndex(storage_path=path)
+    assert reloaded.load() == 1
+    assert reloaded.keys() == {"jimeng/a.png"}
+    assert reloaded.find_duplicate(0xABCD, 800, 600)["url"] == "https://x/jimeng/a.png"
+    assert reloaded.find_duplicate(0xABCD, 600, 800) is None
+
+    # 其他算法的记录不参与匹配
+    other = ImageDedupIndex(algorithm="phash", storage_path=path)
+    assert other.load() == 0
+    assert other.keys() == set()
+
+
+def test_dhash_tolerates_recompression():
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.new("RGB", (64, 64))
+    for x in range(64):
+        for y in range(64):
+            image.putpixel((x, y), (x * 4, y * 4, (x + y) * 2))
+
+    def encode(fmt, **kwargs):
+        buffer = io.BytesIO()
+        image.save(buffer, fmt, **kwargs)
+        return buffer.getvalue()
+
+    png = compute_dhash(encode("PNG"))
+    jpeg = compute_dhash(encode("JPEG", quality=60))
+    assert hamming_distance(png, jpeg) <= 4
+
+    # 放大后哈希几乎不变，需要靠尺寸区分
+    large = image.resize((128, 128))
+    buffer = io.BytesIO()
+    large.save(buffer, "PNG")
+    large_hash, width, height = compute_fingerprint(buffer.getvalue())
+    assert (width, height) == (128, 128)
+    assert hamming_distance(png, large_hash) <= 4
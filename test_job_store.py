@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+持久化任务表测试：租约互斥、过期接手、续期和恢复
+"""
+
+import asyncio
+
+import pytest
+
+from job_store import STATUS_DONE, STATUS_FAILED, STATUS_GENERATED, JobStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """共享同一个数据库的两个实例，模拟两个进程"""
+    path = str(tmp_path / "jobs.db")
+    created = []
+
+    def make(**kwargs):
+        store = JobStore(path, **kwargs)
+        created.append(store)
+        return store
+
+    yield make
+    for store in created:
+        store.close()
+
+
+def test_lease_is_exclusive(stores):
+    a, b = stores(), stores()
+
+    async def run():
+        assert await a.create("j1", "generate", {"prompt": "猫"})
+        assert not await b.create("j1", "generate", {"prompt": "狗"})
+        assert (await b.get("j1"))["params"] == {"prompt": "猫"}
+
+        assert await a.acquire("j1")
+        assert not await b.acquire("j1")
+        # 同一进程中正在执行的任务也不能重复获取
+        assert not await a.acquire("j1")
+
+        # 其他实例不能释放不属于自己的租约
+        await b.release("j1")
+        assert not await b.acquire("j1")
+        await a.release("j1")
+        assert await b.acquire("j1")
+        return await b.get("j1")
+
+    job = asyncio.run(run())
+    assert job["lease_owner"] == b.owner
+    assert job["attempts"] == 2
+
+
+def test_expired_lease_can_be_taken_over(stores):
+    a, b = stores(lease_seconds=0.05), stores(lease_seconds=0.05)
+
+    async def run():
+        await a.create("j1", "generate", {})
+        assert await a.acquire("j1")
+        assert [job["id"] for job in await b.resumable()] == []
+        await asyncio.sleep(0.1)
+        assert [job["id"] for job in await b.resumable()] == ["j1"]
+        assert await b.acquire("j1")
+
+    asyncio.run(run())
+
+
+def test_lease_context_renews_until_exit(stores):
+    a, b = stores(lease_seconds=0.15), stores(lease_seconds=0.15)
+
+    async def run():
+        await a.create("j1", "generate", {})
+        async with a.lease("j1") as acquired:
+            assert acquired
+            # 超过租约有效期，续期后仍然有效
+            await asyncio.sleep(0.4)
+            assert not await b.acquire("j1")
+            async with b.lease("j1") as other:
+                assert not other
+        assert await b.acquire("j1")
+
+    asyncio.run(run())
+
+
+def test_finished_jobs_are_not_leased(stores):
+    store = stores()
+
+    async def run():
+        await store.create("done", "generate", {})
+        await store.mark_generated("done", {"data": [{"url": "u"}]}, "jimeng/done.png")
+        job = await store.get("done")
+        assert job["status"] == STATUS_GENERATED
+        assert job["upload_key"] == "jimeng/done.png"
+        await store.complete("done", {"images": []})
+
+        await store.create("failed", "generate", {})
+        await store.fail("failed", "上游错误")
+
+        assert not await store.acquire("done")
+        assert not await store.acquire("failed")
+        assert await store.resumable() == []
+        assert [job["id"] for job in await store.retained()] == ["done"]
+        return await store.get("done"), await store.stats()
+
+    job, stats = asyncio.run(run())
+    assert job["status"] == STATUS_DONE
+    assert job["upstream"] is None
+    assert job["upload_key"] == "jimeng/done.png"
+    assert stats == {STATUS_DONE: 1, STATUS_FAILED: 1}
+
+
+def test_jobs_fail_after_max_attempts(stores):
+    store = stores(lease_seconds=0.01, max_attempts=2)
+
+    async def run():
+        await store.create("j1", "generate", {})
+        for _ in range(2):
+            assert await store.acquire("j1")
+            await asyncio.sleep(0.02)
+        assert await store.resumable() == []
+        return await store.get("j1")
+
+    job = asyncio.run(run())
+    assert job["status"] == STATUS_FAILED
+    assert job["error"] == "超过最大重试次数"
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+负缓存测试：确定性错误的判断、过期和LRU淘汰
+"""
+
+import time
+
+import pytest
+
+from negative_cache import NegativeCache, is_deterministic_error, request_key
+
+
+@pytest.mark.parametrize("status_code, body, expected", [
+    (400, "参数错误", True),
+    (422, "", True),
+    (500, '{"code": -2006, "message": "内容由于合规问题已被阻止生成"}', True),
+    (503, '{"error": {"code": "content_policy_violation", "message": "rejected"}}', True),
+    # 错误文本中出现审核相关的词不代表被审核拒绝
+    (500, '{"code": -2001, "message": "敏感词服务超时，请稍后重试"}', False),
+    (500, "content policy service unavailable", False),
+    (429, "rate limited", False),
+    (None, '{"code": -2006}', False),
+])
+def test_is_deterministic_error(status_code, body, expected):
+    assert is_deterministic_error(status_code, body) is expected
+
+
+def test_request_key_is_canonical():
+    assert request_key(prompt="猫", width=1024) == request_key(width=1024, prompt="猫")
+    assert request_key(prompt="猫", width=1024) != request_key(prompt="猫", width=512)
+    # 提示词规范化后相同的请求共用同一个键
+    assert request_key(prompt="Red Car, 夕阳", negative_prompt="模糊") == \
+        request_key(prompt="夕阳  red car", negative_prompt="模糊。")
+    assert request_key(prompt="red car") != request_key(prompt="blue car")
+
+
+def test_only_non_retryable_errors_are_recorded():
+    cache = NegativeCache(ttl=60)
+    cache.record("ok", {"images": []})
+    cache.record("transient", {"error": "超时", "retryable": True})
+    cache.record("unknown", {"error": "未知"})
+    cache.record("bad", {"error": "参数错误", "retryable": False})
+
+    assert cache.get("ok") is None
+    assert cache.get("transient") is None
+    assert cache.get("unknown") is None
+    cached = cache.get("bad")
+    assert cached["error"] == "参数错误"
+    assert cached["negative_cached"] is True
+    assert 0 < cached["cache_expires_in"] <= 60
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["stored"] == 1
+
+
+def test_entries_expire():
+    cache = NegativeCache(ttl=0.05)
+    cache.put("k", {"error": "参数错误"})
+    assert cache.get("k") is not None
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = NegativeCache(ttl=60, max_entries=2)
+    cache.put("a", {"error": "a"})
+    cache.put("b", {"error": "b"})
+    assert cache.get("a") is not None
+    cache.put("c", {"error": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_returned_error_is_a_copy():
+    cache = NegativeCache(ttl=60)
+    cache.put("k", {"error": "参数错误"})
+    cache.get("k")["error"] = "已修改"
+    assert cache.get("k")["error"] == "参数错误"
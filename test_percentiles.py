@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+百分位数测试
+"""
+
+from percentiles import percentile
+
+
+def test_percentile_uses_nearest_rank():
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 0) == 1
+    assert percentile(values, 50) == 3
+    assert percentile(values, 95) == 5
+    assert percentile(iter(values), 100) == 5
+    assert percentile([], 95) == 0.0
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+占位图池测试：后台补充只保存可长期复用的结果
+"""
+
+import asyncio
+
+from placeholder_pool import PlaceholderPool
+
+SPEC = {"category": "thumbnail", "prompt": "缩略图", "width": 512, "height": 512, "model": "jimeng-3.1"}
+
+
+def test_refill_keeps_only_accepted_results():
+    results = [
+        {"images": [{"url": "https://upstream/expiring.png"}]},
+        {"error": "上游错误"},
+        {"images": [{"url": "https://upstream/a.png", "cos_url": "https://x/jimeng/a.png"}]},
+    ]
+
+    async def generate(prompt, model, width, height):
+        return results.pop(0)
+
+    pool = PlaceholderPool(generate, [SPEC], target_size=3,
+                           accept=lambda result: all(i.get("cos_url") for i in result["images"]))
+
+    async def run():
+        pool.start()
+        for _ in range(50):
+            if not results:
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+
+    asyncio.run(run())
+    assert pool.results() == [{"images": [{"url": "https://upstream/a.png",
+                                           "cos_url": "https://x/jimeng/a.png"}]}]
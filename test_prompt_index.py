@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+提示词索引测试：LSH近似匹配、生成参数范围、LRU淘汰和持久化加载
+"""
+
+from prompt_index import PromptIndex, jaccard_similarity, prompt_shingles
+
+RESULT = {"images": [{"cos_url": "https://bucket.cos.ap-guangzhou.myqcloud.com/jimeng/cat.png"}]}
+
+
+def add(index, prompt, result=RESULT, **kwargs):
+    params = dict(model="jimeng-3.1", width=1024, height=1024, sample_strength=0.5)
+    params.update(kwargs)
+    index.add(prompt, params.pop("model"), params.pop("width"), params.pop("height"), result, **params)
+
+
+def lookup(index, prompt, threshold=0.8, **kwargs):
+    params = dict(model="jimeng-3.1", width=1024, height=1024, sample_strength=0.5)
+    params.update(kwargs)
+    return index.lookup(prompt, params.pop("model"), params.pop("width"), params.pop("height"),
+                        threshold, **params)
+
+
+def test_exact_and_similar_prompts_match():
+    index = PromptIndex()
+    add(index, "一只在草地上奔跑的橘猫，阳光明媚，高清摄影")
+
+    exact = lookup(index, "一只在草地上奔跑的橘猫，阳光明媚，高清摄影")
+    assert exact["similarity"] == 1.0
+    assert exact["result"] == RESULT
+
+    # 标点和空白差异规范化后视为相同提示词
+    assert lookup(index, "一只在草地上奔跑的橘猫 阳光明媚 高清摄影")["similarity"] == 1.0
+
+    similar = lookup(index, "一只在草地上奔跑的橘猫，阳光明媚，高清摄影作品", threshold=0.7)
+    assert similar is not None
+    assert 0.7 <= similar["similarity"] < 1.0
+
+    assert lookup(index, "夜晚城市的霓虹灯街道，赛博朋克风格") is None
+
+
+def test_similarity_matches_jaccard():
+    a = prompt_shingles("a red car on the road")
+    b = prompt_shingles("a red car on the street")
+    assert 0 < jaccard_similarity(a, b) < 1
+    assert jaccard_similarity(a, a) == 1.0
+    assert jaccard_similarity(frozenset(), frozenset()) == 1.0
+
+
+def test_generation_parameters_limit_matches():
+    index = PromptIndex()
+    add(index, "雪山下的湖泊", negative_prompt="模糊")
+
+    assert lookup(index, "雪山下的湖泊", negative_prompt="模糊") is not None
+    assert lookup(index, "雪山下的湖泊", negative_prompt="模糊", model="jimeng-2.1") is None
+    assert lookup(index, "雪山下的湖泊", negative_prompt="模糊", width=512) is None
+    assert lookup(index, "雪山下的湖泊", negative_prompt="") is None
+    assert lookup(index, "雪山下的湖泊", negative_prompt="模糊", sample_strength=0.8) is None
+
+
+def test_accept_filters_candidates():
+    index = PromptIndex()
+    add(index, "海边的灯塔", result={"images": [{"url": "https://upstream/expiring.png"}]})
+    assert lookup(index, "海边的灯塔", accept=lambda result: False) is None
+    assert lookup(index, "海边的灯塔", accept=lambda result: True) is not None
+
+
+def test_lru_eviction_keeps_recently_used():
+    index = PromptIndex(max_entries=2)
+    add(index, "第一张图片的提示词")
+    add(index, "第二张图片的提示词")
+    # 命中后移到最近使用的位置，下次淘汰第二条
+    assert lookup(index, "第一张图片的提示词") is not None
+    add(index, "第三张图片的提示词")
+
+    assert len(index) == 2
+    assert index.evictions == 1
+    assert lookup(index, "第一张图片的提示词") is not None
+    assert lookup(index, "第二张图片的提示词") is None
+
+
+def test_expired_entries_are_ignored():
+    index = PromptIndex(ttl=60)
+    add(index, "过期的记录")
+    for entry in index._entries.values():
+        entry["created_at"] -= 120
+    assert lookup(index, "过期的记录") is None
+    assert index.results() == []
+
+
+def test_persistence_roundtrip_and_remove(tmp_path):
+    path = str(tmp_path / "prompts.jsonl")
+    index = PromptIndex(storage_path=path)
+    assert not index.loaded
+    index.load()
+    add(index, "森林里的小木屋")
+    add(index, "沙漠中的绿洲", result={"images": [{"cos_url": "https://x/jimeng/oasis.png"}]})
+
+    reloaded = PromptIndex(storage_path=path)
+    assert reloaded.load() == 2
+    assert reloaded.loaded
+    assert lookup(reloaded, "森林里的小木屋")["result"] == RESULT
+
+    removed = reloaded.remove_where(lambda result: "oasis" in result["images"][0]["cos_url"])
+    assert removed == 1
+    again = PromptIndex(storage_path=path)
+    assert again.load() == 1
+    assert lookup(again, "沙漠中的绿洲") is None
+
+
+def test_dropped_history_survives_compaction(tmp_path):
+    path = str(tmp_path / "prompts.jsonl")
+    index = PromptIndex(storage_path=path, max_entries=2)
+    index.load()
+    add(index, "第一张")
+    add(index, "第二张")
+    assert index.history_complete
+    add(index, "第三张")
+    assert not index.history_complete
+
+    # 文件记录数超过上限两倍时重写，去掉被淘汰的记录后重启仍然知道历史记录不完整
+    add(index, "第四张")
+    add(index, "第五张")
+    with open(path, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 3
+    assert '"meta"' in lines[0]
+
+    reloaded = PromptIndex(storage_path=path, max_entries=2)
+    reloaded.load()
+    assert len(reloaded) == 2
+    assert reloaded.evictions == 3
+    assert not reloaded.history_complete
+
+
+def test_replaced_result_marks_history_incomplete(tmp_path):
+    path = str(tmp_path / "prompts.jsonl")
+    index = PromptIndex(storage_path=path)
+    index.load()
+    add(index, "同一个提示词")
+    add(index, "同一个提示词", result={"images": [{"cos_url": "https://x/jimeng/second.png"}]})
+    assert index.replaced == 1
+    assert not index.history_complete
+
+    reloaded = PromptIndex(storage_path=path)
+    reloaded.load()
+    assert not reloaded.history_complete
+    assert not PromptIndex(ttl=60).history_complete
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+生成结果缓存测试：各后端的存取和锁、跨实例单飞
+"""
+
+import asyncio
+
+import pytest
+
+from result_cache import (
+    CACHE_BYPASS, CACHE_HIT, CACHE_JOINED, CACHE_MISS,
+    CacheBackend, DiskBackend, MemoryBackend, RedisBackend, ResultCache
+)
+
+
+def make_backend(kind, tmp_path):
+    if kind == "memory":
+        return MemoryBackend()
+    if kind == "disk":
+        return DiskBackend(str(tmp_path / "cache"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+BACKENDS = ["memory", "disk", "redis"]
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_backend_get_set_expire(kind, tmp_path):
+    backend = make_backend(kind, tmp_path)
+
+    async def run():
+        assert await backend.get("k") is None
+        await backend.set("k", "值", 10)
+        assert await backend.get("k") == "值"
+        await backend.set("short", "v", 0.05)
+        await asyncio.sleep(0.1)
+        assert await backend.get("short") is None
+        await backend.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_backend_lock(kind, tmp_path):
+    backend = make_backend(kind, tmp_path)
+
+    async def run():
+        token = await backend.acquire_lock("lock", 10)
+        assert token is not None
+        assert await backend.lock_held("lock")
+        assert await backend.acquire_lock("lock", 10) is None
+        # 令牌不匹配时不释放
+        await backend.release_lock("lock", "other")
+        assert await backend.lock_held("lock")
+        await backend.release_lock("lock", token)
+        assert not await backend.lock_held("lock")
+
+        # 过期的锁可以被重新获取
+        assert await backend.acquire_lock("expiring", 0.05) is not None
+        await asyncio.sleep(0.1)
+        assert await backend.acquire_lock("expiring", 10) is not None
+        await backend.close()
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+def test_single_flight_joins_concurrent_requests(kind, tmp_path):
+    backend = make_backend(kind, tmp_path)
+    # 两个实例共享后端，模拟多个节点
+    caches = [ResultCache(backend, ttl=10, lock_ttl=5, wait_timeout=5, poll_interval=0.02) for _ in range(2)]
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return {"images": [{"url": "u"}]}
+
+    async def run():
+        key = ResultCache.make_key(prompt="猫", width=1024)
+        results = await asyncio.gather(*[caches[i % 2].get_or_compute(key, compute) for i in range(4)])
+        statuses = sorted(status for _, status in results)
+        assert statuses == [CACHE_JOINED, CACHE_JOINED, CACHE_JOINED, CACHE_MISS]
+        assert all(result == {"images": [{"url": "u"}]} for result, _ in results)
+        assert len(calls) == 1
+
+        result, status = await caches[0].get_or_compute(key, compute)
+        assert status == CACHE_HIT
+        assert len(calls) == 1
+        await backend.close()
+
+    asyncio.run(run())
+
+
+def test_errors_are_not_cached_and_waiters_retry():
+    cache = ResultCache(MemoryBackend(), ttl=10, lock_ttl=5, wait_timeout=5, poll_interval=0.02)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"error": "上游失败"} if len(calls) == 1 else {"images": []}
+
+    async def run():
+        results = await asyncio.gather(cache.get_or_compute("k", compute), cache.get_or_compute("k", compute))
+        assert [result for result, _ in results] == [{"error": "上游失败"}, {"images": []}]
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_make_key_ignores_parameter_order():
+    assert ResultCache.make_key(a=1, b="x") == ResultCache.make_key(b="x", a=1)
+    assert ResultCache.make_key(a=1) != ResultCache.make_key(a=2)
+
+
+def test_wait_timeout_computes_once():
+    backend = MemoryBackend()
+    cache = ResultCache(backend, wait_timeout=0.05, poll_interval=0.01)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        raise RuntimeError("生成失败")
+
+    async def run():
+        # 模拟其他节点持有锁且迟迟不写入结果
+        assert await backend.acquire_lock("jimeng:lock:k", 10) is not None
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("k", failing)
+        assert len(calls) == 1
+        assert cache.wait_timeouts == 1
+        assert cache.errors == 0
+
+    asyncio.run(run())
+
+
+class BrokenBackend(MemoryBackend):
+    async def get(self, key):
+        raise ConnectionError("后端不可用")
+
+
+def test_backend_failure_bypasses_cache_once():
+    cache = ResultCache(BrokenBackend())
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"images": []}
+
+    async def run():
+        result, status = await cache.get_or_compute("k", compute)
+        assert status == CACHE_BYPASS
+        assert result == {"images": []}
+        assert len(calls) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+上游公平调度测试：优先级加权、租户间公平排队、防饥饿和取消
+"""
+
+import asyncio
+
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, FairScheduler
+
+
+async def dispatch_order(scheduler, requests):
+    """先占满名额，再按顺序提交请求，返回放行顺序"""
+    order = []
+    gate = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot(PRIORITY_INTERACTIVE, "holder"):
+            await gate.wait()
+
+    async def job(priority, tenant, label):
+        async with scheduler.slot(priority, tenant):
+            order.append(label)
+            await asyncio.sleep(0)
+
+    holders = [asyncio.create_task(hold()) for _ in range(scheduler.concurrency)]
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(job(*request)) for request in requests]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*holders, *tasks)
+    return order
+
+
+def test_interactive_gets_weighted_share():
+    scheduler = FairScheduler(concurrency=1)
+    requests = []
+    for i in range(8):
+        requests.append((PRIORITY_BULK, "t", f"bulk{i}"))
+        requests.append((PRIORITY_INTERACTIVE, "t", f"interactive{i}"))
+
+    order = asyncio.run(dispatch_order(scheduler, requests))
+    first = order[:9]
+    # 权重8:1，前9个名额中批量请求只占1个，但不会被完全饿死
+    assert sum(label.startswith("bulk") for label in first) == 1
+    assert order[-7:] == [f"bulk{i}" for i in range(1, 8)]
+
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["priorities"][PRIORITY_BULK]["dispatched"] == 8
+    assert stats["priorities"][PRIORITY_INTERACTIVE]["dispatched"] == 8 + 1
+
+
+def test_tenants_share_fairly():
+    scheduler = FairScheduler(concurrency=1)
+    requests = [(PRIORITY_BULK, "a", f"a{i}") for i in range(6)]
+    requests += [(PRIORITY_BULK, "b", f"b{i}") for i in range(2)]
+
+    order = asyncio.run(dispatch_order(scheduler, requests))
+    # 后到的租户b不必等租户a的请求全部完成
+    assert order[:4] == ["a0", "b0", "a1", "b1"]
+
+
+def test_starved_requests_are_boosted():
+    scheduler = FairScheduler(concurrency=1, starvation_timeout=0)
+    requests = [(PRIORITY_BULK, "t", "bulk0"), (PRIORITY_INTERACTIVE, "t", "interactive0")]
+    requests += [(PRIORITY_BULK, "t", "bulk1")]
+
+    order = asyncio.run(dispatch_order(scheduler, requests))
+    # 等待超时的请求按到达顺序放行
+    assert order == ["bulk0", "interactive0", "bulk1"]
+    # 包括先占满名额的请求
+    assert scheduler.stats()["starvation_boosts"] == 4
+
+
+def test_cancelled_waiter_does_not_leak_slot():
+    scheduler = FairScheduler(concurrency=1)
+
+    async def run():
+        gate = asyncio.Event()
+        done = []
+
+        async def hold():
+            async with scheduler.slot():
+                await gate.wait()
+
+        async def job(label):
+            async with scheduler.slot(PRIORITY_BULK):
+                done.append(label)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        cancelled = asyncio.create_task(job("cancelled"))
+        waiting = asyncio.create_task(job("waiting"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        gate.set()
+        await asyncio.gather(holder, waiting)
+        return done
+
+    assert asyncio.run(run()) == ["waiting"]
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["priorities"][PRIORITY_BULK]["queued"] == 0
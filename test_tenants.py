@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+多租户统计测试：只有实际发出的请求计入延迟和失败数
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from admission import AdmissionRejected
+from tenants import TenantRegistry, tenant_label
+
+
+def make_registry(**kwargs):
+    return TenantRegistry(client_factory=lambda limit: httpx.AsyncClient(), **kwargs)
+
+
+def test_dispatched_requests_are_counted_once():
+    registry = make_registry()
+
+    async def run():
+        async with registry.acquire("s1"):
+            registry.record_result("s1", True, 1.5)
+        async with registry.acquire("s1"):
+            registry.record_result("s1", False, 0.5)
+        stats = registry.stats("s1")[tenant_label("s1")]
+        await registry.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["completed"] == 1
+    assert stats["failed"] == 1
+    assert stats["throughput_per_minute"] == 2
+    assert stats["latency_p95"] == 1.5
+
+
+def test_admission_rejection_is_not_a_latency_sample():
+    registry = make_registry()
+
+    async def run():
+        with pytest.raises(AdmissionRejected):
+            async with registry.acquire("s1"):
+                # 获得租户配额后被全局准入拒绝，请求没有发出
+                raise AdmissionRejected("overloaded", 1)
+        stats = registry.stats("s1")[tenant_label("s1")]
+        await registry.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert stats["failed"] == 0
+    assert stats["throughput_per_minute"] == 0
+    assert stats["latency_p50"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_tenant_quota_rejects_after_queue_wait():
+    registry = make_registry(max_concurrency=1, queue_wait=0.05)
+
+    async def run():
+        async with registry.acquire("s1"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                async with registry.acquire("s1"):
+                    pass
+            # 其他租户不受影响
+            async with registry.acquire("s2"):
+                pass
+        stats = registry.stats("s1")[tenant_label("s1")]
+        await registry.close()
+        return rejected.value, stats
+
+    rejected, stats = asyncio.run(run())
+    assert rejected.reason == "tenant_quota"
+    assert stats["rejected"] == 1
+    assert stats["latency_p50"] == 0
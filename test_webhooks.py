@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+生成完成回调测试：签名校验、回调地址的SSRF防护
+"""
+
+import asyncio
+import http.server
+import threading
+import time
+
+import pytest
+
+import webhooks
+from webhooks import (
+    UnsafeCallbackAddress, WebhookDispatcher, is_public_address, sign_payload,
+    validate_callback_url, verify_signature
+)
+
+
+def test_signature_roundtrip():
+    body = '{"event":"generation.completed"}'.encode("utf-8")
+    timestamp = str(int(time.time()))
+    signature = sign_payload("secret", timestamp, body)
+    assert signature.startswith("sha256=")
+    assert verify_signature("secret", timestamp, body, signature)
+
+
+def test_signature_rejects_tampering_and_replay():
+    body = b'{"a":1}'
+    timestamp = str(int(time.time()))
+    signature = sign_payload("secret", timestamp, body)
+    assert not verify_signature("other", timestamp, body, signature)
+    assert not verify_signature("secret", timestamp, b'{"a":2}', signature)
+    assert not verify_signature("secret", "not-a-number", body, signature)
+
+    old = str(int(time.time()) - 3600)
+    assert not verify_signature("secret", old, body, sign_payload("secret", old, body))
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.0.0.5", "172.16.0.1", "192.168.1.1", "169.254.169.254",
+    "0.0.0.0", "224.0.0.1", "240.0.0.1", "::1", "fe80::1%eth0", "fc00::1", "::ffff:127.0.0.1"
+])
+def test_non_public_addresses(address):
+    assert not is_public_address(address)
+
+
+@pytest.mark.parametrize("address", ["93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946"])
+def test_public_addresses(address):
+    assert is_public_address(address)
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:8080/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "https://[::1]/hook",
+    "http://10.1.2.3/hook",
+])
+def test_validate_rejects_private_targets(url):
+    error = asyncio.run(validate_callback_url(url))
+    assert error and "非公网地址" in error
+
+
+def test_validate_rules():
+    assert asyncio.run(validate_callback_url("ftp://example.com/x"))
+    assert asyncio.run(validate_callback_url("http://93.184.216.34/hook")) is None
+    # 开发模式和允许列表不检查解析地址
+    assert asyncio.run(validate_callback_url("http://127.0.0.1/hook", allow_private=True)) is None
+    assert asyncio.run(validate_callback_url("http://127.0.0.1/hook", allowed_hosts=["127.0.0.1"])) is None
+    assert "允许列表" in asyncio.run(validate_callback_url("http://93.184.216.34/", allowed_hosts=["hooks.example.com"]))
+
+
+def test_delivery_pins_validated_address(monkeypatch):
+    dispatcher = WebhookDispatcher()
+
+    async def resolve(host, port):
+        assert (host, port) == ("hooks.example.com", 443)
+        return "93.184.216.34"
+
+    monkeypatch.setattr(webhooks, "resolve_public_address", resolve)
+    headers = {}
+    url, extensions = asyncio.run(dispatcher._pin_address("https://hooks.example.com/done?x=1", headers))
+    assert str(url) == "https://93.184.216.34/done?x=1"
+    assert headers["Host"] == "hooks.example.com"
+    assert extensions == {"sni_hostname": "hooks.example.com"}
+
+
+def test_delivery_rejects_rebinding(monkeypatch):
+    dispatcher = WebhookDispatcher(max_attempts=3)
+
+    async def resolve(host, port):
+        # 提交时是公网地址，投递时被重新绑定到内网
+        raise UnsafeCallbackAddress(f"callback_url 的主机解析到非公网地址: {host} -> 127.0.0.1")
+
+    monkeypatch.setattr(webhooks, "resolve_public_address", resolve)
+
+    async def run():
+        assert dispatcher.submit("http://hooks.example.com/done", webhooks.EVENT_COMPLETED, {})
+        await dispatcher.close(drain_timeout=2)
+
+    asyncio.run(run())
+    assert dispatcher.failed == 1
+    assert dispatcher.retries == 0
+    assert dispatcher.delivered == 0
+
+
+def test_close_waits_for_in_flight_delivery():
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append((self.headers[webhooks.SIGNATURE_HEADER], self.headers[webhooks.TIMESTAMP_HEADER], body))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    dispatcher = WebhookDispatcher(secret="secret", allow_private=True)
+
+    async def run():
+        url = f"http://127.0.0.1:{server.server_port}/done"
+        assert dispatcher.submit(url, webhooks.EVENT_COMPLETED, {"job_id": "j1"})
+        await dispatcher.close(drain_timeout=5)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert dispatcher.delivered == 1
+    signature, timestamp, body = received[0]
+    assert verify_signature("secret", timestamp, body, signature)
+
+
+def test_server_refuses_callback_without_secret(monkeypatch):
+    import json
+    import jimeng_image_server as server
+
+    monkeypatch.setattr(server, "JIMENG_SESSION_ID", "test-session")
+    monkeypatch.setattr(server, "WEBHOOK_SECRET", "")
+    result = json.loads(asyncio.run(server.generate_images("猫", callback_url="https://example.com/hook")))
+    assert "WEBHOOK_SECRET" in result["help"]
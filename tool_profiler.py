@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+按需性能剖析
+
+包装各MCP工具函数，开启剖析后对接下来的N次工具调用期间的事件循环线程进行剖析，
+结束后写入文件：cprofile 模式输出 pstats 文件和文本摘要，sample 模式定时采样事件
+循环线程的调用栈并输出 speedscope 格式；可同时用 tracemalloc 记录内存分配差异。
+无需重启服务器即可查看真实流量下CPU和内存的去向。
+"""
+
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PROFILE_MODES = ("cprofile", "sample")
+
+Frame = Tuple[str, str, int]
+
+
+class StackSampler:
+    """在后台线程中定时采样指定线程的调用栈"""
+
+    def __init__(self, thread_id: int, interval: float = 0.005, max_depth: int = 128):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[Frame] = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            del frame
+            if stack:
+                # 从最外层到最内层
+                self.stacks[tuple(reversed(stack))] += 1
+                self.samples += 1
+
+    def to_speedscope(self, name: str, duration: float) -> Dict[str, Any]:
+        """转换为 speedscope 的 sampled 格式，相同调用栈合并并以采样次数加权"""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        samples: List[List[int]] = []
+        weights: List[float] = []
+
+        for stack, count in self.stacks.most_common():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(frame_index[frame])
+            samples.append(indexes)
+            weights.append(round(count * self.interval, 6))
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(duration, 6),
+                "samples": samples,
+                "weights": weights
+            }],
+            "name": name,
+            "exporter": "jimeng-image-mcp"
+        }
+
+
+class _Session:
+    """一次剖析会话的状态"""
+
+    def __init__(self, calls: int, mode: str, memory: bool):
+        self.calls = calls
+        self.mode = mode
+        self.memory = memory
+        self.started = 0
+        self.finished = 0
+        self.began_at: Optional[float] = None
+        self.tools: Counter = Counter()
+        self.profiler: Optional[cProfile.Profile] = None
+        self.sampler: Optional[StackSampler] = None
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.started_tracemalloc = False
+
+
+class ToolProfiler:
+    """为MCP工具调用提供按需剖析"""
+
+    def __init__(self, output_dir: str = "profiles", sample_interval: float = 0.005):
+        """
+        Args:
+            output_dir: 剖析结果输出目录
+            sample_interval: sample 模式的采样间隔(秒)
+        """
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self._session: Optional[_Session] = None
+        self._lock = threading.Lock()
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def active(self) -> bool:
+        return self._session is not None
+
+    def arm(self, calls: int, mode: str = "cprofile", memory: bool = False) -> Dict[str, Any]:
+        """开启剖析，接下来的 calls 次工具调用完成后自动写入结果"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"不支持的剖析模式: {mode}，可选值: {', '.join(PROFILE_MODES)}")
+        if calls <= 0:
+            raise ValueError("calls 必须大于0")
+
+        with self._lock:
+            if self._session is not None:
+                raise RuntimeError("已有正在进行的剖析")
+            self._session = _Session(calls, mode, memory)
+        return self.status()
+
+    def wrap(self, func: Callable) -> Callable:
+        """包装异步工具函数，保留原函数签名供MCP生成参数说明"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            session = self._enter(func.__name__)
+            if session is None:
+                return await func(*args, **kwargs)
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self._exit(session)
+        return wrapper
+
+    def _enter(self, tool_name: str) -> Optional[_Session]:
+        session = self._session
+        if session is None or session.started >= session.calls:
+            return None
+
+        if session.began_at is None:
+            try:
+                self._begin(session)
+            except Exception as e:
+                # 例如已有其他剖析器在运行，放弃本次剖析而不影响工具调用
+                self._session = None
+                self.last_result = {"error": f"启动剖析失败: {str(e)}"}
+                print(self.last_result["error"], file=sys.stderr)
+                return None
+
+        session.started += 1
+        session.tools[tool_name] += 1
+        return session
+
+    def _begin(self, session: _Session) -> None:
+        """在事件循环线程中开始剖析（剖析的是该线程，包括期间并发执行的其他任务）"""
+        session.began_at = time.time()
+        if session.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                session.started_tracemalloc = True
+            session.snapshot = tracemalloc.take_snapshot()
+
+        if session.mode == "cprofile":
+            session.profiler = cProfile.Profile()
+            session.profiler.enable()
+        else:
+            session.sampler = StackSampler(threading.get_ident(), self.sample_interval)
+            session.sampler.start()
+
+    def _exit(self, session: _Session) -> None:
+        session.finished += 1
+        if session.finished >= session.calls and self._session is session:
+            self._session = None
+            try:
+                self.last_result = self._finish(session)
+                print(f"剖析完成: {self.last_result['files']}", file=sys.stderr)
+            except Exception as e:
+                self.last_result = {"error": f"写入剖析结果失败: {str(e)}"}
+                print(self.last_result["error"], file=sys.stderr)
+
+    def _finish(self, session: _Session) -> Dict[str, Any]:
+        """停止剖析并写入结果文件"""
+        duration = time.time() - session.began_at
+        if session.profiler is not None:
+            session.profiler.disable()
+        if session.sampler is not None:
+            session.sampler.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(
+            self.output_dir,
+            time.strftime("%Y%m%d-%H%M%S", time.localtime(session.began_at)) + f"-{os.getpid()}"
+        )
+        files = []
+
+        if session.profiler is not None:
+            session.profiler.dump_stats(prefix + ".pstats")
+            stream = io.StringIO()
+            pstats.Stats(session.profiler, stream=stream).sort_stats("cumulative").print_stats(50)
+            with open(prefix + ".txt", "w", encoding="utf-8") as f:
+                f.write(stream.getvalue())
+            files += [prefix + ".pstats", prefix + ".txt"]
+
+        if session.sampler is not None:
+            data = session.sampler.to_speedscope(os.path.basename(prefix), duration)
+            with open(prefix + ".speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            files.append(prefix + ".speedscope.json")
+
+        if session.snapshot is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if session.started_tracemalloc:
+                tracemalloc.stop()
+            with open(prefix + ".memory.txt", "w", encoding="utf-8") as f:
+                f.write("内存分配变化(按代码行，前50项):\n")
+                for stat in snapshot.compare_to(session.snapshot, "lineno")[:50]:
+                    f.write(f"{stat}\n")
+            snapshot.dump(prefix + ".tracemalloc")
+            files += [prefix + ".memory.txt", prefix + ".tracemalloc"]
+
+        return {
+            "mode": session.mode,
+            "calls": session.finished,
+            "tools": dict(session.tools),
+            "duration": round(duration, 3),
+            "samples": session.sampler.samples if session.sampler else None,
+            "files": files
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """当前剖析进度和上一次剖析结果"""
+        session = self._session
+        current = None
+        if session is not None:
+            current = {
+                "mode": session.mode,
+                "memory": session.memory,
+                "calls": session.calls,
+                "started": session.started,
+                "finished": session.finished
+            }
+        return {"active": current, "last_result": self.last_result}
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+连接预热与保活
+
+服务器启动时并发向所有已配置的端点（即梦API、图片CDN、腾讯云COS）发起轻量请求，
+提前完成DNS解析、TCP/TLS握手并把连接留在连接池中，COS同时通过 head_bucket 校验
+一次凭证；之后定期对各连接池发送保活请求，避免空闲连接被回收，使首个请求的延迟
+与稳定运行时一致。
+"""
+
+import asyncio
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+
+def http_ping(client: httpx.AsyncClient, url: str, connections: int = 1) -> Callable[[], Awaitable[None]]:
+    """
+    返回向 url 并发发送 connections 个HEAD请求的预热函数
+
+    任何HTTP响应（包括4xx/5xx）都说明连接已建立，只有网络错误视为失败
+    """
+    async def ping() -> None:
+        await asyncio.gather(*[client.head(url) for _ in range(max(1, connections))])
+    return ping
+
+
+class ConnectionWarmer:
+    """启动时预热各端点的连接，并定期保活"""
+
+    def __init__(self, keepalive_interval: float = 30.0, timeout: float = 5.0):
+        """
+        Args:
+            keepalive_interval: 保活请求间隔(秒)，应小于连接池的空闲连接过期时间，0表示不保活
+            timeout: 单个端点预热的超时时间(秒)
+        """
+        self.keepalive_interval = keepalive_interval
+        self.timeout = timeout
+        self._targets: Dict[str, Callable[[], Awaitable[None]]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, ping: Callable[[], Awaitable[None]]) -> None:
+        """注册一个端点，ping 在连接池上发起一次轻量请求，失败时抛出异常"""
+        self._targets[name] = ping
+
+    @property
+    def targets(self) -> List[str]:
+        return list(self._targets)
+
+    async def _ping(self, name: str, ping: Callable[[], Awaitable[None]]) -> Dict[str, Any]:
+        started_at = time.monotonic()
+        try:
+            await asyncio.wait_for(ping(), timeout=self.timeout)
+            result = {"ok": True}
+        except Exception as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}" if str(e) else type(e).__name__}
+        result["elapsed"] = round(time.monotonic() - started_at, 3)
+        result["checked_at"] = time.time()
+
+        previous = self._results.get(name)
+        result["pings"] = (previous["pings"] if previous else 0) + 1
+        if previous and previous["ok"] and not result["ok"]:
+            print(f"连接保活失败 {name}: {result['error']}", file=sys.stderr)
+        self._results[name] = result
+        return result
+
+    async def warm_all(self) -> Dict[str, Dict[str, Any]]:
+        """并发预热所有端点，返回各端点的结果"""
+        names = list(self._targets)
+        results = await asyncio.gather(*[self._ping(name, self._targets[name]) for name in names])
+        for name, result in zip(names, results):
+            if result["ok"]:
+                print(f"连接预热完成 {name}: {result['elapsed']:.3f}s", file=sys.stderr)
+            else:
+                print(f"连接预热失败 {name}: {result['error']}", file=sys.stderr)
+        return dict(zip(names, results))
+
+    def start(self) -> None:
+        """在当前事件循环中启动保活任务"""
+        if self.keepalive_interval > 0 and self._targets and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._keepalive())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            await asyncio.gather(*[self._ping(name, ping) for name, ping in self._targets.items()])
+
+    def stats(self) -> Dict[str, Any]:
+        """各端点最近一次预热/保活的结果"""
+        return {
+            "keepalive_running": self._task is not None and not self._task.done(),
+            "keepalive_interval": self.keepalive_interval,
+            "endpoints": {name: dict(result) for name, result in self._results.items()}
+        }
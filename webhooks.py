@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+生成完成回调(Webhook)
+
+调用方传入 callback_url 后，生成结果（包括COS上传）完成时服务器向该地址POST一份
+JSON通知，调用方无需轮询或一直占用MCP请求。通知进入有界的投递队列，由少量后台
+worker通过共享连接池发送；网络错误、429和5xx按指数退避重试，队列已满时丢弃并计数。
+配置密钥后请求头携带 HMAC-SHA256 签名，接收方据此校验来源和防重放。
+
+回调地址由调用方提供，为防止借回调访问内网(SSRF)，默认只允许解析到公网地址的主机：
+提交时校验一次，投递时重新解析并直接连接校验过的地址，避免DNS重绑定绕过校验。
+允许列表中的主机由运维人员配置，不做地址限制。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import random
+import socket
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+
+SIGNATURE_HEADER = "X-Jimeng-Signature"
+TIMESTAMP_HEADER = "X-Jimeng-Timestamp"
+EVENT_HEADER = "X-Jimeng-Event"
+DELIVERY_HEADER = "X-Jimeng-Delivery"
+
+EVENT_COMPLETED = "generation.completed"
+EVENT_FAILED = "generation.failed"
+
+
+def sign_payload(secret: str, timestamp: str, body: bytes) -> str:
+    """签名内容为 "{timestamp}.{body}"，返回 "sha256=<hex>" 格式的签名"""
+    digest = hmac.new(secret.encode("utf-8"), timestamp.encode("ascii") + b"." + body, hashlib.sha256)
+    return "sha256=" + digest.hexdigest()
+
+
+def verify_signature(secret: str, timestamp: str, body: bytes, signature: str,
+                     tolerance: float = 300.0) -> bool:
+    """接收方校验签名，时间戳与当前时间相差超过 tolerance 秒时视为重放"""
+    try:
+        if abs(time.time() - int(timestamp)) > tolerance:
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(sign_payload(secret, timestamp, body), signature)
+
+
+class UnsafeCallbackAddress(ValueError):
+    """回调主机解析到了内网、回环等非公网地址"""
+
+
+def is_public_address(address: str) -> bool:
+    """地址是否为公网单播地址（排除回环、私有、链路本地、保留和组播地址）"""
+    try:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+    except ValueError:
+        return False
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return not (ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved
+                or ip.is_multicast or ip.is_unspecified) and ip.is_global
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """
+    解析主机名，返回第一个地址
+
+    任一解析结果不是公网地址时抛出 UnsafeCallbackAddress，解析失败时抛出 OSError
+    """
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    addresses = [info[4][0] for info in infos]
+    if not addresses:
+        raise OSError(f"无法解析主机: {host}")
+    for address in addresses:
+        if not is_public_address(address):
+            raise UnsafeCallbackAddress(f"callback_url 的主机解析到非公网地址: {host} -> {address}")
+    return addresses[0]
+
+
+def _is_trusted_host(host: str, allowed_hosts: Optional[List[str]], allow_private: bool) -> bool:
+    return allow_private or bool(allowed_hosts and host in allowed_hosts)
+
+
+async def validate_callback_url(url: str, allowed_hosts: Optional[List[str]] = None,
+                                allow_private: bool = False) -> Optional[str]:
+    """
+    校验回调地址，合法时返回None，否则返回错误信息
+
+    Args:
+        allowed_hosts: 允许的主机，设置后只允许这些主机（不限制其解析地址）
+        allow_private: 允许解析到内网地址的主机（仅用于本地开发）
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return "callback_url 必须是 http(s) 地址"
+    host = parsed.hostname.lower()
+    if allowed_hosts and host not in allowed_hosts:
+        return f"callback_url 的主机不在允许列表中: {parsed.hostname}"
+    if _is_trusted_host(host, allowed_hosts, allow_private):
+        return None
+    try:
+        await resolve_public_address(host, parsed.port or (443 if parsed.scheme == "https" else 80))
+    except UnsafeCallbackAddress as e:
+        return str(e)
+    except (OSError, ValueError):
+        return f"无法解析 callback_url 的主机: {parsed.hostname}"
+    return None
+
+
+class _Delivery:
+    __slots__ = ("id", "url", "event", "body", "attempts")
+
+    def __init__(self, url: str, event: str, body: bytes):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.event = event
+        self.body = body
+        self.attempts = 0
+
+
+class WebhookDispatcher:
+    """有界队列 + 后台worker的回调投递器"""
+
+    def __init__(self, secret: str = "", max_queue: int = 1000, workers: int = 4,
+                 max_attempts: int = 5, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 timeout: float = 10.0, allowed_hosts: Optional[List[str]] = None,
+                 allow_private: bool = False):
+        """
+        Args:
+            secret: 签名密钥，为空时不签名
+            max_queue: 等待投递的通知上限（包括等待重试的），超过后新通知被丢弃
+            workers: 并发投递的worker数，同时也是连接池大小
+            max_attempts: 单个通知最多投递次数
+            backoff_base: 首次重试等待时间(秒)，之后按指数增长并加随机抖动
+            backoff_max: 重试等待时间上限(秒)
+            timeout: 单次投递请求超时时间(秒)
+            allowed_hosts: 允许列表中的主机投递时不检查解析地址
+            allow_private: 允许投递到内网地址（仅用于本地开发）
+        """
+        self.secret = secret
+        self.max_queue = max_queue
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.allowed_hosts = allowed_hosts
+        self.allow_private = allow_private
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._retry_tasks: Set[asyncio.Task] = set()
+        self._in_flight = 0
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+
+    @property
+    def pending(self) -> int:
+        queued = self._queue.qsize() if self._queue is not None else 0
+        return queued + self._in_flight + len(self._retry_tasks)
+
+    def _ensure_started(self) -> None:
+        """首次投递时在当前事件循环中创建连接池和worker，事件循环更换时重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker_tasks:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._retry_tasks = set()
+        self._in_flight = 0
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.workers, max_keepalive_connections=self.workers)
+        )
+        self._worker_tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, url: str, event: str, payload: Dict[str, Any]) -> bool:
+        """
+        加入投递队列（不等待投递完成），队列已满时丢弃并返回False
+
+        需在事件循环中调用
+        """
+        self._ensure_started()
+        if self.pending >= self.max_queue:
+            self.dropped += 1
+            print(f"回调队列已满，丢弃通知: {event}", file=sys.stderr)
+            return False
+
+        body = json.dumps(
+            {"event": event, "sent_at": int(time.time()), **payload}, ensure_ascii=False
+        ).encode("utf-8")
+        self._queue.put_nowait(_Delivery(url, event, body))
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            delivery = await self._queue.get()
+            # 正在投递的通知也计入 pending，退出时的排空会等待其完成
+            self._in_flight += 1
+            try:
+                await self._deliver(delivery)
+            except Exception as e:
+                print(f"回调投递异常 {delivery.id}: {str(e)}", file=sys.stderr)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, delivery: _Delivery) -> None:
+        delivery.attempts += 1
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            EVENT_HEADER: delivery.event,
+            DELIVERY_HEADER: delivery.id,
+            TIMESTAMP_HEADER: timestamp
+        }
+        if self.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(self.secret, timestamp, delivery.body)
+
+        retry_after = None
+        try:
+            url, extensions = await self._pin_address(delivery.url, headers)
+            response = await self._client.post(url, content=delivery.body, headers=headers,
+                                               extensions=extensions)
+            if response.status_code < 300:
+                self.delivered += 1
+                return
+            error = f"HTTP {response.status_code}"
+            # 其他4xx说明请求本身被拒绝，重试没有意义
+            retryable = response.status_code == 429 or response.status_code >= 500
+            if "Retry-After" in response.headers:
+                try:
+                    retry_after = float(response.headers["Retry-After"])
+                except ValueError:
+                    pass
+        except UnsafeCallbackAddress as e:
+            error = str(e)
+            retryable = False
+        except (httpx.HTTPError, OSError) as e:
+            error = f"{type(e).__name__}: {str(e)}"
+            retryable = True
+
+        if not retryable or delivery.attempts >= self.max_attempts:
+            self.failed += 1
+            print(f"回调投递失败 {delivery.id} ({delivery.attempts}次): {error}", file=sys.stderr)
+            return
+
+        # 等待重试期间不占用worker
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (delivery.attempts - 1))
+        delay = max(delay * random.uniform(0.5, 1.0), retry_after or 0.0)
+        self.retries += 1
+        task = asyncio.get_running_loop().create_task(self._retry_later(delivery, delay))
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _pin_address(self, url: str, headers: Dict[str, str]) -> Tuple[Any, Dict[str, Any]]:
+        """
+        投递前重新解析回调主机并校验地址，请求直接发往校验过的地址
+
+        Host 请求头和TLS的SNI/证书校验仍使用原主机名；受信任的主机按原地址投递
+        """
+        parsed = httpx.URL(url)
+        if _is_trusted_host(parsed.host, self.allowed_hosts, self.allow_private):
+            return parsed, {}
+        address = await resolve_public_address(parsed.host, parsed.port or (443 if parsed.scheme == "https" else 80))
+        headers["Host"] = parsed.netloc.decode("ascii")
+        extensions = {"sni_hostname": parsed.host} if parsed.scheme == "https" else {}
+        return parsed.copy_with(host=address), extensions
+
+    async def _retry_later(self, delivery: _Delivery, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(delivery)
+
+    async def close(self, drain_timeout: float = 10.0) -> None:
+        """在 drain_timeout 秒内尽量投递完队列中的通知，然后停止worker并关闭连接池"""
+        if not self._worker_tasks:
+            return
+        try:
+            await asyncio.wait_for(self._drain(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"回调队列未投递完，放弃 {self.pending} 个通知", file=sys.stderr)
+
+        tasks = self._worker_tasks + list(self._retry_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._retry_tasks = set()
+        await self._client.aclose()
+
+    async def _drain(self) -> None:
+        while self.pending:
+            await self._queue.join()
+            if self._retry_tasks:
+                await asyncio.wait(list(self._retry_tasks))
+
+    def stats(self) -> Dict[str, Any]:
+        """投递统计"""
+        return {
+            "pending": self.pending,
+            "max_queue": self.max_queue,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retries": self.retries
+        }